@@ -0,0 +1,189 @@
+import streamlit as st
+import os
+import uuid
+from http.client import HTTPException
+from services.api_client import APIClient, APIError
+from services.history import CHAT_CSS, ChatHistory, render_message
+from services.streams import visible_answer
+
+# Start the API with `python -m services.api` or API_PORT=8600 on app.py
+API_URL = os.environ.get("CHATBOT_API_URL", "http://127.0.0.1:8600")
+
+FALLBACK_ANSWER = "I'm sorry, I haven't been able to generate an answer yet. Is there anything else I can assist you with?"
+
+
+@st.cache_resource
+def get_client():
+    return APIClient(API_URL)
+
+
+class ChatClientApp:
+    """
+    Chat page that only talks to the HTTP API: documents, indexes and
+    models live in the API process, so this page holds no heavy state.
+    """
+
+    def __init__(self):
+        st.set_page_config(page_title="Interactive Chatbot", layout="centered")
+        st.title("Interactive Chatbot")
+        if "session_id" not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex[:12]
+        if "history" not in st.session_state:
+            st.session_state.history = ChatHistory()
+        if "ingest_job" not in st.session_state:
+            st.session_state.ingest_job = None
+        # Sessions opened with ?workspace=<name> share their documents
+        self.workspace = st.query_params.get("workspace", st.session_state.session_id)
+        self.client = get_client()
+        self.sidebar_options()
+
+    def sidebar_options(self):
+        with st.sidebar:
+            self.finish_ingest()
+            uploaded_files = st.file_uploader(
+                "Upload documents (PDF)", type=["pdf"], accept_multiple_files=True
+            )
+            rag_action = st.selectbox(
+                "Preprocessing:", ["BasePreprocessing", "PyMuPDFPreprocessing"]
+            )
+            st.session_state.hybrid = st.checkbox(
+                "Hybrid search (keywords + embeddings)", value=True
+            )
+            st.session_state.rerank = st.checkbox("Rerank results", value=False)
+            if st.button("Process document", type="primary"):
+                self.process(uploaded_files or [], rag_action)
+            self.show_ingest_progress()
+            try:
+                health = self.client.health()
+                st.caption(
+                    f"API: {health['pending']} calls in progress, "
+                    f"{health['connections']} connections"
+                )
+            except (APIError, OSError) as e:
+                st.error(f"The API at {API_URL} is not reachable: {e}")
+
+    def process(self, uploaded_files, rag_action):
+        names = {uploaded_file.name for uploaded_file in uploaded_files}
+        try:
+            # Files removed from the uploader are dropped from the index
+            for name in self.client.documents(self.workspace)["documents"]:
+                if name not in names:
+                    self.client.delete(self.workspace, name)
+            for uploaded_file in uploaded_files:
+                uploaded_file.seek(0)
+                self.client.upload(
+                    self.workspace,
+                    uploaded_file.name,
+                    uploaded_file,
+                    uploaded_file.size,
+                )
+            st.session_state.ingest_job = self.client.ingest(
+                self.workspace,
+                rag_action=rag_action,
+                hybrid=st.session_state.hybrid,
+                rerank=st.session_state.rerank,
+            )
+        except (APIError, OSError) as e:
+            st.error(f"Could not process the documents: {e}")
+
+    def finish_ingest(self):
+        job_id = st.session_state.ingest_job
+        if job_id is None:
+            return
+        job = self.client.job(job_id)
+        if job["status"] in ("queued", "running"):
+            return
+        st.session_state.ingest_job = None
+        if job["status"] == "done":
+            st.success("Documents processed.")
+        elif job["status"] == "failed":
+            st.error(f"Could not process the documents: {job['error']}")
+        else:
+            st.info("Document processing cancelled.")
+
+    @st.fragment(run_every=1)
+    def show_ingest_progress(self):
+        job_id = st.session_state.ingest_job
+        if job_id is None:
+            return
+        job = self.client.job(job_id)
+        if job["status"] not in ("queued", "running"):
+            st.rerun()
+        stage = job["stage"] or job["status"]
+        if job["detail"]:
+            stage = f"{stage} · {job['detail']}"
+        st.progress(job["fraction"], text=f"Processing documents: {stage}")
+        if st.button("Cancel"):
+            self.client.cancel(job_id)
+
+    def display_history(self):
+        history = st.session_state.history
+        if history.hidden:
+            st.button(
+                f"Show older messages ({history.hidden} hidden)",
+                on_click=history.show_older,
+            )
+        if len(history):
+            st.markdown(history.window_html(), unsafe_allow_html=True)
+
+    def display_user_message(self, content):
+        st.markdown(render_message("user", content), unsafe_allow_html=True)
+
+    def display_bot_message(self, content, container=st):
+        container.markdown(render_message("assistant", content), unsafe_allow_html=True)
+
+    def answer(self, user_input):
+        conversation = [
+            {"role": message.role, "content": message.content}
+            for message in st.session_state.history.messages
+        ]
+        st.session_state.history.append("user", user_input)
+        self.display_user_message(user_input)
+        placeholder = st.empty()
+        text = ""
+        event = None
+        try:
+            for event in self.client.answer_stream(
+                self.workspace,
+                user_input,
+                conversation,
+                hybrid=st.session_state.hybrid,
+                rerank=st.session_state.rerank,
+            ):
+                if "token" in event:
+                    text += event["token"]
+                    self.display_bot_message(visible_answer(text), placeholder)
+        except APIError as e:
+            if e.status == 503:
+                st.warning(str(e))
+            event = None
+        except (OSError, HTTPException) as e:
+            st.error(f"The API at {API_URL} is not reachable: {e}")
+            event = None
+        if event is None or not event.get("done"):
+            # Failed, or the connection ended before the last event
+            self.display_bot_message(FALLBACK_ANSWER, placeholder)
+            st.session_state.history.append("assistant", FALLBACK_ANSWER)
+            return
+
+        self.display_bot_message(event["answer"], placeholder)
+        timings = {"first_token": event["first_token"], "total": event["total"]}
+        if event["first_token"] is not None:
+            st.caption(
+                f"First token: {event['first_token']:.2f} s · "
+                f"Total: {event['total']:.2f} s"
+            )
+        st.session_state.history.append("assistant", event["answer"], timings)
+
+    def run(self):
+        st.markdown(CHAT_CSS, unsafe_allow_html=True)
+        self.display_history()
+        user_input = st.chat_input("Write your message...")
+        if user_input:
+            self.answer(user_input)
+
+
+# Run app
+if __name__ == "__main__":
+    app = ChatClientApp()
+    app.run()
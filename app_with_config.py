@@ -1,12 +1,38 @@
 import streamlit as st
-from chatbot_rag.RAG import RAG
-from chatbot_rag.chat import *
-from chatbot_rag.preprocessing import PyMuPDFPreprocessing, BasePreprocessing
 import os
-import shutil
-import ollama
+import re
 import time
-import asyncio
+import uuid
+from services.app_state import (
+    FALLBACK_ANSWER,
+    finish_ingest,
+    get_answer_cache,
+    get_api,
+    get_blob_store,
+    get_context_packer,
+    get_conversations,
+    get_index_cache,
+    get_job_queue,
+    get_retrieval_cache,
+    get_scheduler,
+    get_tracer,
+    get_workspaces,
+    ingest,
+    stream_bot_answer,
+)
+from services.models import get_model_catalog
+from services.indexing import INGEST_STAGES
+from services.scheduler import Overloaded
+from services.history import (
+    CHAT_CSS,
+    ChatHistory,
+    conversation_digest,
+    render_message,
+)
+from services.context import RollingSummary
+from services.telemetry import short_digest
+from services.memory import get_memory_budget
+from services.warmup import get_model_warmer
 
 
 class ChatApp:
@@ -20,23 +46,46 @@ class ChatApp:
             st.session_state.bot = None
         if "rag" not in st.session_state:
             st.session_state.rag = None
+        if "index" not in st.session_state:
+            st.session_state.index = None
+        if "ingest_job" not in st.session_state:
+            st.session_state.ingest_job = None
+        if "session_id" not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex[:12]
+        if "workspace" not in st.session_state:
+            # Sessions opened with ?workspace=<name> share their documents
+            workspaces = get_workspaces()
+            workspaces.prune()
+            name = st.query_params.get("workspace", st.session_state.session_id)
+            try:
+                st.session_state.workspace = workspaces.open(name)
+            except ValueError as e:
+                st.warning(str(e))
+                st.session_state.workspace = workspaces.open(
+                    st.session_state.session_id
+                )
+        # Resolved here, the ingest job writes the uploads from its thread
+        self.blob_store = get_blob_store()
+        get_api()
+        self.workspace = st.session_state.workspace
+        self.workspace.touch()
+        if st.session_state.bot is not None:
+            # Keeps the session's models loaded while it is in use
+            get_model_warmer().warm(st.session_state.bot)
         if "rag_config" not in st.session_state:
             st.session_state.rag_config = {
                 "rag_action": "BasePreprocessing",
                 "extract_images": False,
                 "extract_tables": False,
                 "tesseract_path": None,
+                "workers": os.cpu_count(),
+                "ann": None,
+                "hybrid": True,
+                "rerank": False,
             }
 
-        if os.path.exists("./data/"):
-            shutil.rmtree("./data/")
-        if os.path.exists("./info/"):
-            shutil.rmtree("./info/")
-
         self.init_session()
 
-        self.retry_done = False  # to handle timeout retries
-
         # Display the appropriate view
         if st.session_state.view == "chat":
             self.display_chat_view()
@@ -49,47 +98,84 @@ class ChatApp:
         self.display_css()
         self.display_history()
         self.handle_input()
+        if st.session_state.get("diagnostics"):
+            self.display_diagnostics()
 
     def display_config_view(self):
         st.title("Configuration")
         self.show_configuration()
 
-    async def call_bot_with_timeout(self, bot, context, question, timeout=120):
+    def call_bot_with_timeout(self, bot, context, question, timeout=120):
         try:
-            loop = asyncio.get_event_loop()
-            return await asyncio.wait_for(
-                loop.run_in_executor(
-                    None,
-                    lambda: bot(context=context, question=question),
-                ),
-                timeout,
-            )
-        except asyncio.TimeoutError:
-            return None  # indicates timeout
+            return get_scheduler().generate(bot, context, question, timeout)
+        except Overloaded as e:
+            st.warning(str(e))
+        except TimeoutError:
+            pass
+        return None  # indicates timeout
 
     def load_rag(self, preprocessing=None, **kwargs):
-        if preprocessing == "PyMuPDFPreprocessing":
-            preprocessing = PyMuPDFPreprocessing
-            st.session_state.rag = RAG(
-                path="./data/", preprocessing=preprocessing, **kwargs
+        # Chat keeps using the current index until the job swaps the new one in
+        with get_tracer().span("load_rag"):
+            if st.session_state.ingest_job is not None:
+                st.session_state.ingest_job.cancel()
+            tags = dict(self.trace_tags(), preprocessing=preprocessing)
+            st.session_state.ingest_job = get_job_queue().submit(
+                ingest,
+                self.workspace,
+                self.blob_store,
+                list(self.uploaded_files),
+                preprocessing,
+                kwargs,
+                st.session_state.rag_config.get("ann"),
+                st.session_state.index,
+                get_index_cache(),
+                get_tracer(),
+                tags,
+                stages=INGEST_STAGES,
             )
-        elif preprocessing == "BasePreprocessing":
-            st.session_state.rag = RAG(path="./data/")
-        st.session_state.rag()
+
+    @st.fragment(run_every=1)
+    def show_ingest_progress(self):
+        job = st.session_state.ingest_job
+        if job is None:
+            return
+        if job.done:
+            st.rerun()
+        stage = job.stage or job.status
+        if job.detail:
+            stage = f"{stage} · {job.detail}"
+        st.progress(job.fraction, text=f"Processing documents: {stage}")
+        if st.button("Cancel"):
+            job.cancel()
+
+    @st.fragment(run_every=2)
+    def show_model_status(self):
+        bot = st.session_state.bot
+        if bot is None:
+            return
+        for model in get_model_warmer().status(bot):
+            if model["state"] == "loading":
+                st.caption(f"⏳ Loading {model['model']}…")
+            elif model["state"] == "failed":
+                st.caption(f"⚠️ {model['model']} not loaded: {model['error']}")
+            else:
+                st.caption(
+                    f"✅ {model['model']} ready, loaded in {model['seconds']:.1f} s"
+                )
 
     def sidebar_options(self):
-        with st.sidebar:
-            self.uploaded_file = st.file_uploader(
-                "Upload a document (PDF)", type=["pdf"]
+        tracer = get_tracer()
+        tags = self.trace_tags()
+        with tracer.trace("sidebar_options", record=False, **tags), st.sidebar:
+            with tracer.span("finish_ingest"):
+                finish_ingest()
+            self.uploaded_files = st.file_uploader(
+                "Upload documents (PDF)", type=["pdf"], accept_multiple_files=True
             )
 
             if st.button("Process document", type="primary"):
-                if self.uploaded_file:
-                    os.makedirs("./data", exist_ok=True)
-                    if not os.path.exists(f"./data/{self.uploaded_file.name}"):
-                        with open(f"./data/{self.uploaded_file.name}", "wb") as f:
-                            f.write(self.uploaded_file.getbuffer())
-
+                if self.uploaded_files:
                     rag_action = st.session_state.rag_config["rag_action"]
 
                     if rag_action == "PyMuPDFPreprocessing":
@@ -100,6 +186,7 @@ class ChatApp:
                             "extract_tables": st.session_state.rag_config[
                                 "extract_tables"
                             ],
+                            "workers": st.session_state.rag_config.get("workers"),
                         }
                         if st.session_state.rag_config["extract_images"]:
                             kwargs["tesseract_path"] = st.session_state.rag_config[
@@ -110,12 +197,34 @@ class ChatApp:
                     else:
                         self.load_rag(preprocessing=rag_action)
                 else:
-                    if os.path.exists("./data/"):
-                        shutil.rmtree("./data/")
-                    if os.path.exists("./info/"):
-                        shutil.rmtree("./info/")
+                    self.workspace.clear()
 
+                    if st.session_state.index is not None:
+                        st.session_state.index.release()
                     st.session_state.rag = None
+                    st.session_state.index = None
+
+            self.show_ingest_progress()
+            self.show_model_status()
+
+            st.toggle("Stream answers", value=True, key="stream_answers")
+            st.toggle("Diagnostics", value=False, key="diagnostics")
+            stats = get_answer_cache().stats()
+            st.caption(f"Answer cache: {stats['hits']} hits, {stats['misses']} misses")
+            search = get_retrieval_cache().stats()["search"]
+            st.caption(
+                f"Retrieval cache: {search['hit_ratio']:.0%} hits, "
+                f"{search['saved_seconds']:.2f} s saved"
+            )
+            memory = get_memory_budget().stats()
+            st.caption(
+                f"Indexes in memory: {memory['loaded']} of {memory['indexes']}, "
+                f"{memory['bytes'] / 2**20:.0f} of {memory['max_bytes'] / 2**20:.0f} MB"
+            )
+            for backend, load in get_scheduler().stats().items():
+                st.caption(
+                    f"{backend}: {load['in_flight']} running, {load['queued']} queued"
+                )
 
             if st.button("Configuration ⚙️"):
                 st.session_state.view = "config"
@@ -132,7 +241,7 @@ class ChatApp:
 
         if host == "Ollama":
             try:
-                model_options = [model.model for model in ollama.list()["models"]]
+                model_options = get_model_catalog().models()
                 model_name = st.selectbox("Model:", options=model_options)
             except:
                 st.error(
@@ -148,6 +257,42 @@ class ChatApp:
             token = st.text_input(label="Token", value="")
             provider = st.text_input(label="Provider", value="hyperbolic")
 
+        with st.expander("Fallback backend"):
+            st.write(
+                "Requests go to whichever backend currently answers fastest; "
+                "a slow request can be hedged on the other one."
+            )
+            use_fallback = st.checkbox("Route across a second backend", value=False)
+            fallback_host = st.selectbox(
+                "Fallback host", options=["Ollama", "Hugginface"], key="fallback_host"
+            )
+            fallback = {
+                "host": fallback_host,
+                "model_name": st.text_input(
+                    "Fallback model name", key="fallback_model"
+                ),
+            }
+            if fallback_host == "Ollama":
+                fallback["server"] = (
+                    st.text_input(
+                        "Ollama server URL", placeholder="http://127.0.0.1:11434"
+                    )
+                    or None
+                )
+            else:
+                fallback["token"] = st.text_input("Fallback token", value="")
+                fallback["provider"] = st.text_input(
+                    "Fallback provider", value="hyperbolic"
+                )
+            hedge = st.checkbox(
+                "Hedge slow requests",
+                value=True,
+                help="Also send a request to the other backend when the first one "
+                "is slower than usual, and keep whichever answers first.",
+            )
+            if not use_fallback or not fallback["model_name"]:
+                fallback = None
+
         st.markdown("## RAG configuration")
         rag_list = ["BasePreprocessing", "PyMuPDFPreprocessing"]
         rag_action = st.selectbox(
@@ -161,6 +306,7 @@ class ChatApp:
         extract_images = False
         extract_tables = False
         tesseract_path = None
+        workers = os.cpu_count()
 
         if rag_action == "PyMuPDFPreprocessing":
             with st.expander("PyMuPDF Configuration"):
@@ -179,6 +325,62 @@ class ChatApp:
                         st.session_state.rag_config.get("extract_tables", False)
                     ),
                 )
+                workers = st.number_input(
+                    "Worker processes",
+                    min_value=1,
+                    value=st.session_state.rag_config.get("workers") or os.cpu_count(),
+                    help="Page ranges are parsed, OCRed and table-extracted in parallel.",
+                )
+
+        ann = st.session_state.rag_config.get("ann")
+        index_list = ["Exact", "IVF-PQ"]
+        vector_index = st.selectbox(
+            "Vector index:",
+            index_list,
+            index=1 if ann else 0,
+            help="IVF-PQ searches large document sets faster, approximately.",
+        )
+        if vector_index == "IVF-PQ":
+            ann = ann or {}
+            with st.expander("IVF-PQ Configuration"):
+                st.write(
+                    "More clusters searched and more candidates re-scored "
+                    "give better results and slower searches."
+                )
+                ann = {
+                    "nlist": st.number_input(
+                        "Clusters", min_value=1, value=ann.get("nlist", 256)
+                    ),
+                    "nprobe": st.number_input(
+                        "Clusters searched per query",
+                        min_value=1,
+                        value=ann.get("nprobe", 8),
+                    ),
+                    "m": st.number_input(
+                        "Sub-vectors per embedding",
+                        min_value=1,
+                        value=ann.get("m", 16),
+                    ),
+                    "rerank": st.number_input(
+                        "Candidates re-scored exactly",
+                        min_value=0,
+                        value=ann.get("rerank", 64),
+                    ),
+                }
+        else:
+            ann = None
+
+        hybrid = st.checkbox(
+            "Hybrid search (keywords + embeddings)",
+            value=st.session_state.rag_config.get("hybrid", True),
+            help="Also match exact words such as part numbers and error codes.",
+        )
+        rerank = st.checkbox(
+            "Rerank results",
+            value=st.session_state.rag_config.get("rerank", False),
+            disabled=not hybrid,
+            help="Put the chunks that contain more of the question first.",
+        )
 
         if st.button("Save Configuration"):
             if extract_images and not tesseract_path:
@@ -191,11 +393,20 @@ class ChatApp:
                 "extract_images": extract_images,
                 "extract_tables": extract_tables,
                 "tesseract_path": tesseract_path,
+                "workers": workers,
+                "ann": ann,
+                "hybrid": hybrid,
+                "rerank": rerank,
             }
 
             # Load the bot based on configuration
             self.load_bot(
-                host=host, model_name=model_name, token=token, provider=provider
+                host=host,
+                model_name=model_name,
+                token=token,
+                provider=provider,
+                fallback=fallback,
+                hedge=hedge,
             )
 
             st.success("Configuration saved!")
@@ -204,125 +415,194 @@ class ChatApp:
             st.session_state.view = "chat"
             st.rerun()
 
-    def load_bot(self, host, model_name, token=None, provider=None):
-        if host == "Ollama":
-            st.session_state.bot = OllamaChatbot(name=model_name)
-        elif host == "Hugginface":
-            st.session_state.bot = HuggingFaceChatbot(
-                model_name=model_name, token=token, provider=provider
-            )
+    def load_bot(
+        self, host, model_name, token=None, provider=None, fallback=None, hedge=True
+    ):
+        # Imports the chat backends, only once a model is chosen
+        from services.chat import load_chatbot
+        from services.router import load_router
+
+        previous = st.session_state.get("bot_lease")
+        primary = dict(host=host, model_name=model_name, token=token, provider=provider)
+        if fallback:
+            st.session_state.bot_lease = load_router([primary, fallback], hedge=hedge)
+        else:
+            st.session_state.bot_lease = load_chatbot(**primary)
+        st.session_state.bot = st.session_state.bot_lease.value
+        if previous is not None:
+            previous.release()
+        # Loads the models now rather than on the first question
+        get_model_warmer().warm(st.session_state.bot)
 
     def init_session(self):
-        if "messages" not in st.session_state:
-            st.session_state.messages = []
+        if "conversation" not in st.session_state:
+            # Kept in the URL, so reloading the page resumes the conversation
+            conversation = st.query_params.get("conversation", "")
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", conversation):
+                conversation = uuid.uuid4().hex
+                st.query_params["conversation"] = conversation
+            st.session_state.conversation = conversation
+        if "history" not in st.session_state:
+            st.session_state.history = ChatHistory(
+                page_size=20,
+                store=get_conversations(),
+                conversation=st.session_state.conversation,
+            )
+        if "summary" not in st.session_state:
+            st.session_state.summary = RollingSummary(max_tokens=256)
 
     def display_css(self):
-        st.markdown(
-            """
-            <style>
-            .chat-row {
-                display: flex;
-                margin-bottom: 1rem;
-            }
-            .chat-left {
-                justify-content: flex-start;
-            }
-            .chat-right {
-                justify-content: flex-end;
-            }
-            .chat-bubble {
-                max-width: 70%;
-                padding: 0.5rem;
-                border-radius: 0.5rem;
-            }
-            .bot-bubble {
-                background-color: #0e1117ff;
-            }
-            .user-bubble {
-                background-color: #1a1c24ff;
-                text-align: right;
-            }
-            .avatar {
-                width: 32px;
-                height: 32px;
-                border-radius: 50%;
-                background-color: #ccc;
-                display: inline-block;
-                margin: 0 0.5rem;
-            }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
+        st.markdown(CHAT_CSS, unsafe_allow_html=True)
 
     def display_history(self):
-        for msg in st.session_state.messages:
-            if msg["role"] == "user":
-                self.display_user_message(msg["content"])
-            else:
-                self.display_bot_message(msg["content"])
+        history = st.session_state.history
+        if history.hidden:
+            st.button(
+                f"Show older messages ({history.hidden} hidden)",
+                on_click=history.show_older,
+            )
+        if len(history):
+            st.markdown(history.window_html(), unsafe_allow_html=True)
 
     def display_user_message(self, content):
-        st.markdown(
-            f"""
-            <div class="chat-row chat-right">
-                <div class="chat-bubble user-bubble">{content}</div>
-                <div class="avatar"></div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-
-    def display_bot_message(self, content):
-        st.markdown(
-            f"""
-            <div class="chat-row chat-left">
-                <div class="avatar"></div>
-                <div class="chat-bubble bot-bubble">{content}</div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        st.markdown(render_message("user", content), unsafe_allow_html=True)
+
+    def display_bot_message(self, content, container=st):
+        container.markdown(render_message("assistant", content), unsafe_allow_html=True)
+
+    def trace_tags(self):
+        bot = st.session_state.bot
+        index = st.session_state.index
+        return {
+            "session": st.session_state.session_id,
+            "model": f"{type(bot).__name__}:{bot.name}" if bot is not None else None,
+            "docset": short_digest(index.key) if index is not None else None,
+        }
+
+    def display_diagnostics(self, n=20):
+        traces = get_tracer().recent(n, session=st.session_state.session_id)
+        rows = []
+        for trace in traces:
+            row = {
+                "time": time.strftime("%H:%M:%S", time.localtime(trace.started)),
+                "request": trace.name,
+                "status": trace.status,
+                "total ms": round(trace.duration * 1000, 1),
+            }
+            for stage, duration in trace.stage_durations().items():
+                row[f"{stage} ms"] = round(duration * 1000, 1)
+            rows.append(row)
+        with st.expander(f"Diagnostics: last {len(rows)} requests", expanded=True):
+            if rows:
+                st.dataframe(rows, hide_index=True)
+            else:
+                st.caption("No requests yet.")
+            bot = st.session_state.get("bot")
+            if hasattr(bot, "backend_stats"):
+                backends = []
+                for stats in bot.backend_stats():
+                    backends.append(
+                        {
+                            "backend": stats["backend"],
+                            "p50 ms": stats["p50"] and round(stats["p50"] * 1000),
+                            "p95 ms": stats["p95"] and round(stats["p95"] * 1000),
+                            "errors": f"{stats['error_rate']:.0%}",
+                            "healthy": stats["healthy"],
+                            "won": stats["wins"],
+                            "hedged": stats["hedges"],
+                        }
+                    )
+                st.dataframe(backends, hide_index=True)
+
+    def answer_cache_scope(self, conversation):
+        bot = st.session_state.bot
+        model = f"{type(bot).__name__}:{bot.name}"
+        index = st.session_state.index
+        fingerprint = index.key if index is not None else None
+        # Follow-up questions are answered in the light of the conversation
+        if conversation:
+            fingerprint = (fingerprint, conversation_digest(conversation))
+        rag = st.session_state.rag
+        embed = None
+        if rag is not None:
+            embed = lambda text: get_retrieval_cache().embed(rag, text)
+        return model, fingerprint, embed
+
+    def remember_answer(self, question, answer, conversation):
+        model, fingerprint, embed = self.answer_cache_scope(conversation)
+        get_answer_cache().put(model, fingerprint, question, answer, embed)
 
     def handle_input(self):
         user_input = st.chat_input("Write your message...")
-
         if user_input:
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            self.display_user_message(user_input)
-            if st.session_state.rag is None:
-                context = None
-            else:
-                context = st.session_state.rag._search_context(user_input)
+            with get_tracer().trace("handle_input", **self.trace_tags()):
+                self.answer(user_input)
+
+    def answer(self, user_input):
+        conversation = st.session_state.history.messages[:]
+        st.session_state.history.append("user", user_input)
+        self.display_user_message(user_input)
+        if st.session_state.bot is None:
+            # Nothing to schedule: the scheduler needs a backend to admit to
+            st.error("Please configure a chatbot model first in the Configuration page")
+            return
+
+        model, fingerprint, embed = self.answer_cache_scope(conversation)
+        with get_tracer().span("answer_cache") as span:
+            respuesta = get_answer_cache().get(model, fingerprint, user_input, embed)
+            span.tags["hit"] = respuesta is not None
+        if respuesta is not None:
+            st.session_state.history.append("assistant", respuesta)
+            self.display_bot_message(respuesta)
+            return
 
-            if st.session_state.bot is None:
-                st.error(
-                    "Please configure a chatbot model first in the Configuration page"
+        if st.session_state.rag is None:
+            chunks = []
+        else:
+            # Extra candidates, the packer keeps what fits the budget
+            rag_config = st.session_state.rag_config
+            with get_tracer().span("retrieve"):
+                chunks = get_retrieval_cache().search_chunks(
+                    st.session_state.index.value,
+                    user_input,
+                    k=6,
+                    hybrid=rag_config.get("hybrid", True),
+                    rerank=rag_config.get("rerank", False),
                 )
-                return
-            respuesta = asyncio.run(
-                self.call_bot_with_timeout(st.session_state.bot, context, user_input)
+        with get_tracer().span("pack"):
+            context, question = get_context_packer().pack(
+                st.session_state.bot,
+                user_input,
+                chunks,
+                conversation,
+                st.session_state.summary,
             )
-            if respuesta is None:
-                # first timeout, retry
-                if not self.retry_done:
-                    self.retry_done = True
-                    respuesta = asyncio.run(
-                        self.call_bot_with_timeout(
-                            st.session_state.bot, context, user_input
-                        )
-                    )
-                    if respuesta is None:
-                        respuesta = "I'm sorry, I haven't been able to generate an answer yet. Is there anything else I can assist you with?"
-                else:
-                    respuesta = "I'm sorry, I haven't been able to generate an answer yet. Is there anything else I can assist you with?"
-            else:
-                self.retry_done = False  # reset if successful
 
-            st.session_state.messages.append(
-                {"role": "assistant", "content": respuesta}
+        if st.session_state.get("stream_answers") and hasattr(
+            st.session_state.bot, "stream"
+        ):
+            with get_tracer().span("generate", streaming=True) as span:
+                respuesta, timings = stream_bot_answer(
+                    st.session_state.bot, context, question
+                )
+                if timings is not None:
+                    span.tags["first_token"] = timings["first_token"]
+            st.session_state.history.append("assistant", respuesta, timings)
+            if timings is not None:
+                self.remember_answer(user_input, respuesta, conversation)
+            return
+
+        # Timeouts are retried with backoff inside the scheduler
+        with get_tracer().span("generate", streaming=False):
+            respuesta = self.call_bot_with_timeout(
+                st.session_state.bot, context, question
             )
-            self.display_bot_message(respuesta)
+        if respuesta is None:
+            respuesta = FALLBACK_ANSWER
+        else:
+            self.remember_answer(user_input, respuesta, conversation)
+        st.session_state.history.append("assistant", respuesta)
+        self.display_bot_message(respuesta)
 
     def run(self):
         # The main logic is now handled in __init__ and the respective view methods
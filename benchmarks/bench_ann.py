@@ -0,0 +1,138 @@
+"""
+Measure the IVF-PQ index against exact search on a large synthetic corpus.
+
+Vectors are drawn around random topic centres, like the embeddings of many
+documents on fewer subjects, and queries are perturbed corpus vectors. For
+each ``--nprobe`` and ``--rerank`` combination the index is searched and
+the results are compared with the exact top-k, reporting latency and
+recall@k; the build time of the index is reported as well. The same
+searches then go through the memory-mapped ``MappedVectorStore`` for each
+``--dtype`` and ``--rescore``, with the size of its files.
+
+    python benchmarks/bench_ann.py --vectors 100000 --nprobe 1 4 16 --rerank 0 64
+    python benchmarks/bench_ann.py --dtype int8 float16 --rescore 0 16 64
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import metadata, print_table, recall_at_k, summarize
+
+
+def make_vectors(count: int, dimensions: int, topics: int, spread: float, rng):
+    centres = rng.normal(size=(topics, dimensions)).astype(np.float32)
+    noise = rng.normal(size=(count, dimensions)).astype(np.float32)
+    return centres[rng.integers(0, topics, count)] + spread * noise
+
+
+def search_all(search, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query, k))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=0.3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 64])
+    parser.add_argument("--batch", type=int, default=2000, help="Vectors per add.")
+    parser.add_argument("--dtype", nargs="+", default=["int8", "float16"])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 64])
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    from services.ann import IVFPQIndex
+    from services.vector_store import MappedVectorStore, write_vector_store
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors, args.dimensions, args.topics, args.spread, rng)
+    ids = [f"chunk-{i}" for i in range(args.vectors)]
+    picks = rng.integers(0, args.vectors, args.queries)
+    noise = rng.normal(size=(args.queries, args.dimensions)).astype(np.float32)
+    queries = vectors[picks] + 0.1 * args.spread * noise
+
+    def exact(query, k):
+        distances = ((vectors - query) ** 2).sum(1)
+        best = np.argpartition(distances, k - 1)[:k]
+        return [ids[i] for i in best[np.argsort(distances[best])]]
+
+    stages = {}
+    latencies, truth = search_all(exact, queries, args.k)
+    stages["exact"] = summarize(latencies, recall_at_k=1.0)
+
+    # Added in batches, as ingestion does file by file
+    index = IVFPQIndex(nlist=args.nlist, m=args.m, min_train=args.nlist * 39)
+    start = time.perf_counter()
+    for first in range(0, args.vectors, args.batch):
+        index.add(ids[first : first + args.batch], vectors[first : first + args.batch])
+    build_seconds = time.perf_counter() - start
+
+    for nprobe in args.nprobe:
+        for rerank in args.rerank:
+            index.nprobe, index.rerank = nprobe, rerank
+            latencies, found = search_all(index.search, queries, args.k)
+            stages[f"nprobe={nprobe} rerank={rerank}"] = summarize(
+                latencies, recall_at_k=recall_at_k(found, truth)
+            )
+
+    sizes = {}
+    workdir = tempfile.mkdtemp(prefix="bench_ann_")
+    try:
+        for dtype in args.dtype:
+            directory = os.path.join(workdir, dtype)
+            write_vector_store(directory, ids, vectors, [""] * len(ids), None, dtype)
+            store = MappedVectorStore(directory)
+            sizes[dtype] = store.mapped_bytes()
+            for rescore in args.rescore:
+                store.rescore = rescore
+                latencies, found = search_all(store.search, queries, args.k)
+                stages[f"{dtype} rescore={rescore}"] = summarize(
+                    latencies, recall_at_k=recall_at_k(found, truth)
+                )
+            store.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(stages)
+    print(
+        f"\nBuilt over {args.vectors} vectors in {build_seconds:.2f} s "
+        f"({len(index.centroids)} lists, {index.m} sub-vectors)"
+    )
+    for dtype, size in sizes.items():
+        print(
+            f"{dtype} store: {size / 2**20:.1f} MB of files, including the "
+            f"{vectors.nbytes / 2**20:.1f} MB float32 copy read only for rescoring"
+        )
+    if args.output:
+        result = {
+            "meta": metadata(args),
+            "stages": stages,
+            "build_seconds": build_seconds,
+            "store_bytes": sizes,
+        }
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
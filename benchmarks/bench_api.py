@@ -0,0 +1,192 @@
+"""
+Load test of the HTTP API against a stub LLM on one machine.
+
+Starts ``stub_ollama.StubOllama`` and the ``services.api`` server in this
+process, uploads synthetic PDFs and ingests them through the API, then
+sends ``--requests`` distinct questions from ``--concurrency`` clients:
+searches over kept-alive and over fresh connections, and streamed
+answers. Embeddings are a hashing model, so nothing is downloaded.
+Reports p50/p95/p99 latency, throughput and turned-away requests.
+
+    python benchmarks/bench_api.py --requests 400 --concurrency 32
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import metadata, print_table, summarize
+from benchmarks.stub_ollama import StubOllama
+from benchmarks.synthetic import (
+    DEFAULT_EMBEDDING_MODEL,
+    HashingEmbeddings,
+    make_pdfs,
+    make_questions,
+)
+
+
+def run(fn, questions: list, concurrency: int):
+    """
+    Call ``fn`` for every question.
+    Returns:
+        tuple: Summaries of its timings, and a ``Counter`` of the errors.
+    """
+    errors = Counter()
+
+    def ask(question):
+        start = time.perf_counter()
+        try:
+            timings = fn(question)
+        except Exception as e:
+            errors[f"{type(e).__name__}: {e}"] += 1
+            return None
+        return dict(timings or {}, total=time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(ask, questions))
+    wall_time = time.perf_counter() - start
+    answered = [r for r in results if r is not None]
+    failed = len(results) - len(answered)
+    summaries = {}
+    for kind in answered[0] if answered else ():
+        values = [r[kind] for r in answered if r[kind] is not None]
+        if values:
+            summaries[kind] = summarize(values, wall_time, failed=failed)
+    return summaries, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8611)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument(
+        "--parallel", type=int, default=4, help="Generations the stub runs at once."
+    )
+    parser.add_argument("--prefill-delay", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    from services.api import ChatService, serve_api
+    from services.api_client import APIClient
+    from services.batching import BatchingEmbeddings
+    from services.index_cache import IndexCache
+    from services.pool import get_pool
+    from services.scheduler import BotScheduler
+    from services.uploads import BlobStore
+    from services.vector_store import VectorStoreCache
+    from services.workspaces import WorkspaceStore
+
+    stub = StubOllama(
+        prefill_delay=args.prefill_delay,
+        token_delay=args.token_delay,
+        parallel=args.parallel,
+    ).start()
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    # RAG takes its embedding model from the pool; seed it with the stub
+    embeddings = get_pool().lease(
+        ("embeddings", DEFAULT_EMBEDDING_MODEL),
+        lambda: BatchingEmbeddings(HashingEmbeddings()),
+    )
+    service = ChatService(
+        {"host": "Ollama", "model_name": "stub:latest", "server": stub.url},
+        workers=args.workers,
+        max_queue=args.max_queue,
+        workspaces=WorkspaceStore(root=os.path.join(workdir, "workspaces")),
+        blob_store=BlobStore(root=os.path.join(workdir, "blobs")),
+        index_cache=IndexCache(root=os.path.join(workdir, "indexes")),
+        vector_stores=VectorStoreCache(root=os.path.join(workdir, "vectors")),
+        scheduler=BotScheduler(
+            limits={"ollama": args.parallel}, max_queue=args.concurrency
+        ),
+    )
+    serve_api(service, port=args.port)
+    client = APIClient(f"http://127.0.0.1:{args.port}")
+
+    stages = {}
+    errors = {}
+    try:
+        source = os.path.join(workdir, "pdfs")
+        make_pdfs(source, args.files, args.pages)
+        start = time.perf_counter()
+        for name in sorted(os.listdir(source)):
+            with open(os.path.join(source, name), "rb") as f:
+                client.upload("bench", name, f, os.path.getsize(f.name))
+        job = client.ingest("bench")
+        while client.job(job)["status"] in ("queued", "running"):
+            time.sleep(0.05)
+        status = client.job(job)
+        if status["status"] != "done":
+            raise RuntimeError(f"Ingestion failed: {status['error']}")
+        stages["ingest"] = summarize([time.perf_counter() - start])
+
+        questions = make_questions(args.requests)
+
+        def query(question):
+            client.query("bench", question, k=6)
+
+        def query_new_connection(question):
+            client.query("bench", question, k=6)
+            client.close()
+
+        def answer(question):
+            first, event = None, {}
+            start = time.perf_counter()
+            for event in client.answer_stream("bench", question):
+                if first is None and "token" in event:
+                    first = time.perf_counter() - start
+            if not event.get("done"):
+                raise RuntimeError("The answer stream ended early.")
+            return {"first_token": first}
+
+        for label, fn in (
+            ("query keep-alive", query),
+            ("query new conn", query_new_connection),
+            ("answer", answer),
+        ):
+            summaries, errors[label] = run(fn, questions, args.concurrency)
+            if label != "answer":
+                summaries = {"": summaries.get("total")}
+            for kind, summary in summaries.items():
+                if summary is not None:
+                    stages[f"{label}:{kind}" if kind else label] = summary
+    finally:
+        client.close()
+        service.shutdown()
+        embeddings.release()
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "meta": metadata(args),
+        "stages": stages,
+        "errors": {label: dict(counts) for label, counts in errors.items()},
+        "stub": stub.stats,
+    }
+    print_table(stages)
+    for label, counts in errors.items():
+        for error, count in counts.most_common():
+            print(f"{label}: {count} requests failed with {error}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if any(not any(k.startswith(label) for k in stages) for label in errors):
+        sys.exit("Every request of a stage failed.")
+
+
+if __name__ == "__main__":
+    main()
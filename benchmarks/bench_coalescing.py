@@ -0,0 +1,117 @@
+"""
+Measure request coalescing and embedding batching against a stub Ollama.
+
+Starts ``stub_ollama.StubOllama`` on a free port and runs ``--sessions``
+concurrent sessions asking the same question, once calling the backend
+directly and once through the coalescing ``OllamaChatbot``, then embeds
+``--sessions`` distinct queries concurrently with and without
+``BatchingEmbeddings``. Prints wall time and backend request counts.
+
+    python benchmarks/bench_coalescing.py --sessions 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_ollama import StubOllama
+
+
+class ClientEmbeddings:
+    """Embeddings through an ``ollama.Client`` (``/api/embed``)."""
+
+    def __init__(self, client, model: str):
+        self.client = client
+        self.model = model
+
+    def embed_documents(self, texts: list) -> list:
+        return [
+            list(vector)
+            for vector in self.client.embed(model=self.model, input=texts)["embeddings"]
+        ]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+def backend_stats(server) -> dict:
+    with urllib.request.urlopen(f"{server.url}/stub/stats") as response:
+        return json.load(response)
+
+
+def run(label, server, sessions, fn):
+    before = backend_stats(server)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(fn, range(sessions)))
+    elapsed = time.perf_counter() - start
+    after = backend_stats(server)
+    calls = {key: after[key] - before[key] for key in ("chat", "embed", "embedded")}
+    print(
+        f"{label:<24} {elapsed:7.3f}s  {sessions / elapsed:7.1f} req/s  "
+        f"backend: {calls['chat']} chat, {calls['embed']} embed "
+        f"({calls['embedded']} texts)"
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--prefill-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = StubOllama(
+        prefill_delay=args.prefill_delay, token_delay=args.token_delay
+    ).start()
+
+    from services.batching import BatchingEmbeddings
+    from services.chat import OllamaChatbot
+
+    bot = OllamaChatbot(name="stub:latest", host=server.url)
+    question = "What does the document say about coalescing?"
+    prompt = bot._generate_prompt_without_countext(question)
+
+    direct = run(
+        "chat, direct",
+        server,
+        args.sessions,
+        lambda _: "".join(bot._chat_stream(prompt)),
+    )
+    coalesced = run(
+        "chat, coalesced",
+        server,
+        args.sessions,
+        lambda _: "".join(bot.stream(context=None, question=question)),
+    )
+    assert set(direct) == set(coalesced), "Coalesced answers differ"
+    print(f"{'':<24} flights: {bot.flights.stats()}")
+
+    # The chatbot's own client, so the stub is reached through host= alone
+    embeddings = ClientEmbeddings(bot.client, "stub:latest")
+    batching = BatchingEmbeddings(embeddings)
+    run(
+        "embed, direct",
+        server,
+        args.sessions,
+        lambda i: embeddings.embed_query(f"query {i}"),
+    )
+    run(
+        "embed, batched",
+        server,
+        args.sessions,
+        lambda i: batching.embed_query(f"query {i}"),
+    )
+    print(f"{'':<24} batches: {batching.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Headless benchmark of the ingest -> retrieve -> generate pipeline.
+
+Runs the code the Streamlit app runs, without Streamlit: ingestion through
+``load_shared_index`` (what the ``load_rag`` job executes), retrieval through
+``IncrementalIndex.search_ids`` and ``RetrievalCache`` (hybrid BM25 and
+vector search, and vectors alone), context packing, and
+generation through ``BotScheduler.generate`` (what
+``call_bot_with_timeout`` calls). Documents are synthetic PDFs, embeddings
+a hashing model and the chatbot a deterministic stub, so it runs offline
+on a CPU.
+
+Reports p50/p95/p99 latency and throughput per stage and writes them as
+JSON; ``--compare`` prints the change against an earlier result. ``--ann``
+adds the same searches through the IVF-PQ index, with their recall@k
+against the exact search.
+
+    python benchmarks/bench_pipeline.py --pages 50 --output before.json
+    python benchmarks/bench_pipeline.py --pages 50 --compare before.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.report import (
+    compare,
+    metadata,
+    print_table,
+    recall_at_k,
+    summarize,
+)
+from benchmarks.synthetic import (
+    DEFAULT_EMBEDDING_MODEL,
+    HashingEmbeddings,
+    StubChatbot,
+    make_pdfs,
+    make_questions,
+)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def run_concurrently(fn, items: list, concurrency: int):
+    """Run ``fn`` over ``items`` and return (latencies, results, wall time)."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda item: timed(fn, item), items))
+    wall_time = time.perf_counter() - start
+    return [o[0] for o in outcomes], [o[1] for o in outcomes], wall_time
+
+
+def run(args) -> dict:
+    from services.batching import BatchingEmbeddings
+    from services.context import ContextPacker
+    from services.index_cache import IndexCache
+    from services.indexing import load_shared_index
+    from services.pool import get_pool
+    from services.retrieval_cache import RetrievalCache
+    from services.scheduler import BotScheduler
+    from services.vector_store import VectorStoreCache
+
+    pool = get_pool()
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    leases = []
+    if not args.real_embeddings:
+        # RAG takes its embedding model from the pool; seed it with the stub
+        leases.append(
+            pool.lease(
+                ("embeddings", DEFAULT_EMBEDDING_MODEL),
+                lambda: BatchingEmbeddings(
+                    HashingEmbeddings(delay=args.embedding_delay)
+                ),
+            )
+        )
+
+    kwargs = {}
+    if args.rag_action == "PyMuPDFPreprocessing":
+        kwargs = {"extract_images": False, "extract_tables": False}
+        if args.workers:
+            kwargs["workers"] = args.workers
+
+    stages = {}
+    indexes = []
+    try:
+        cache = IndexCache(root=os.path.join(workdir, "cache"))
+        stores = VectorStoreCache(root=os.path.join(workdir, "vectors"))
+        pages = args.files * args.pages
+
+        # Every repetition gets new documents, so nothing is cached yet
+        latencies = []
+        for repetition in range(args.ingest_repetitions):
+            path = os.path.join(workdir, f"data_{repetition}")
+            make_pdfs(path, args.files, args.pages, args.words_per_page, repetition)
+            elapsed, lease = timed(
+                load_shared_index, path, args.rag_action, kwargs, cache, stores=stores
+            )
+            latencies.append(elapsed)
+            indexes.append(lease)
+        stages["ingest_cold"] = summarize(
+            latencies, pages_per_second=pages * len(latencies) / sum(latencies)
+        )
+
+        # Same documents once the sessions' indexes are gone: per-file cache hits
+        for lease in indexes:
+            lease.release()
+        pool.idle_timeout, idle_timeout = 0, pool.idle_timeout
+        pool.evict_idle()
+        pool.idle_timeout = idle_timeout
+        latencies = []
+        for repetition in range(args.ingest_repetitions):
+            path = os.path.join(workdir, f"data_{repetition}")
+            elapsed, lease = timed(
+                load_shared_index, path, args.rag_action, kwargs, cache, stores=stores
+            )
+            latencies.append(elapsed)
+            leases.append(lease)
+        stages["ingest_warm"] = summarize(
+            latencies, pages_per_second=pages * len(latencies) / sum(latencies)
+        )
+
+        index = leases[-1].value
+        rag = index.rag
+        questions = make_questions(args.questions)
+
+        def retrieve(question):
+            # Uncached: embed, search the (memory-mapped) vectors, read the texts
+            with index.in_use():
+                ids = index.search_ids(rag.model.embed_query(question), 3)
+                return "\n\n".join(index.texts(ids))
+
+        latencies, _, wall_time = run_concurrently(
+            retrieve, questions, args.concurrency
+        )
+        stages["retrieve"] = summarize(latencies, wall_time)
+
+        retrieval = RetrievalCache()
+        search = lambda question: retrieval.search_chunks(index, question, k=6)
+        latencies, _, wall_time = run_concurrently(search, questions, args.concurrency)
+        stages["retrieve_cached_miss"] = summarize(latencies, wall_time)
+        latencies, chunks, wall_time = run_concurrently(
+            search, questions, args.concurrency
+        )
+        stages["retrieve_cached_hit"] = summarize(latencies, wall_time)
+
+        # Hybrid (BM25 + vectors) is the default; vectors alone for reference
+        vector_only = RetrievalCache()
+        latencies, _, wall_time = run_concurrently(
+            lambda question: vector_only.search_chunks(
+                index, question, k=6, hybrid=False
+            ),
+            questions,
+            args.concurrency,
+        )
+        stages["retrieve_vector_only"] = summarize(latencies, wall_time)
+
+        if args.ann:
+            # Same embedded questions through exact and approximate search
+            k = 6
+            vectors = [retrieval.embed(rag, question) for question in questions]
+            search_ids = lambda vector: index.search_ids(vector, k)
+            latencies, exact, wall_time = run_concurrently(
+                search_ids, vectors, args.concurrency
+            )
+            stages["retrieve_exact"] = summarize(latencies, wall_time)
+            index.configure_ann(
+                {
+                    "nlist": args.nlist,
+                    "nprobe": args.nprobe,
+                    "m": args.m,
+                    "rerank": args.rerank,
+                    "min_train": args.min_train,
+                }
+            )
+            latencies, found, wall_time = run_concurrently(
+                search_ids, vectors, args.concurrency
+            )
+            stages["retrieve_ann"] = summarize(
+                latencies,
+                wall_time,
+                recall_at_k=recall_at_k(found, exact),
+                trained=index.ann.is_trained,
+            )
+            index.configure_ann(None)
+
+        bot = StubChatbot(
+            prefill_delay=args.prefill_delay,
+            token_delay=args.token_delay,
+            tokens=args.answer_tokens,
+        )
+        packer = ContextPacker()
+        latencies, packed, wall_time = run_concurrently(
+            lambda item: packer.pack(bot, *item), list(zip(questions, chunks)), 1
+        )
+        stages["pack"] = summarize(latencies, wall_time)
+
+        scheduler = BotScheduler(
+            default_limit=args.concurrency, max_queue=len(questions), timeout=600
+        )
+        generate = lambda item: scheduler.generate(bot, *item)
+        latencies, _, wall_time = run_concurrently(generate, packed, args.concurrency)
+        stages["generate"] = summarize(latencies, wall_time)
+
+        def answer(question):
+            context, prompt = packer.pack(bot, question, search(question))
+            return scheduler.generate(bot, context, prompt)
+
+        latencies, _, wall_time = run_concurrently(
+            answer, make_questions(args.questions, seed=1), args.concurrency
+        )
+        stages["end_to_end"] = summarize(latencies, wall_time)
+    finally:
+        for lease in indexes + leases:
+            lease.release()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": metadata(args),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument(
+        "--rag-action",
+        choices=["BasePreprocessing", "PyMuPDFPreprocessing"],
+        default="BasePreprocessing",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--ingest-repetitions", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--embedding-delay", type=float, default=0.0)
+    parser.add_argument("--prefill-delay", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument(
+        "--real-embeddings",
+        action="store_true",
+        help="Load the real embedding model instead of the hashing stub.",
+    )
+    parser.add_argument(
+        "--ann",
+        action="store_true",
+        help="Also search through the IVF-PQ index and report its recall@k.",
+    )
+    parser.add_argument("--nlist", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--rerank", type=int, default=64)
+    parser.add_argument("--min-train", type=int, default=256)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Earlier JSON result to compare with.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Exit with an error if a p95 grows by more than this factor.",
+    )
+    args = parser.parse_args()
+
+    result = run(args)
+    print_table(result["stages"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
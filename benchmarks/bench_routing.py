@@ -0,0 +1,112 @@
+"""
+Measure latency-aware routing and request hedging against stub backends.
+
+Starts two ``stub_ollama.StubOllama`` servers, a fast one with occasional
+slow requests and failures and a slower steady one, and sends
+``--requests`` distinct questions through ``RouterChatbot`` with and
+without hedging, then to the fast backend alone. Prints the time to the
+first token and to the full answer, failed requests and, per backend, the
+requests won and the hedges fired.
+
+    python benchmarks/bench_routing.py --requests 200 --output routing.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import metadata, print_table, summarize
+from benchmarks.stub_ollama import StubOllama
+
+
+def run(bot, requests: int, concurrency: int) -> dict:
+    def ask(i):
+        start = time.perf_counter()
+        first = None
+        try:
+            for token in bot.stream(context=None, question=f"Question {i}?"):
+                if first is None:
+                    first = time.perf_counter() - start
+        except Exception:
+            return None
+        return first, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(ask, range(requests)))
+    wall_time = time.perf_counter() - start
+    answered = [r for r in results if r is not None]
+    failed = len(results) - len(answered)
+    return {
+        "first_token": summarize([r[0] for r in answered], wall_time, failed=failed),
+        "answer": summarize([r[1] for r in answered], wall_time, failed=failed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--fast-delay", type=float, default=0.05)
+    parser.add_argument("--slow-delay", type=float, default=0.15)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--tail-delay", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    from services.chat import OllamaChatbot
+    from services.router import RouterChatbot
+
+    servers = [
+        StubOllama(
+            prefill_delay=args.fast_delay,
+            tail_rate=args.tail_rate,
+            tail_delay=args.tail_delay,
+            error_rate=args.error_rate,
+            parallel=args.concurrency,
+            seed=1,
+        ).start(),
+        StubOllama(
+            prefill_delay=args.slow_delay, parallel=args.concurrency, seed=2
+        ).start(),
+    ]
+
+    def backends():
+        # Fresh clients so the runs do not share coalesced generations
+        return [OllamaChatbot(name="stub:latest", host=s.url) for s in servers]
+
+    stages = {}
+    routers = {}
+    for label, hedge in (("hedged", True), ("routed", False)):
+        router = RouterChatbot(backends(), hedge=hedge, min_hedge_delay=0.1)
+        routers[label] = router
+        for kind, summary in run(router, args.requests, args.concurrency).items():
+            stages[f"{label}:{kind}"] = summary
+    single = backends()[0]
+    for kind, summary in run(single, args.requests, args.concurrency).items():
+        stages[f"fast only:{kind}"] = summary
+    for server in servers:
+        server.shutdown()
+
+    result = {"meta": metadata(args), "stages": stages, "backends": {}}
+    print_table(stages)
+    for label, router in routers.items():
+        result["backends"][label] = router.backend_stats()
+        for number, stats in enumerate(result["backends"][label]):
+            print(
+                f"{label:<8} backend {number}: {stats['wins']} won, "
+                f"{stats['hedges']} hedged, error rate {stats['error_rate']:.2f}"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure the cold start of the Streamlit pages.
+
+Each sample starts a fresh interpreter and runs a page once with
+Streamlit's ``AppTest``, headlessly, timing the module imports and the
+first complete run of the script (first paint). ``--rev`` measures another
+git revision as well, from a temporary worktree, to show the difference.
+
+    python benchmarks/bench_startup.py --rev HEAD~1 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import ROOT, compare, metadata, print_table, summarize
+
+SCRIPTS = ("app.py", "app_with_config.py", "pages/configuration.py")
+
+# Runs in the child interpreter, from the checkout being measured
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+painted = time.perf_counter()
+heavy = ("ollama", "chatbot_rag", "langchain_community", "pymupdf", "faiss")
+print(json.dumps({
+    "streamlit_import": imported - start,
+    "first_paint": painted - start,
+    "script_run": painted - imported,
+    "exceptions": [str(e.value) for e in at.exception],
+    "heavy_modules": sorted({m.split(".")[0] for m in sys.modules} & set(heavy)),
+}))
+"""
+
+
+def sample(checkout: str, script: str) -> dict:
+    env = dict(os.environ, METRICS_PORT="0", PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD, script],
+        cwd=checkout,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(checkout: str, scripts, repetitions: int) -> dict:
+    stages = {}
+    for script in scripts:
+        if not os.path.exists(os.path.join(checkout, script)):
+            continue
+        samples = [sample(checkout, script) for _ in range(repetitions)]
+        for key in ("first_paint", "script_run"):
+            stages[f"{script}:{key}"] = summarize(
+                [s[key] for s in samples],
+                exceptions=samples[-1]["exceptions"],
+                heavy_modules=samples[-1]["heavy_modules"],
+            )
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--script", action="append", help="Page to measure.")
+    parser.add_argument("--rev", help="Git revision to measure as the baseline.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+    scripts = args.script or SCRIPTS
+
+    result = {
+        "meta": metadata(args),
+        "stages": measure(ROOT, scripts, args.repetitions),
+    }
+    if args.rev:
+        worktree = tempfile.mkdtemp(prefix="bench_startup_")
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, args.rev],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+        )
+        try:
+            result["baseline"] = {
+                "meta": {"commit": args.rev},
+                "stages": measure(worktree, scripts, args.repetitions),
+            }
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree],
+                cwd=ROOT,
+                capture_output=True,
+            )
+
+    print_table(result["stages"])
+    for stage, summary in result["stages"].items():
+        if stage.endswith(":first_paint") and summary["heavy_modules"]:
+            print(f"{stage}: imported {', '.join(summary['heavy_modules'])}")
+    if args.rev:
+        print(f"\n{args.rev}:")
+        print_table(result["baseline"]["stages"])
+        compare(result, result["baseline"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Shared helpers of the benchmarks: latency summaries, run metadata and
+comparison of JSON results between versions.
+"""
+
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(latencies: list, wall_time: float = None, **extra) -> dict:
+    """
+    Latency percentiles in milliseconds and throughput in operations per
+    second; ``wall_time`` is the elapsed time of concurrent runs.
+    """
+    values = np.asarray(latencies, dtype=float)
+    wall_time = wall_time if wall_time is not None else float(values.sum())
+    summary = {
+        "count": int(values.size),
+        "p50_ms": float(np.percentile(values, 50) * 1000),
+        "p95_ms": float(np.percentile(values, 95) * 1000),
+        "p99_ms": float(np.percentile(values, 99) * 1000),
+        "mean_ms": float(values.mean() * 1000),
+        "max_ms": float(values.max() * 1000),
+        "throughput": float(values.size / wall_time) if wall_time else 0.0,
+    }
+    summary.update(extra)
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(args) -> dict:
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+    }
+
+
+def recall_at_k(found: list, exact: list) -> float:
+    """Mean fraction of the exact top-k results an approximate search found."""
+    hits = [len(set(f) & set(e)) / len(e) for f, e in zip(found, exact) if e]
+    return sum(hits) / len(hits) if hits else 1.0
+
+
+def print_table(stages: dict):
+    recall = any("recall_at_k" in summary for summary in stages.values())
+    header = f"{'stage':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9}"
+    print(header + (f" {'recall@k':>9}" if recall else ""))
+    for stage, summary in stages.items():
+        line = (
+            f"{stage:<22} {summary['p50_ms']:9.2f} {summary['p95_ms']:9.2f} "
+            f"{summary['p99_ms']:9.2f} {summary['throughput']:9.2f}"
+        )
+        if "recall_at_k" in summary:
+            line += f" {summary['recall_at_k']:9.3f}"
+        print(line)
+
+
+def compare(result: dict, baseline: dict, threshold: float = None) -> bool:
+    """
+    Print the latency and throughput ratios against a baseline result.
+    Returns:
+        bool: False if a stage's p95 grew by more than ``threshold``.
+    """
+    ok = True
+    print(f"\nAgainst {baseline['meta'].get('commit')}:")
+    for stage, new in result["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            continue
+        p95 = new["p95_ms"] / old["p95_ms"] if old["p95_ms"] else float("inf")
+        throughput = new["throughput"] / old["throughput"] if old["throughput"] else 0
+        flag = ""
+        if threshold is not None and p95 > threshold:
+            ok = False
+            flag = "  REGRESSION"
+        print(f"{stage:<22} p95 x{p95:6.2f}  throughput x{throughput:6.2f}{flag}")
+    return ok
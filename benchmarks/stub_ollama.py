@@ -0,0 +1,257 @@
+"""
+Minimal stand-in for an Ollama server, for benchmarks on a machine without
+models or a GPU.
+
+It implements the endpoints the app uses (``/api/tags``, ``/api/chat``,
+``/api/generate`` and ``/api/embed``) with deterministic answers and
+configurable latencies, and serializes generations like a single-slot
+Ollama server. Request counters are served at ``/stub/stats``.
+
+Run it standalone with ``python benchmarks/stub_ollama.py --port 11435`` and
+point the app at it with ``OLLAMA_HOST=http://127.0.0.1:11435``.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dimensions: int = 32) -> list:
+    digest = hashlib.sha256(text.encode()).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dimensions)]
+
+
+class StubOllama(ThreadingHTTPServer):
+    """
+    Args:
+        address (tuple): (host, port) to listen on; port 0 picks a free one.
+        models (list): Model names reported by ``/api/tags``.
+        prefill_delay (float): Seconds before the first token of an answer.
+        token_delay (float): Seconds between tokens.
+        answer_tokens (int): Tokens per answer.
+        embed_delay (float): Seconds per ``/api/embed`` call.
+        embed_item_delay (float): Extra seconds per embedded input.
+        parallel (int): Generations served at the same time.
+        error_rate (float): Fraction of generations answered with an error.
+        tail_rate (float): Fraction of generations delayed by ``tail_delay``.
+        tail_delay (float): Extra seconds before the first token of those.
+        seed: Seed of the error and tail draws.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        models=("stub:latest",),
+        prefill_delay: float = 0.2,
+        token_delay: float = 0.01,
+        answer_tokens: int = 20,
+        embed_delay: float = 0.02,
+        embed_item_delay: float = 0.001,
+        parallel: int = 1,
+        error_rate: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_delay: float = 1.0,
+        seed=0,
+    ):
+        super().__init__(address, _Handler)
+        self.models = list(models)
+        self.prefill_delay = prefill_delay
+        self.token_delay = token_delay
+        self.answer_tokens = answer_tokens
+        self.embed_delay = embed_delay
+        self.embed_item_delay = embed_item_delay
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_delay = tail_delay
+        self.random = random.Random(seed)
+        self.slots = threading.Semaphore(parallel)
+        self.loaded = set()
+        self.stats = {
+            "chat": 0,
+            "generate": 0,
+            "embed": 0,
+            "embedded": 0,
+            "errors": 0,
+            "cancelled": 0,
+        }
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str, amount: int = 1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        """Stop serving and close the listening socket."""
+        super().shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            now = datetime.now(timezone.utc).isoformat()
+            self._json(
+                {
+                    "models": [
+                        {"name": m, "model": m, "modified_at": now, "size": 0}
+                        for m in self.server.models
+                    ]
+                }
+            )
+        elif self.path == "/stub/stats":
+            with self.server.stats_lock:
+                self._json(dict(self.server.stats, loaded=sorted(self.server.loaded)))
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        request = self._body()
+        if self.path == "/api/embed":
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.server.count("embed")
+            self.server.count("embedded", len(inputs))
+            time.sleep(
+                self.server.embed_delay + self.server.embed_item_delay * len(inputs)
+            )
+            self._json(
+                {
+                    "model": request.get("model"),
+                    "embeddings": [fake_embedding(text) for text in inputs],
+                }
+            )
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._generate(request, chat=self.path == "/api/chat")
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def _generate(self, request: dict, chat: bool):
+        server = self.server
+        server.count("chat" if chat else "generate")
+        model = request.get("model")
+        if chat:
+            prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+        else:
+            prompt = request.get("prompt", "")
+        # An empty prompt only loads the model, as with the real server
+        if not prompt:
+            server.loaded.add(model)
+            self._json({"model": model, "response": "", "done": True})
+            return
+
+        words = [
+            f"w{b}"
+            for b in hashlib.sha256(prompt.encode()).digest()[: server.answer_tokens]
+        ]
+        stream = request.get("stream", True)
+        with server.stats_lock:
+            fail = server.random.random() < server.error_rate
+            slow = server.random.random() < server.tail_rate
+        if fail:
+            server.count("errors")
+            self._json({"error": "stub failure"}, 500)
+            return
+        with server.slots:
+            server.loaded.add(model)
+            time.sleep(server.prefill_delay + (server.tail_delay if slow else 0))
+            if not stream:
+                time.sleep(server.token_delay * len(words))
+                self._json(self._chunk(model, " ".join(words), chat, done=True))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, word in enumerate(words):
+                    time.sleep(server.token_delay)
+                    text = word if i == 0 else " " + word
+                    self._write_chunk(self._chunk(model, text, chat, done=False))
+                self._write_chunk(self._chunk(model, "", chat, done=True))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client cancelled the request; free the slot
+                server.count("cancelled")
+                self.close_connection = True
+
+    @staticmethod
+    def _chunk(model, text, chat, done):
+        payload = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": done,
+        }
+        if chat:
+            payload["message"] = {"role": "assistant", "content": text}
+        else:
+            payload["response"] = text
+        return payload
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", action="append", default=None)
+    parser.add_argument("--prefill-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-delay", type=float, default=1.0)
+    args = parser.parse_args()
+    server = StubOllama(
+        (args.host, args.port),
+        models=args.model or ["stub:latest"],
+        prefill_delay=args.prefill_delay,
+        token_delay=args.token_delay,
+        parallel=args.parallel,
+        error_rate=args.error_rate,
+        tail_rate=args.tail_rate,
+        tail_delay=args.tail_delay,
+    )
+    print(f"Stub Ollama listening on {server.url}")
+    server.serve_forever()
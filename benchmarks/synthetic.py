@@ -0,0 +1,140 @@
+"""
+Deterministic stand-ins for the parts of the pipeline that need models or
+network access: synthetic PDFs, a hashing embedding model and a chatbot
+with a fixed latency profile.
+"""
+
+import hashlib
+import os
+import random
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Embedding model chatbot_rag's RAG loads by default
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+_VOCABULARY = (
+    "retrieval augmented generation document index vector embedding chunk "
+    "query answer model context token latency throughput cache memory disk "
+    "page table image text section report policy contract invoice budget "
+    "revenue customer product service network server process thread queue "
+    "agua casa tiempo trabajo sistema datos proyecto empresa cliente informe"
+).split()
+
+
+def make_text(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentence = " ".join(rng.choice(_VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def make_pdfs(
+    directory: str, files: int = 2, pages: int = 10, words_per_page: int = 300, seed=0
+) -> list:
+    """
+    Write ``files`` PDFs of ``pages`` pages of pseudo-random text.
+
+    The same arguments always give the same text, and different seeds give
+    different files, so cache behaviour can be controlled.
+    Returns:
+        list: Paths of the written files.
+    """
+    import pymupdf
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number in range(files):
+        rng = random.Random(f"{seed}-{number}")
+        path = os.path.join(directory, f"synthetic_{seed}_{number}.pdf")
+        with pymupdf.open() as document:
+            for _ in range(pages):
+                page = document.new_page()
+                page.insert_textbox(
+                    page.rect + (50, 50, -50, -50),
+                    make_text(rng, words_per_page),
+                    fontsize=8,
+                )
+            document.save(path)
+        paths.append(path)
+    return paths
+
+
+def make_questions(count: int, seed=0) -> list:
+    rng = random.Random(f"questions-{seed}")
+    return [make_text(rng, rng.randint(6, 14)).rstrip(".") + "?" for _ in range(count)]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Bag of hashed words, L2-normalized: no model download, stable across runs.
+    Args:
+        dimensions (int): Size of the vectors.
+        delay (float): Seconds spent per embedded text, to mimic a model.
+    """
+
+    def __init__(self, dimensions: int = 384, delay: float = 0.0):
+        self.dimensions = dimensions
+        self.delay = delay
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        if self.delay:
+            time.sleep(self.delay * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+class StubChatbot:
+    """
+    Chatbot answering with a digest of its prompt after a fixed delay.
+
+    It follows the interface ``BotScheduler`` relies on: ``stream``,
+    ``__call__``, ``_posprocessing_answer`` and a ``name``.
+    Args:
+        name (str): Model name reported to the caches.
+        prefill_delay (float): Seconds before the first token.
+        token_delay (float): Seconds between tokens.
+        tokens (int): Tokens per answer.
+    """
+
+    def __init__(
+        self,
+        name: str = "stub",
+        prefill_delay: float = 0.05,
+        token_delay: float = 0.002,
+        tokens: int = 32,
+    ):
+        self.name = name
+        self.prefill_delay = prefill_delay
+        self.token_delay = token_delay
+        self.tokens = tokens
+
+    def stream(self, context: str, question: str):
+        prompt = f"{context or ''}\n{question}"
+        digest = hashlib.sha256(prompt.encode()).hexdigest()
+        time.sleep(self.prefill_delay)
+        for i in range(self.tokens):
+            time.sleep(self.token_delay)
+            yield f"{digest[i % len(digest)]} "
+
+    def __call__(self, context: str, question: str) -> str:
+        return self._posprocessing_answer("".join(self.stream(context, question)))
+
+    def _posprocessing_answer(self, answer: str) -> str:
+        return answer.strip()
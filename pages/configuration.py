@@ -1,16 +1,19 @@
 import streamlit as st
+import os
 import time
-import ollama
-from chatbot_rag.chat import OllamaChatbot, HuggingFaceChatbot
+from services.models import get_model_catalog
+from services.warmup import get_model_warmer
 
 st.set_page_config(page_title="Configuration")
 st.title("Configuration")
 st.markdown("## Host Configuration")
 host = st.selectbox(label="Host", options=["Ollama", "Hugginface"], index=1)
 if host == "Ollama":
-    model_name = st.selectbox(
-        "Model:", options=[model.model for model in ollama.list()["models"]]
-    )
+    try:
+        model_name = st.selectbox("Model:", options=get_model_catalog().models())
+    except ConnectionError:
+        st.error("Could not connect to Ollama. Make sure it's installed and running.")
+        model_name = st.text_input(label="Model Name", value="llama3.1:8b")
     token = None
     provider = None
 
@@ -20,6 +23,36 @@ elif host == "Hugginface":
     token = st.text_input(label="Token", value="")
     provider = st.text_input(label="Provider", value="hyperbolic")
 
+with st.expander("Fallback backend"):
+    st.write(
+        "Requests go to whichever backend currently answers fastest; "
+        "a slow request can be hedged on the other one."
+    )
+    use_fallback = st.checkbox("Route across a second backend", value=False)
+    fallback_host = st.selectbox(
+        "Fallback host", options=["Ollama", "Hugginface"], key="fallback_host"
+    )
+    fallback = {
+        "host": fallback_host,
+        "model_name": st.text_input("Fallback model name", key="fallback_model"),
+    }
+    if fallback_host == "Ollama":
+        fallback["server"] = (
+            st.text_input("Ollama server URL", placeholder="http://127.0.0.1:11434")
+            or None
+        )
+    else:
+        fallback["token"] = st.text_input("Fallback token", value="")
+        fallback["provider"] = st.text_input("Fallback provider", value="hyperbolic")
+    hedge = st.checkbox(
+        "Hedge slow requests",
+        value=True,
+        help="Also send a request to the other backend when the first one "
+        "is slower than usual, and keep whichever answers first.",
+    )
+    if not use_fallback or not fallback["model_name"]:
+        fallback = None
+
 st.markdown("## RAG configuration")
 rag_action = st.selectbox(
     "RAG Actions:", ["BasePreprocessing", "PyMuPDFPreprocessing"], index=0
@@ -33,26 +66,85 @@ if rag_action == "PyMuPDFPreprocessing":
             st.warning("You must have Tesseract installed and configured.")
             tesseract_path = st.text_input("Tesseract Path")
         extract_tables = st.checkbox("Extract tables", value=False)
+        workers = st.number_input(
+            "Worker processes", min_value=1, value=os.cpu_count() or 1
+        )
+
+vector_index = st.selectbox(
+    "Vector index:",
+    ["Exact", "IVF-PQ"],
+    index=0,
+    help="IVF-PQ searches large document sets faster, approximately.",
+)
+ann = None
+if vector_index == "IVF-PQ":
+    with st.expander("IVF-PQ Configuration"):
+        st.write(
+            "More clusters searched and more candidates re-scored "
+            "give better results and slower searches."
+        )
+        ann = {
+            "nlist": st.number_input("Clusters", min_value=1, value=256),
+            "nprobe": st.number_input(
+                "Clusters searched per query", min_value=1, value=8
+            ),
+            "m": st.number_input("Sub-vectors per embedding", min_value=1, value=16),
+            "rerank": st.number_input(
+                "Candidates re-scored exactly", min_value=0, value=64
+            ),
+        }
+
+hybrid = st.checkbox(
+    "Hybrid search (keywords + embeddings)",
+    value=True,
+    help="Also match exact words such as part numbers and error codes.",
+)
+rerank = st.checkbox(
+    "Rerank results",
+    value=False,
+    disabled=not hybrid,
+    help="Put the chunks that contain more of the question first.",
+)
 
 st.session_state.rag_config = {
     "rag_action": rag_action,
     "extract_images": extract_images if rag_action == "PyMuPDFPreprocessing" else False,
     "extract_tables": extract_tables if rag_action == "PyMuPDFPreprocessing" else False,
     "tesseract_path": tesseract_path if rag_action == "PyMuPDFPreprocessing" else None,
+    "workers": workers if rag_action == "PyMuPDFPreprocessing" else None,
+    "ann": ann,
+    "hybrid": hybrid,
+    "rerank": rerank,
 }
 
 
-def load_bot(host, model_name, token=None, provider=None):
-    if host == "Ollama":
-        st.session_state.bot = OllamaChatbot(name=model_name)
-    elif host == "Hugginface":
-        st.session_state.bot = HuggingFaceChatbot(
-            model_name=model_name, token=token, provider=provider
-        )
+def load_bot(host, model_name, token=None, provider=None, fallback=None, hedge=True):
+    # Imports the chat backends, only once a model is chosen
+    from services.chat import load_chatbot
+    from services.router import load_router
+
+    previous = st.session_state.get("bot_lease")
+    primary = dict(host=host, model_name=model_name, token=token, provider=provider)
+    if fallback:
+        st.session_state.bot_lease = load_router([primary, fallback], hedge=hedge)
+    else:
+        st.session_state.bot_lease = load_chatbot(**primary)
+    st.session_state.bot = st.session_state.bot_lease.value
+    if previous is not None:
+        previous.release()
+    # Loads the models now rather than on the first question
+    get_model_warmer().warm(st.session_state.bot)
 
 
 if st.button("Save Configuration"):
-    load_bot(host=host, model_name=model_name, token=token, provider=provider)
+    load_bot(
+        host=host,
+        model_name=model_name,
+        token=token,
+        provider=provider,
+        fallback=fallback,
+        hedge=hedge,
+    )
 
     st.success("Configuration saved!")
     time.sleep(2)
@@ -0,0 +1,304 @@
+import numpy as np
+
+
+def _squared_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return (
+        (x * x).sum(1)[:, None]
+        - 2 * x @ centroids.T
+        + (centroids * centroids).sum(1)[None, :]
+    )
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, block: int = 4096) -> np.ndarray:
+    # In blocks, so the distance matrix stays small for large inputs
+    assign = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), block):
+        distances = _squared_distances(x[start : start + block], centroids)
+        assign[start : start + block] = distances.argmin(1)
+    return assign
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 10, rng=None) -> np.ndarray:
+    """
+    Lloyd's k-means; empty clusters are reseeded with random points.
+    Returns:
+        np.ndarray: The ``(k, d)`` centroids.
+    """
+    rng = rng or np.random.default_rng(0)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()))]
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Approximate nearest-neighbour index: inverted lists of product-quantized
+    vectors (IVF-PQ), in NumPy.
+
+    Vectors are assigned to the nearest of ``nlist`` k-means centroids; the
+    residual to that centroid is split into ``m`` sub-vectors, each stored
+    as the byte of its nearest of 256 sub-centroids. A query only scans the
+    ``nprobe`` lists closest to it, computing distances from per-list lookup
+    tables, and the best ``rerank`` candidates are re-scored exactly, so
+    distances match the exact (L2) search. More probes and candidates
+    raise recall and latency.
+
+    The index trains itself once it holds ``min_train`` vectors, and trains
+    again when it has grown ``retrain_growth`` times since; until then it
+    searches exactly, which is fast at that size anyway. Vectors can be
+    added and removed by id at any time.
+
+    The full vectors, used for training and re-scoring, can be read from a
+    memory-mapped array with ``attach`` instead of being held in the heap;
+    they are copied back the first time vectors are added.
+    Args:
+        nlist (int): Number of inverted lists (coarse clusters).
+        nprobe (int): Lists scanned per query.
+        m (int): Sub-vectors per vector; lowered to a divisor of the dimension.
+        rerank (int): Candidates re-scored with the full vectors; 0 disables.
+        min_train (int): Vectors needed before the index is trained.
+        retrain_growth (float): Growth factor that triggers a new training.
+        seed (int): Seed of the training samples.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        m: int = 16,
+        rerank: int = 64,
+        min_train: int = 2048,
+        retrain_growth: float = 4.0,
+        seed: int = 0,
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.m = m
+        self.rerank = rerank
+        self.min_train = min_train
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.centroids = None
+        self.codebooks = None  # (m, 256, dimension / m)
+        self.trained_size = 0
+        self._vectors = None
+        self._external = False  # _vectors is a read-only array we do not own
+        self._ids = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = {}  # id -> row of _vectors
+        self._lists = []  # per list: (rows, codes)
+        self._size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the index."""
+        size = 0
+        if self._vectors is not None and not self._external:
+            size = self._vectors.nbytes
+        size += self._alive.nbytes + 100 * (len(self._rows) + len(self._ids))
+        for rows, codes in self._lists:
+            size += rows.nbytes + codes.nbytes
+        return size
+
+    def add(self, ids: list, vectors):
+        """
+        Add vectors under their ids; an id already present is replaced.
+        """
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        self.remove([_id for _id in ids if _id in self._rows])
+        if self._vectors is None:
+            self._vectors = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        needed = self._size + len(ids)
+        if needed > len(self._vectors) or self._external:
+            capacity = max(needed, 2 * len(self._vectors), 1024)
+            grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            grown[: self._size] = self._vectors[: self._size]
+            self._vectors = grown
+            self._external = False
+            self._alive = np.concatenate(
+                [self._alive, np.zeros(capacity - len(self._alive), dtype=bool)]
+            )
+        rows = np.arange(self._size, needed)
+        self._vectors[rows] = vectors
+        self._alive[rows] = True
+        self._ids.extend(ids)
+        self._rows.update(zip(ids, rows.tolist()))
+        self._size = needed
+
+        if not self.is_trained:
+            if len(self) >= self.min_train:
+                self.train()
+        elif len(self) > self.retrain_growth * self.trained_size:
+            self.train()
+        else:
+            self._assign(rows)
+
+    def remove(self, ids: list):
+        """
+        Remove vectors by id; unknown ids are ignored.
+        """
+        for _id in ids:
+            row = self._rows.pop(_id, None)
+            if row is not None:
+                self._alive[row] = False
+        # Rows are reclaimed once most of them are dead
+        if self._size > 1024 and len(self) < self._size // 2:
+            self._compact()
+
+    def _compact(self):
+        alive = np.flatnonzero(self._alive[: self._size])
+        self._vectors = self._vectors[alive].copy()
+        self._external = False
+        self._ids = [self._ids[row] for row in alive]
+        self._alive = np.ones(len(alive), dtype=bool)
+        self._rows = {_id: row for row, _id in enumerate(self._ids)}
+        self._size = len(alive)
+        if self.is_trained:
+            self._lists = [
+                (np.empty(0, dtype=np.int64), np.empty((0, self.m), dtype=np.uint8))
+                for _ in range(len(self.centroids))
+            ]
+            self._assign(np.arange(self._size))
+
+    def attach(self, ids: list, vectors: np.ndarray):
+        """
+        Read the full vectors from ``vectors`` from now on, e.g. the mapped
+        array of a ``MappedVectorStore``, and drop the copy held so far.
+        Args:
+            ids (list): Id of each row of ``vectors``; the same ids as the
+                index holds.
+            vectors (np.ndarray): ``(n, d)`` float32 vectors. A read-only
+                array is never written to and not counted in ``memory_bytes``.
+        """
+        position = {_id: row for row, _id in enumerate(ids)}
+        remap = np.full(self._size, -1, dtype=np.int64)
+        alive = np.flatnonzero(self._alive[: self._size])
+        remap[alive] = [position[self._ids[row]] for row in alive]
+        lists = []
+        for rows, codes in self._lists:
+            rows = remap[rows]
+            kept = rows >= 0
+            lists.append((rows[kept], codes[kept]))
+        self._lists = lists
+        self._alive = np.zeros(len(ids), dtype=bool)
+        self._alive[remap[alive]] = True
+        self._rows = {_id: position[_id] for _id in self._rows}
+        self._ids = list(ids)
+        self._size = len(ids)
+        self._vectors = vectors
+        self._external = not vectors.flags.writeable
+
+    def __getstate__(self):
+        # Vectors read from a mapped store are attached again, not pickled
+        state = dict(self.__dict__)
+        if self._external:
+            state["_vectors"] = None
+        return state
+
+    def train(self):
+        """
+        Learn the coarse centroids and the sub-vector codebooks from the
+        vectors currently held, and encode all of them.
+        """
+        rng = np.random.default_rng(self.seed)
+        alive = np.flatnonzero(self._alive[: self._size])
+        dimension = self._vectors.shape[1]
+        self.m = max(
+            d for d in range(1, min(self.m, dimension) + 1) if dimension % d == 0
+        )
+        nlist = max(1, min(self.nlist, len(alive) // 39))
+        sample = self._vectors[
+            rng.choice(alive, min(len(alive), nlist * 64), replace=False)
+        ]
+
+        self.centroids = kmeans(sample, nlist, rng=rng)
+        residuals = sample - self.centroids[_nearest(sample, self.centroids)]
+        ksub = min(256, len(sample))
+        subvectors = residuals.reshape(len(sample), self.m, -1)
+        self.codebooks = np.stack(
+            [kmeans(subvectors[:, j], ksub, rng=rng) for j in range(self.m)]
+        )
+        self.trained_size = len(alive)
+        self._lists = [
+            (np.empty(0, dtype=np.int64), np.empty((0, self.m), dtype=np.uint8))
+            for _ in range(nlist)
+        ]
+        self._assign(alive)
+
+    def _assign(self, rows: np.ndarray):
+        vectors = self._vectors[rows]
+        lists = _nearest(vectors, self.centroids)
+        subvectors = (vectors - self.centroids[lists]).reshape(len(rows), self.m, -1)
+        codes = np.stack(
+            [_nearest(subvectors[:, j], self.codebooks[j]) for j in range(self.m)],
+            axis=1,
+        ).astype(np.uint8)
+        for number in np.unique(lists):
+            members = lists == number
+            old_rows, old_codes = self._lists[number]
+            self._lists[number] = (
+                np.concatenate([old_rows, rows[members]]),
+                np.concatenate([old_codes, codes[members]]),
+            )
+
+    def search(self, vector, k: int = 4) -> list:
+        """
+        Ids of the ``k`` vectors nearest to ``vector`` (L2), best first.
+        """
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        if not len(self):
+            return []
+        if not self.is_trained:
+            rows = np.flatnonzero(self._alive[: self._size])
+            return self._exact(query, rows, k)
+
+        coarse = ((self.centroids - query) ** 2).sum(1)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probed = np.argpartition(coarse, nprobe - 1)[:nprobe]
+        rows, distances = [], []
+        for number in probed:
+            list_rows, codes = self._lists[number]
+            if not len(list_rows):
+                continue
+            residual = (query - self.centroids[number]).reshape(self.m, 1, -1)
+            table = ((self.codebooks - residual) ** 2).sum(-1)  # (m, 256)
+            rows.append(list_rows)
+            distances.append(table[np.arange(self.m), codes].sum(1))
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+        distances = np.concatenate(distances)
+        alive = self._alive[rows]
+        rows, distances = rows[alive], distances[alive]
+
+        keep = max(k, self.rerank)
+        if len(rows) > keep:
+            best = np.argpartition(distances, keep - 1)[:keep]
+            rows, distances = rows[best], distances[best]
+        if self.rerank:
+            return self._exact(query, rows, k)
+        order = np.argsort(distances)[:k]
+        return [self._ids[row] for row in rows[order]]
+
+    def _exact(self, query: np.ndarray, rows: np.ndarray, k: int) -> list:
+        distances = ((self._vectors[rows] - query) ** 2).sum(1)
+        if len(rows) > k:
+            best = np.argpartition(distances, k - 1)[:k]
+            rows, distances = rows[best], distances[best]
+        return [self._ids[row] for row in rows[np.argsort(distances)]]
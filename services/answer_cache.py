@@ -0,0 +1,144 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so trivially different spellings share a cache entry.
+
+    Applies NFKC, case folding, whitespace collapsing and strips the
+    surrounding punctuation (including the Spanish ``¿`` and ``¡``).
+    """
+    question = unicodedata.normalize("NFKC", question).casefold()
+    question = re.sub(r"\s+", " ", question)
+    return question.strip(" ¿?¡!.,;:")
+
+
+class _Entry:
+    __slots__ = ("answer", "created", "vector")
+
+    def __init__(self, answer, vector):
+        self.answer = answer
+        self.created = time.monotonic()
+        self.vector = vector
+
+
+class AnswerCache:
+    """
+    Cache of chatbot answers keyed by model, document set and question.
+
+    Lookups first try the normalized question exactly. If a similarity
+    threshold is set and an embedding function is given, they then fall
+    back to the cached question of the same model and document set whose
+    embedding is closest by cosine similarity. Entries expire after ``ttl``
+    seconds and the least recently used ones are evicted beyond
+    ``max_entries``.
+    Args:
+        max_entries (int): Maximum number of cached answers.
+        ttl (float): Seconds an answer stays valid.
+        similarity_threshold (float): Minimum cosine similarity for a
+            semantic hit, or None for exact matches only.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        similarity_threshold: float = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, entry) -> bool:
+        return time.monotonic() - entry.created > self.ttl
+
+    def _vector(self, question: str, embed):
+        if embed is None or self.similarity_threshold is None:
+            return None
+        vector = np.asarray(embed(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, model: str, fingerprint, question: str, embed=None):
+        """
+        Look up the answer to a question.
+        Args:
+            model (str): Identifies the chatbot that produced the answers.
+            fingerprint (hashable): Identifies the document set, or None.
+            question (str): The user's question.
+            embed (callable): Maps a text to its embedding; enables semantic
+                lookups when a similarity threshold is set.
+        Returns:
+            str: The cached answer, or None on a miss.
+        """
+        scope = (model, fingerprint)
+        key = scope + (normalize_question(question),)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer
+
+        vector = self._vector(key[2], embed)
+        if vector is not None:
+            with self._lock:
+                candidates = [
+                    (candidate, entry)
+                    for candidate, entry in self._entries.items()
+                    if candidate[:2] == scope
+                    and entry.vector is not None
+                    and not self._expired(entry)
+                ]
+                if candidates:
+                    scores = (
+                        np.stack([entry.vector for _, entry in candidates]) @ vector
+                    )
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        candidate, entry = candidates[best]
+                        self._entries.move_to_end(candidate)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        return entry.answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model: str, fingerprint, question: str, answer: str, embed=None):
+        """
+        Store the answer to a question. Arguments are as in ``get``.
+        """
+        normalized = normalize_question(question)
+        entry = _Entry(answer, self._vector(normalized, embed))
+        with self._lock:
+            self._entries[(model, fingerprint, normalized)] = entry
+            self._entries.move_to_end((model, fingerprint, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
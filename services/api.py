@@ -0,0 +1,803 @@
+"""
+Headless HTTP API over the same services as the Streamlit pages.
+
+    python -m services.api --port 8600 --model llama3.1:8b
+
+Endpoints (JSON unless noted):
+
+    GET    /health
+    GET    /metrics                                  Prometheus text
+    GET    /v1/workspaces/{ws}/documents
+    PUT    /v1/workspaces/{ws}/documents/{name}      raw PDF body
+    DELETE /v1/workspaces/{ws}/documents/{name}
+    POST   /v1/workspaces/{ws}/ingest                {"rag_action", "preprocessing", "ann",
+                                                      "hybrid", "rerank"}
+    GET    /v1/jobs/{id}
+    DELETE /v1/jobs/{id}                             cancel
+    POST   /v1/workspaces/{ws}/query                 {"question", "k", "hybrid", "rerank"}
+    POST   /v1/workspaces/{ws}/answer                {"question", "history", "stream",
+                                                      "model", ...}
+
+``model`` picks one of the model names the server allows (``--allow-model``);
+the backend, server and token are the server's own. Likewise ``preprocessing``
+only takes ``extract_images``, ``extract_tables``, ``workers``, ``chunks_size``
+and ``chunk_overlap``: the Tesseract path and the embedding model are the
+server's (``--tesseract-path``, ``--embedding-model``).
+
+Streamed answers are sent as chunked NDJSON: one ``{"token": ...}`` line
+per token and a last ``{"done": true, "answer": ...}`` line.
+"""
+
+import argparse
+import asyncio
+import functools
+import http
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from services.context import ContextPacker
+from services.history import Message
+from services.index_cache import IndexCache
+from services.indexing import INGEST_STAGES, load_shared_index, remember_digest
+from services.jobs import JobCancelled, JobQueue
+from services.retrieval_cache import RetrievalCache
+from services.scheduler import BotScheduler, Overloaded
+from services.telemetry import Tracer, export_stats, short_digest
+from services.uploads import BlobStore
+from services.vector_store import VectorStoreCache, get_vector_stores
+from services.warmup import get_model_warmer
+from services.workspaces import WorkspaceStore
+
+_NAME = re.compile(r"^[^/\\]{1,200}\.pdf$", re.IGNORECASE)
+
+RAG_ACTIONS = ("BasePreprocessing", "PyMuPDFPreprocessing")
+
+# Preprocessing options clients may set, with the values they may take
+PREPROCESSING_OPTIONS = {
+    "extract_images": (bool,),
+    "extract_tables": (bool,),
+    "workers": (int, 1, 64),
+    "chunks_size": (int, 64, 8192),
+    "chunk_overlap": (int, 0, 4096),
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method: str, target: str, headers: dict, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = unquote(url.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body  # binary file object
+
+    def json(self) -> dict:
+        raw = self.body.read()
+        if not raw:
+            return {}
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            raise HTTPError(400, "The body is not valid JSON.")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The body must be a JSON object.")
+        return data
+
+
+class Response:
+    def __init__(self, status: int = 200, body: bytes = b"", content_type=None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type or "application/json"
+
+    @classmethod
+    def json(cls, data, status: int = 200):
+        return cls(status, json.dumps(data).encode())
+
+
+class StreamingResponse:
+    """A response sent with chunked encoding from an async iterator of bytes."""
+
+    def __init__(self, chunks, status: int = 200, content_type=None):
+        self.status = status
+        self.chunks = chunks
+        self.content_type = content_type or "application/x-ndjson"
+
+
+def _head(status: int, headers: dict) -> bytes:
+    lines = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class HTTPServer:
+    """
+    Small HTTP/1.1 server on asyncio streams.
+
+    Connections are kept alive between requests until the client closes
+    them, asks for ``Connection: close`` or stays idle ``keep_alive``
+    seconds. Request bodies are spooled to disk beyond 1 MB and refused
+    beyond ``max_body``. Routes are ``(method, pattern)`` pairs whose
+    named groups are passed to the handler.
+    Args:
+        keep_alive (float): Seconds an idle connection is kept open.
+        max_body (int): Largest accepted request body, in bytes.
+    """
+
+    def __init__(self, keep_alive: float = 75, max_body: int = 512 << 20):
+        self.keep_alive = keep_alive
+        self.max_body = max_body
+        self.routes = []
+        self.connections = 0
+        self.requests = 0
+        self._handlers = {}  # Connection task -> its writer
+
+    def route(self, method: str, pattern: str, handler):
+        self.routes.append((method, re.compile(f"^{pattern}$"), handler))
+
+    async def _read_request(self, reader):
+        line = await asyncio.wait_for(reader.readline(), self.keep_alive)
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line.")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", ""):
+            raise HTTPError(411, "Send a Content-Length.")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Malformed Content-Length.")
+        if length < 0:
+            raise HTTPError(400, "Malformed Content-Length.")
+        if length > self.max_body:
+            raise HTTPError(413, "The body is too large.")
+        body = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+        while length:
+            block = await reader.readexactly(min(length, 1 << 16))
+            body.write(block)
+            length -= len(block)
+        body.seek(0)
+        request = Request(method, target, headers, body)
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            request.keep_alive = connection == "keep-alive"
+        else:
+            request.keep_alive = connection != "close"
+        return request
+
+    async def _dispatch(self, request: Request):
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            return await handler(request, **match.groupdict())
+        if allowed:
+            raise HTTPError(405, "Method not allowed.")
+        raise HTTPError(404, "Not found.")
+
+    async def _respond(self, writer, response, keep_alive: bool):
+        headers = {
+            "Content-Type": response.content_type,
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        if isinstance(response, StreamingResponse):
+            headers["Transfer-Encoding"] = "chunked"
+            headers["Cache-Control"] = "no-cache"
+            writer.write(_head(response.status, headers))
+            try:
+                async for chunk in response.chunks:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    await writer.drain()
+            finally:
+                # Also runs when the client went away mid-answer
+                await response.chunks.aclose()
+            writer.write(b"0\r\n\r\n")
+        else:
+            headers["Content-Length"] = str(len(response.body))
+            writer.write(_head(response.status, headers) + response.body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers[task] = writer
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    response = Response.json({"error": str(e)}, e.status)
+                    await self._respond(writer, response, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self.requests += 1
+                try:
+                    response = await self._dispatch(request)
+                except HTTPError as e:
+                    response = Response.json({"error": str(e)}, e.status)
+                except Overloaded as e:
+                    response = Response.json({"error": str(e)}, 503)
+                except TimeoutError as e:
+                    response = Response.json({"error": str(e)}, 504)
+                except Exception as e:
+                    response = Response.json({"error": f"{type(e).__name__}: {e}"}, 500)
+                finally:
+                    request.body.close()
+                await self._respond(writer, response, request.keep_alive)
+                if not request.keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            del self._handlers[task]
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, RuntimeError):
+                # The client went away first, or the loop is stopping
+                pass
+
+    async def close(self):
+        """Close the open connections and wait for their handlers to end."""
+        for writer in list(self._handlers.values()):
+            # An idle connection reads end of file; a busy one fails to write
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class _Workspace:
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.index = None  # Lease of the IncrementalIndex
+        self.config = {}
+        self.job = None
+        self.last_used = time.monotonic()
+
+
+class ChatService:
+    """
+    Ingestion, retrieval and answering behind the HTTP API.
+
+    It works on the same objects as the Streamlit pages: chatbots and
+    indexes come from the process-wide pool, answers go through a
+    ``BotScheduler`` and searches through a ``RetrievalCache``, so when it
+    is started inside the Streamlit process (``API_PORT``) both share them.
+    Blocking work runs on a pool of ``workers`` threads; beyond
+    ``max_queue`` waiting calls, requests are turned away with 503.
+    Clients choose among the ``models`` by name only; every other chatbot
+    argument is the server's, as are the ``preprocessing`` arguments clients
+    cannot set (see ``PREPROCESSING_OPTIONS``). The state of workspaces idle for longer than
+    the ``WorkspaceStore``'s ``max_idle`` is dropped with its index.
+    Args:
+        bot (dict): ``load_chatbot`` arguments of the default model.
+        models (list): Model names clients may ask for, besides the default.
+        preprocessing (dict): Server-side preprocessing arguments, such as
+            ``tesseract_path`` and the embedding model's ``name_model``.
+        workers (int): Threads running blocking work.
+        max_queue (int): Calls allowed to wait for a thread.
+        workspaces, blob_store, index_cache, vector_stores, job_queue,
+        scheduler, retrieval, packer, tracer: Shared services; new ones by
+            default, except the process-wide ``vector_stores``.
+    """
+
+    def __init__(
+        self,
+        bot: dict = None,
+        models: list = None,
+        preprocessing: dict = None,
+        workers: int = 16,
+        max_queue: int = 64,
+        workspaces: WorkspaceStore = None,
+        blob_store: BlobStore = None,
+        index_cache: IndexCache = None,
+        vector_stores: VectorStoreCache = None,
+        job_queue: JobQueue = None,
+        scheduler: BotScheduler = None,
+        retrieval: RetrievalCache = None,
+        packer: ContextPacker = None,
+        tracer: Tracer = None,
+    ):
+        self.bot = bot or {"host": "Ollama", "model_name": "llama3.1:8b"}
+        self.models = {self.bot["model_name"], *(models or ())}
+        self.preprocessing = preprocessing or {}
+        self.workers = workers
+        self.max_queue = max_queue
+        self.workspaces = workspaces or WorkspaceStore(root="./workspaces")
+        self.blob_store = blob_store or BlobStore(root="./cache/blobs")
+        self.index_cache = index_cache or IndexCache(root="./cache/indexes")
+        self.vector_stores = vector_stores or get_vector_stores()
+        self.job_queue = job_queue or JobQueue(workers=2)
+        self.scheduler = scheduler or BotScheduler(limits={"ollama": 2})
+        self.retrieval = retrieval or RetrievalCache()
+        self.packer = packer or ContextPacker()
+        self.tracer = tracer or Tracer()
+        export_stats(
+            self.tracer.metrics, scheduler=self.scheduler, retrieval=self.retrieval
+        )
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="api")
+        self._pending = 0
+        self._states = {}
+        self._pruned = time.monotonic()
+        self._bots = {}
+        self._bots_lock = threading.Lock()
+        self._serving = None  # Server and thread started by serve_api
+
+        self.http = HTTPServer()
+        ws = r"/v1/workspaces/(?P<name>[A-Za-z0-9_-]{1,64})"
+        self.http.route("GET", "/health", self.health)
+        self.http.route("GET", "/metrics", self.metrics)
+        self.http.route("GET", f"{ws}/documents", self.list_documents)
+        self.http.route("PUT", f"{ws}/documents/(?P<filename>[^/]+)", self.put_document)
+        self.http.route(
+            "DELETE", f"{ws}/documents/(?P<filename>[^/]+)", self.delete_document
+        )
+        self.http.route("POST", f"{ws}/ingest", self.ingest)
+        self.http.route("GET", r"/v1/jobs/(?P<job_id>\d+)", self.get_job)
+        self.http.route("DELETE", r"/v1/jobs/(?P<job_id>\d+)", self.cancel_job)
+        self.http.route("POST", f"{ws}/query", self.query)
+        self.http.route("POST", f"{ws}/answer", self.answer)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run blocking work on the worker pool, or refuse it when saturated."""
+        if self._pending >= self.workers + self.max_queue:
+            raise Overloaded("The server is busy, please try again in a moment.")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            self._pending -= 1
+
+    def _state(self, name: str) -> _Workspace:
+        self._prune_states()
+        state = self._states.get(name)
+        if state is None:
+            state = self._states[name] = _Workspace(self.workspaces.open(name))
+        state.last_used = time.monotonic()
+        state.workspace.touch()
+        job = state.job
+        if job is not None and job.done:
+            state.job = None
+            if job.status == "done":
+                previous, state.index = state.index, job.result
+                if previous is not None:
+                    previous.release()
+        return state
+
+    def _prune_states(self, interval: float = 60):
+        now = time.monotonic()
+        if now - self._pruned < interval:
+            return
+        self._pruned = now
+        for name, state in list(self._states.items()):
+            idle = now - state.last_used > self.workspaces.max_idle
+            if idle and (state.job is None or state.job.done):
+                del self._states[name]
+                if state.index is not None:
+                    state.index.release()
+
+    def _model(self, options: dict) -> str:
+        model = options.get("model") or self.bot["model_name"]
+        if not isinstance(model, str) or model not in self.models:
+            raise HTTPError(400, f"Unknown model; available: {sorted(self.models)}.")
+        return model
+
+    def _chatbot(self, model: str):
+        from services.chat import load_chatbot
+
+        # One lease per allowed model, so the dict cannot grow past them
+        with self._bots_lock:
+            lease = self._bots.get(model)
+            if lease is None:
+                config = dict(self.bot, model_name=model)
+                lease = self._bots[model] = load_chatbot(**config)
+        # Loads a new model in the background, keeps the ones in use loaded
+        get_model_warmer().warm(lease.value)
+        return lease.value
+
+    async def health(self, request):
+        return Response.json(
+            {
+                "status": "ok",
+                "workers": self.workers,
+                "pending": self._pending,
+                "connections": self.http.connections,
+                "backends": self.scheduler.stats(),
+            }
+        )
+
+    async def metrics(self, request):
+        body = self.tracer.metrics.render().encode()
+        return Response(200, body, "text/plain; version=0.0.4; charset=utf-8")
+
+    async def list_documents(self, request, name):
+        state = self._state(name)
+        names = sorted(os.listdir(state.workspace.data))
+        return Response.json({"documents": names, "indexed": state.index is not None})
+
+    def _store(self, body, path):
+        digest = self.blob_store.put(body)
+        if self.blob_store.link(digest, path):
+            remember_digest(path, digest)
+        return digest
+
+    async def put_document(self, request, name, filename):
+        if not _NAME.match(filename):
+            raise HTTPError(400, "Documents must be PDF files.")
+        state = self._state(name)
+        path = os.path.join(state.workspace.data, filename)
+        digest = await self.run(self._store, request.body, path)
+        return Response.json({"name": filename, "digest": digest}, 201)
+
+    async def delete_document(self, request, name, filename):
+        state = self._state(name)
+        path = os.path.join(state.workspace.data, filename)
+        if not _NAME.match(filename) or not os.path.exists(path):
+            raise HTTPError(404, "No such document.")
+        os.remove(path)
+        return Response.json({"deleted": filename})
+
+    def _preprocessing(self, options: dict) -> dict:
+        preprocessing = options.get("preprocessing") or {}
+        if not isinstance(preprocessing, dict):
+            raise HTTPError(400, "preprocessing must be a JSON object.")
+        for key, value in preprocessing.items():
+            allowed = PREPROCESSING_OPTIONS.get(key)
+            if allowed is None:
+                raise HTTPError(
+                    400,
+                    f"Unknown preprocessing option '{key}'; "
+                    f"available: {sorted(PREPROCESSING_OPTIONS)}.",
+                )
+            kind, *bounds = allowed
+            # bool is an int, and JSON true is no chunk size
+            if (
+                type(value) is not kind
+                or bounds
+                and not (bounds[0] <= value <= bounds[1])
+            ):
+                limits = f" between {bounds[0]} and {bounds[1]}" if bounds else ""
+                raise HTTPError(400, f"{key} must be a {kind.__name__}{limits}.")
+        # The preprocessing defaults to 512 and 100
+        overlap = preprocessing.get("chunk_overlap", 100)
+        if overlap >= preprocessing.get("chunks_size", 512):
+            raise HTTPError(400, "chunk_overlap must be smaller than chunks_size.")
+        if preprocessing.get("extract_images") and not self.preprocessing.get(
+            "tesseract_path"
+        ):
+            raise HTTPError(400, "This server does not extract text from images.")
+        return dict(preprocessing, **self.preprocessing)
+
+    def _ingest(self, job, state, config):
+        name = os.path.basename(state.workspace.path)
+        with self.tracer.trace("ingest", workspace=name) as trace:
+            report = self.tracer.stage_recorder(trace, job.report)
+            try:
+                index = load_shared_index(
+                    state.workspace.data,
+                    config["rag_action"],
+                    config["preprocessing"],
+                    self.index_cache,
+                    state.index,
+                    progress=report,
+                    ann=config["ann"],
+                    stores=self.vector_stores,
+                )
+            except JobCancelled:
+                report.close("cancelled")
+                trace.status = "cancelled"
+                raise
+            except Exception:
+                report.close("error")
+                raise
+            report.close()
+            trace.tags["docset"] = short_digest(index.key)
+            return index
+
+    async def ingest(self, request, name):
+        options = request.json()
+        rag_action = options.get("rag_action", "BasePreprocessing")
+        if rag_action not in RAG_ACTIONS:
+            raise HTTPError(400, f"Unknown rag_action; available: {list(RAG_ACTIONS)}.")
+        preprocessing = self._preprocessing(options)
+        state = self._state(name)
+        if state.job is not None:
+            raise HTTPError(409, f"Job {state.job.id} is still processing documents.")
+        config = {
+            "rag_action": rag_action,
+            "preprocessing": preprocessing,
+            "ann": options.get("ann"),
+        }
+        state.config = {
+            "hybrid": options.get("hybrid", True),
+            "rerank": options.get("rerank", False),
+        }
+        state.job = self.job_queue.submit(
+            self._ingest, state, config, stages=INGEST_STAGES
+        )
+        return Response.json({"job": state.job.id}, 202)
+
+    def _job(self, job_id):
+        job = self.job_queue.get(int(job_id))
+        if job is None:
+            raise HTTPError(404, "No such job.")
+        return job
+
+    async def cancel_job(self, request, job_id):
+        job = self._job(job_id)
+        job.cancel()
+        return Response.json({"id": job.id, "status": job.status}, 202)
+
+    async def get_job(self, request, job_id):
+        job = self._job(job_id)
+        return Response.json(
+            {
+                "id": job.id,
+                "status": job.status,
+                "stage": job.stage,
+                "detail": job.detail,
+                "fraction": job.fraction,
+                "error": job.error,
+            }
+        )
+
+    async def _retrieve(self, state, question: str, options: dict) -> list:
+        if state.index is None:
+            return []
+        with self.tracer.span("retrieve"):
+            return await self.run(
+                self.retrieval.search_chunks,
+                state.index.value,
+                question,
+                k=int(options.get("k", 6)),
+                hybrid=bool(options.get("hybrid", state.config.get("hybrid", True))),
+                rerank=bool(options.get("rerank", state.config.get("rerank", False))),
+            )
+
+    async def query(self, request, name):
+        options = request.json()
+        question = options.get("question")
+        if not question:
+            raise HTTPError(400, "A question is required.")
+        with self.tracer.trace("api_query", workspace=name):
+            chunks = await self._retrieve(self._state(name), question, options)
+        return Response.json({"chunks": chunks})
+
+    async def answer(self, request, name):
+        options = request.json()
+        question = options.get("question")
+        if not question:
+            raise HTTPError(400, "A question is required.")
+        try:
+            history = [
+                Message(message["role"], message["content"])
+                for message in options.get("history") or []
+            ]
+        except (KeyError, TypeError):
+            raise HTTPError(400, "History messages need a role and a content.")
+        model = self._model(options)
+        with self.tracer.trace("api_answer", workspace=name):
+            state = self._state(name)
+            bot = await self.run(self._chatbot, model)
+            chunks = await self._retrieve(state, question, options)
+            with self.tracer.span("pack"):
+                context, prompt = self.packer.pack(bot, question, chunks, history)
+            with self.tracer.span("admit"):
+                stream = await self.run(
+                    self.scheduler.open_stream, bot, context, prompt
+                )
+        events = self._events(bot, stream)
+        if options.get("stream", True):
+            return StreamingResponse(self._ndjson(events))
+        try:
+            async for kind, value in events:
+                if kind == "error":
+                    # Mapped to 503, 504 or 500 like the other handlers' errors
+                    raise value
+        finally:
+            await events.aclose()
+        return Response.json(value)
+
+    @staticmethod
+    async def _ndjson(events):
+        try:
+            async for kind, value in events:
+                if kind == "token":
+                    value = {"token": value}
+                elif kind == "error":
+                    value = {"error": f"{type(value).__name__}: {value}"}
+                yield json.dumps(value).encode() + b"\n"
+        finally:
+            await events.aclose()
+
+    async def _events(self, bot, stream):
+        # ("token", text) events, then ("done", summary) or ("error", exception)
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(tokens.put_nowait, item)
+            except RuntimeError:
+                pass  # The loop is shutting down
+
+        def pump():
+            try:
+                for token in stream:
+                    put(("token", token))
+                put(("done", None))
+            except Exception as e:
+                put(("error", e))
+
+        start = time.perf_counter()
+        status = "ok"
+        # Holds a worker for the whole generation; the scheduler bounds those
+        self._pending += 1
+        loop.run_in_executor(self.executor, pump)
+        try:
+            while True:
+                kind, value = await tokens.get()
+                if kind == "token":
+                    yield kind, value
+                elif kind == "error":
+                    status = "error"
+                    yield kind, value
+                    return
+                else:
+                    done = {
+                        "done": True,
+                        "answer": bot._posprocessing_answer(stream.text),
+                        "first_token": stream.first_token_time,
+                        "total": stream.total_time,
+                    }
+                    yield kind, done
+                    return
+        except BaseException:
+            status = "cancelled"
+            raise
+        finally:
+            self._pending -= 1
+            # Frees the backend if the client left before the end
+            stream.cancel()
+            self.tracer.stage_seconds.observe(
+                time.perf_counter() - start,
+                trace="api_answer",
+                stage="generate",
+                status=status,
+            )
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8600):
+        await self.http.serve(host, port)
+
+    async def _close(self, server):
+        server.close()
+        await self.http.close()
+        await server.wait_closed()
+
+    def shutdown(self, timeout: float = 10):
+        """
+        Stop the server started by ``serve_api``.
+
+        It stops listening, closes the open connections, stops the event
+        loop's thread and then the worker threads; calls still running on
+        them finish in the background.
+        Args:
+            timeout (float): Seconds to wait for the connections and the thread.
+        """
+        if self._serving is not None:
+            server, thread = self._serving
+            self._serving = None
+            loop = server.get_loop()
+            asyncio.run_coroutine_threadsafe(self._close(server), loop).result(timeout)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_loop(loop):
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+def serve_api(service: ChatService, host: str = "127.0.0.1", port: int = 8600):
+    """
+    Serve the API from a daemon thread running its own event loop.
+
+    ``service.shutdown()`` stops it.
+    Returns:
+        asyncio.Server: The listening server.
+    Raises:
+        OSError: The port is not available.
+    """
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(service.http.handle, host, port)
+    )
+    # start_server is already listening; the loop only has to run
+    thread = threading.Thread(target=_run_loop, args=(loop,), daemon=True)
+    thread.start()
+    service._serving = server, thread
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the chatbot HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--backend", default="Ollama", help="Ollama or Hugginface.")
+    parser.add_argument("--model", default="llama3.1:8b")
+    parser.add_argument("--server", help="URL of the Ollama server.")
+    parser.add_argument(
+        "--allow-model",
+        action="append",
+        default=[],
+        help="Another model clients may ask for; repeat for more.",
+    )
+    parser.add_argument(
+        "--tesseract-path", help="Tesseract executable, to extract text from images."
+    )
+    parser.add_argument("--embedding-model", help="Name of the embedding model.")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=64)
+    args = parser.parse_args()
+
+    bot = {"host": args.backend, "model_name": args.model}
+    if args.server:
+        bot["server"] = args.server
+    if args.backend == "Hugginface":
+        bot["token"] = os.environ.get("HF_TOKEN")
+        bot["provider"] = os.environ.get("HF_PROVIDER", "hyperbolic")
+    preprocessing = {}
+    if args.tesseract_path:
+        preprocessing["tesseract_path"] = args.tesseract_path
+    if args.embedding_model:
+        preprocessing["name_model"] = args.embedding_model
+    service = ChatService(
+        bot,
+        args.allow_model,
+        preprocessing,
+        workers=args.workers,
+        max_queue=args.max_queue,
+    )
+    print(f"Serving the API on http://{args.host}:{args.port}")
+    asyncio.run(service.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
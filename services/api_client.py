@@ -0,0 +1,151 @@
+import http.client
+import json
+import threading
+from urllib.parse import quote, urlsplit
+
+
+class APIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class APIClient:
+    """
+    Client of the HTTP API of ``services.api``.
+
+    Each thread keeps its own connection alive across calls, so a client
+    can be shared by the threads of a Streamlit server or a load test.
+    Args:
+        base_url (str): URL of the API, e.g. "http://127.0.0.1:8600".
+        timeout (float): Seconds to wait for the server on each read.
+    """
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8600", timeout: float = 300):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _send(self, method: str, path: str, body=None, headers=None):
+        headers = dict(headers or {})
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError):
+                # The server closed an idle keep-alive connection
+                self.close()
+                if attempt or hasattr(body, "read"):
+                    raise
+        if response.status >= 400:
+            try:
+                message = json.loads(response.read())["error"]
+            except (ValueError, KeyError):
+                message = response.reason
+            raise APIError(response.status, message)
+        return response
+
+    def _json(self, method: str, path: str, body=None, headers=None):
+        return json.loads(self._send(method, path, body, headers).read())
+
+    @staticmethod
+    def _workspace(workspace: str, *parts) -> str:
+        path = f"/v1/workspaces/{workspace}"
+        for part in parts:
+            path += "/" + quote(part, safe="")
+        return path
+
+    def health(self) -> dict:
+        return self._json("GET", "/health")
+
+    def documents(self, workspace: str) -> dict:
+        return self._json("GET", self._workspace(workspace, "documents"))
+
+    def upload(self, workspace: str, name: str, source, size: int = None) -> dict:
+        """
+        Upload a PDF to a workspace.
+        Args:
+            source: Bytes or a readable binary file object.
+            size (int): Length of ``source`` when it is a file object.
+        """
+        headers = {"Content-Type": "application/pdf"}
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        path = self._workspace(workspace, "documents", name)
+        return self._json("PUT", path, source, headers)
+
+    def delete(self, workspace: str, name: str) -> dict:
+        return self._json("DELETE", self._workspace(workspace, "documents", name))
+
+    def ingest(self, workspace: str, **config) -> int:
+        """
+        Start processing the workspace's documents.
+        Returns:
+            int: Id of the job, to follow with ``job``.
+        """
+        return self._json("POST", self._workspace(workspace, "ingest"), config)["job"]
+
+    def job(self, job_id: int) -> dict:
+        return self._json("GET", f"/v1/jobs/{job_id}")
+
+    def cancel(self, job_id: int) -> dict:
+        return self._json("DELETE", f"/v1/jobs/{job_id}")
+
+    def query(self, workspace: str, question: str, **options) -> list:
+        body = dict(options, question=question)
+        return self._json("POST", self._workspace(workspace, "query"), body)["chunks"]
+
+    def answer(self, workspace: str, question: str, history=(), **options) -> dict:
+        """
+        Answer a question in one response.
+        Returns:
+            dict: ``answer``, ``first_token`` and ``total`` seconds.
+        """
+        body = dict(options, question=question, history=list(history), stream=False)
+        return self._json("POST", self._workspace(workspace, "answer"), body)
+
+    def answer_stream(self, workspace: str, question: str, history=(), **options):
+        """
+        Answer a question token by token.
+        Args:
+            history: Previous messages as ``{"role", "content"}`` dicts.
+        Yields:
+            dict: ``{"token": ...}`` events, then ``{"done": True, ...}``.
+        Raises:
+            APIError: The server refused the question or failed mid-answer.
+        """
+        body = dict(options, question=question, history=list(history), stream=True)
+        response = self._send("POST", self._workspace(workspace, "answer"), body)
+        try:
+            for line in response:
+                event = json.loads(line)
+                if "error" in event:
+                    raise APIError(500, event["error"])
+                yield event
+        finally:
+            if not response.isclosed():
+                # Stopped early: the connection is left mid-response
+                response.close()
+                self.close()
@@ -0,0 +1,269 @@
+"""
+State the Streamlit pages share: the services of the process, built once
+with ``st.cache_resource``, and the session steps both pages run the same
+way (writing uploads, ingesting them in a job, streaming an answer).
+"""
+
+import logging
+import os
+
+import streamlit as st
+
+from services.answer_cache import AnswerCache
+from services.api import ChatService, serve_api
+from services.context import ContextPacker
+from services.conversations import ConversationStore
+from services.history import render_message
+from services.index_cache import IndexCache
+from services.indexing import load_shared_index, remember_digest
+from services.jobs import JobCancelled, JobQueue
+from services.retrieval_cache import RetrievalCache
+from services.scheduler import BotScheduler, Overloaded
+from services.streams import visible_answer
+from services.telemetry import Tracer, export_stats, serve_metrics, short_digest
+from services.uploads import BlobStore
+from services.workspaces import WorkspaceStore
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_ANSWER = (
+    "I'm sorry, I haven't been able to generate an answer yet. "
+    "Is there anything else I can assist you with?"
+)
+
+
+@st.cache_resource
+def get_index_cache():
+    return IndexCache(root="./cache/indexes")
+
+
+@st.cache_resource
+def get_blob_store():
+    return BlobStore(root="./cache/blobs")
+
+
+@st.cache_resource
+def get_workspaces():
+    return WorkspaceStore(root="./workspaces")
+
+
+@st.cache_resource
+def get_conversations():
+    days = float(os.environ.get("CONVERSATION_RETENTION_DAYS", "30"))
+    return ConversationStore(
+        path="./conversations/conversations.db",
+        archive_dir="./conversations/archive",
+        retention=days * 24 * 3600,
+    )
+
+
+@st.cache_resource
+def get_answer_cache():
+    # Exact repeats only: a similar question can still ask for another answer
+    similarity = os.environ.get("ANSWER_CACHE_SIMILARITY")
+    return AnswerCache(
+        max_entries=1024,
+        ttl=3600,
+        similarity_threshold=float(similarity) if similarity else None,
+    )
+
+
+@st.cache_resource
+def get_retrieval_cache():
+    return RetrievalCache()
+
+
+@st.cache_resource
+def get_tracer():
+    tracer = Tracer(max_traces=500)
+    export_stats(
+        tracer.metrics,
+        scheduler=get_scheduler(),
+        retrieval=get_retrieval_cache(),
+        answers=get_answer_cache(),
+    )
+    port = int(os.environ.get("METRICS_PORT", "9464"))
+    if port:
+        try:
+            serve_metrics(tracer.metrics, port=port)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on port %d: %s", port, e)
+    return tracer
+
+
+@st.cache_resource
+def get_api():
+    # Serves this process's pool, caches and scheduler to app_client.py
+    port = int(os.environ.get("API_PORT", "0"))
+    if not port:
+        return None
+    service = ChatService(
+        workspaces=get_workspaces(),
+        blob_store=get_blob_store(),
+        index_cache=get_index_cache(),
+        job_queue=get_job_queue(),
+        scheduler=get_scheduler(),
+        retrieval=get_retrieval_cache(),
+        packer=get_context_packer(),
+        tracer=get_tracer(),
+    )
+    try:
+        serve_api(service, port=port)
+    except OSError as e:
+        logger.warning("API not started on port %d: %s", port, e)
+        return None
+    return service
+
+
+@st.cache_resource
+def get_context_packer():
+    return ContextPacker(answer_tokens=512)
+
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(workers=2)
+
+
+@st.cache_resource
+def get_scheduler():
+    # A local Ollama server runs generations one after another anyway
+    return BotScheduler(limits={"ollama": 2}, max_queue=16, timeout=120)
+
+
+def write_uploads(workspace, store, uploaded_files, progress=None):
+    """
+    Store the uploaded files in the workspace, replacing its documents.
+    Args:
+        workspace (Workspace): The session's workspace.
+        store (BlobStore): Where the file contents are kept.
+        uploaded_files (list): Streamlit ``UploadedFile``s.
+        progress (callable): ``progress("write", fraction, name)``.
+    """
+    data = workspace.data
+    names = {uploaded_file.name for uploaded_file in uploaded_files}
+    # Files removed from the uploader are dropped from the index on sync
+    for name in os.listdir(data):
+        if name not in names:
+            os.remove(os.path.join(data, name))
+    for done, uploaded_file in enumerate(uploaded_files, start=1):
+        # Streamed and hashed in one pass; a new file under an old name
+        # replaces it, the same content under two names is stored once
+        uploaded_file.seek(0)
+        digest = store.put(uploaded_file)
+        path = os.path.join(data, uploaded_file.name)
+        if store.link(digest, path):
+            remember_digest(path, digest)
+        if progress:
+            progress("write", done / len(uploaded_files), uploaded_file.name)
+    store.prune()
+
+
+def ingest(
+    job,
+    workspace,
+    store,
+    uploaded_files,
+    preprocessing,
+    kwargs,
+    ann,
+    previous,
+    cache,
+    tracer,
+    tags,
+):
+    """
+    Job writing the uploads and building the workspace's index.
+
+    It runs in a background thread, so everything it needs is passed in
+    and it makes no ``st`` calls; ``finish_ingest`` swaps the index in.
+    Returns:
+        Lease: The shared index of the documents.
+    """
+    with tracer.trace("ingest", **tags) as trace:
+        # Every stage reported to the job becomes a span; OCR is part
+        # of "parse"
+        report = tracer.stage_recorder(trace, job.report)
+        try:
+            report("write", 0.0)
+            write_uploads(workspace, store, uploaded_files, progress=report)
+            index = load_shared_index(
+                workspace.data,
+                preprocessing,
+                kwargs,
+                cache,
+                previous,
+                progress=report,
+                ann=ann,
+            )
+        except JobCancelled:
+            report.close("cancelled")
+            trace.status = "cancelled"
+            raise
+        except Exception:
+            report.close("error")
+            raise
+        report.close()
+        trace.tags["docset"] = short_digest(index.key)
+        return index
+
+
+def finish_ingest():
+    """Swap in the index of the session's finished ingest job, if any."""
+    job = st.session_state.ingest_job
+    if job is None or not job.done:
+        return
+    st.session_state.ingest_job = None
+    if job.status == "done":
+        previous = st.session_state.index
+        st.session_state.index = job.result
+        st.session_state.rag = job.result.value.rag
+        if previous is not None:
+            previous.release()
+        st.success("Documents processed.")
+    elif job.status == "failed":
+        st.error(f"Could not process the documents: {job.error}")
+    else:
+        st.info("Document processing cancelled.")
+
+
+def _show_answer(content, container):
+    container.markdown(render_message("assistant", content), unsafe_allow_html=True)
+
+
+def stream_bot_answer(bot, context, question, timeout=120):
+    """
+    Show an answer as its tokens arrive.
+    Returns:
+        tuple: The answer, and its ``first_token`` and ``total`` seconds, or
+            None when the fallback answer was given.
+    """
+    placeholder = st.empty()
+    stream = None
+    try:
+        stream = get_scheduler().open_stream(bot, context, question, timeout)
+        for _ in stream:
+            _show_answer(visible_answer(stream.text), placeholder)
+    except Exception as e:
+        if isinstance(e, Overloaded):
+            st.warning(str(e))
+        _show_answer(FALLBACK_ANSWER, placeholder)
+        return FALLBACK_ANSWER, None
+    finally:
+        # A rerun or stop is a BaseException raised mid-loop: give the
+        # backend slot back now rather than when the answer ends
+        if stream is not None:
+            stream.cancel()
+
+    respuesta = bot._posprocessing_answer(stream.text)
+    _show_answer(respuesta, placeholder)
+    timings = {
+        "first_token": stream.first_token_time,
+        "total": stream.total_time,
+    }
+    if stream.first_token_time is not None:
+        st.caption(
+            f"First token: {stream.first_token_time:.2f} s · "
+            f"Total: {stream.total_time:.2f} s"
+        )
+    return respuesta, timings
@@ -0,0 +1,207 @@
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+
+class _Flight:
+    """
+    One generation whose tokens are broadcast to every subscriber.
+
+    The backend iterator is drained by its own thread. The generation is
+    cancelled, and the iterator closed, when the last subscriber leaves
+    before it is finished.
+    """
+
+    def __init__(self, factory):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.subscribers = 0
+        self.finished = None
+        self.condition = threading.Condition()
+        threading.Thread(target=self._produce, args=(factory,), daemon=True).start()
+
+    def _produce(self, factory):
+        iterator = None
+        try:
+            iterator = factory()
+            for token in iterator:
+                with self.condition:
+                    if self.cancelled:
+                        break
+                    self.tokens.append(token)
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(iterator, "close", None)
+            if self.cancelled and close is not None:
+                close()
+            with self.condition:
+                self.done = True
+                self.finished = time.monotonic()
+                self.condition.notify_all()
+
+    def joinable(self, window: float) -> bool:
+        if self.cancelled or self.error is not None:
+            return False
+        return not self.done or time.monotonic() - self.finished <= window
+
+    def subscribe(self):
+        position = 0
+        try:
+            while True:
+                with self.condition:
+                    while position >= len(self.tokens) and not self.done:
+                        self.condition.wait()
+                    if position < len(self.tokens):
+                        token = self.tokens[position]
+                        position += 1
+                    elif self.error is not None:
+                        raise self.error
+                    else:
+                        return
+                yield token
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+                if self.subscribers == 0 and not self.done:
+                    self.cancelled = True
+
+
+class SingleFlight:
+    """
+    Coalesces identical generations into one backend request.
+
+    A request whose key matches a generation still in flight, or one that
+    finished less than ``window`` seconds ago, subscribes to it instead of
+    calling the backend again and receives the same tokens.
+    Args:
+        window (float): Seconds a finished generation can still be joined.
+    """
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self.started = 0
+        self.joined = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, factory):
+        """
+        Stream the tokens for ``key``, calling ``factory()`` for the
+        backend iterator only if no joinable generation exists.
+        """
+        with self._lock:
+            for old, flight in list(self._flights.items()):
+                if flight.done and not flight.joinable(self.window):
+                    del self._flights[old]
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight.condition:
+                    if flight.joinable(self.window):
+                        flight.subscribers += 1
+                        self.joined += 1
+                    else:
+                        flight = None
+            if flight is None:
+                flight = self._flights[key] = _Flight(factory)
+                flight.subscribers = 1
+                self.started += 1
+        yield from flight.subscribe()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "flights": len(self._flights),
+                "started": self.started,
+                "joined": self.joined,
+            }
+
+
+class _PendingEmbedding:
+    def __init__(self, text: str):
+        self.text = text
+        self.vector = None
+        self.error = None
+        self.ready = threading.Event()
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Groups concurrent ``embed_query`` calls into ``embed_documents`` batches.
+
+    Queries are queued for a dispatcher thread, which waits up to ``window``
+    seconds after the first one (or until ``max_batch`` are pending), embeds
+    them all in one call and hands each caller its vector. This assumes the
+    wrapped model embeds queries and documents the same way, which holds for
+    the sentence-transformers and Ollama embeddings used here.
+    Args:
+        embeddings (Embeddings): The embedding model to wrap.
+        window (float): Seconds to wait for more queries.
+        max_batch (int): Queries embedded per call at most.
+    """
+
+    def __init__(self, embeddings, window: float = 0.01, max_batch: int = 32):
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._pending = []
+        self._condition = threading.Condition()
+        self._dispatcher = None
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined here
+        embeddings = self.__dict__.get("embeddings")
+        if embeddings is None:
+            raise AttributeError(name)
+        return getattr(embeddings, name)
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        request = _PendingEmbedding(text)
+        with self._condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+                self._dispatcher.start()
+            self._pending.append(request)
+            self._condition.notify_all()
+        request.ready.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vector
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[: self.max_batch]
+                self._pending = self._pending[self.max_batch :]
+                self.batches += 1
+                self.queries += len(batch)
+            try:
+                vectors = self.embeddings.embed_documents([p.text for p in batch])
+                for pending, vector in zip(batch, vectors):
+                    pending.vector = vector
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.ready.set()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"batches": self.batches, "queries": self.queries}
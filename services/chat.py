@@ -0,0 +1,125 @@
+import hashlib
+
+import ollama
+from chatbot_rag import chat
+
+from services.batching import SingleFlight
+from services.pool import Lease, get_pool
+
+
+class StreamingMixin:
+    """
+    Adds token streaming to the chatbot_rag chatbots.
+
+    ``stream`` builds the same prompt as ``__call__`` but yields the answer
+    piece by piece as the backend produces it.
+    """
+
+    def stream(self, context: str, question: str):
+        """
+        Stream the answer for a question.
+        Args:
+            context (str): Retrieved context, or None to answer without it.
+            question (str): The user's question.
+        Yields:
+            str: Pieces of the raw answer, in order.
+        """
+        if context:
+            prompt = self._generate_prompt_with_context(context, question)
+        else:
+            prompt = self._generate_prompt_without_countext(question)
+        yield from self._stream_answer(prompt)
+
+    def _stream_answer(self, prompt: str):
+        raise NotImplementedError
+
+
+class OllamaChatbot(StreamingMixin, chat.OllamaChatbot):
+    # The server unloads idle models, so a loaded one needs keep-alive requests
+    needs_keep_alive = True
+
+    def __init__(self, name: str, *args, **kwargs):
+        self.host = kwargs.get("host")
+        # A stalled read fails instead of keeping a cancelled request alive
+        self.client = ollama.Client(host=self.host, timeout=kwargs.get("timeout", 120))
+        # The base class looks for the model on the default server, not on host
+        bots_names = [model.model for model in self.client.list()["models"]]
+        if name not in bots_names:
+            raise ValueError(
+                f"The model '{name}' is not available. Available models in "
+                f"Ollama are: {', '.join(bots_names)}"
+            )
+        chat.BaseChatbot.__init__(self, name, *args, **kwargs)
+        # Identical prompts from concurrent sessions share one generation
+        self.flights = SingleFlight(window=kwargs.get("coalesce_window", 2.0))
+
+    def _generate_answer(self, context: str, question: str) -> str:
+        return "".join(self.stream(context, question))
+
+    def _stream_answer(self, prompt: str):
+        yield from self.flights.stream(prompt, lambda: self._chat_stream(prompt))
+
+    def _chat_stream(self, prompt: str):
+        for chunk in self.client.chat(
+            model=self.name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        ):
+            yield chunk["message"]["content"]
+
+    def warm_up(self, keep_alive: str = None):
+        """
+        Load the model on the server; an empty prompt generates nothing.
+        Args:
+            keep_alive (str): How long the server keeps it loaded, e.g. "10m".
+        """
+        self.client.generate(model=self.name, prompt="", keep_alive=keep_alive)
+
+
+class HuggingFaceChatbot(StreamingMixin, chat.HuggingFaceChatbot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client.timeout = kwargs.get("timeout", 120)
+
+    def _stream_answer(self, prompt: str):
+        for chunk in self.client.chat_completion(
+            messages=[{"role": "user", "content": prompt}], stream=True
+        ):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def warm_up(self, keep_alive: str = None):
+        # Serverless endpoints go cold too; one token wakes them up. Each
+        # request is billed, so this is only sent once (no needs_keep_alive)
+        self.client.chat_completion(
+            messages=[{"role": "user", "content": "Hi"}], max_tokens=1
+        )
+
+
+def load_chatbot(
+    host: str, model_name: str, token=None, provider=None, server=None
+) -> Lease:
+    """
+    Get a chatbot from the process-wide pool.
+
+    Sessions with the same host, model, provider and token share one client.
+    Args:
+        host (str): "Ollama" or "Hugginface".
+        model_name (str): Name of the model on that host.
+        token (str): Hugging Face token.
+        provider (str): Hugging Face inference provider.
+        server (str): URL of the Ollama server, None for the default one.
+    Returns:
+        Lease: Lease whose ``value`` is the chatbot.
+    """
+    if host == "Ollama":
+        factory = lambda: OllamaChatbot(name=model_name, host=server)
+    elif host == "Hugginface":
+        factory = lambda: HuggingFaceChatbot(
+            model_name=model_name, token=token, provider=provider
+        )
+    else:
+        raise ValueError(f"Unknown host '{host}'.")
+    token_digest = hashlib.sha256((token or "").encode()).hexdigest()
+    key = ("bot", host, server, model_name, provider, token_digest)
+    return get_pool().lease(key, factory)
@@ -0,0 +1,245 @@
+import math
+import re
+
+from services.scheduler import backend_key
+
+# Context window assumed per backend when the model's is not configured;
+# Ollama truncates prompts beyond its default num_ctx without an error.
+DEFAULT_CONTEXT_TOKENS = {"ollama": 2048, "huggingface": 8192}
+
+_WORDS = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without a tokenizer.
+
+    About four characters per token holds for the BPE tokenizers of the
+    models used here on English and Spanish text; the estimate errs on the
+    high side for short words.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(_WORDS.findall(text)))
+
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    """Cut a text to about ``tokens`` tokens, at a word boundary."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    cut = text[: tokens * 4]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > 0 else cut).rstrip() + " …"
+
+
+def _overlap(left: str, right: str, minimum: int) -> int:
+    # Length of the longest suffix of left that is a prefix of right
+    if min(len(left), len(right)) < minimum:
+        return 0
+    head = right[:minimum]
+    start = left.find(head, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(head, start + 1)
+    return 0
+
+
+def _shingles(text: str) -> set:
+    words = _WORDS.findall(text.lower())
+    return {tuple(words[i : i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def deduplicate_chunks(
+    chunks: list, min_overlap: int = 40, max_similarity: float = 0.8
+) -> list:
+    """
+    Remove repeated text from retrieved chunks, keeping the ranking order.
+
+    Chunks contained in a better ranked one are dropped, neighbouring chunks
+    sharing a text splitter overlap are merged into the better ranked one,
+    and near duplicates (by word trigram Jaccard similarity) are dropped.
+    Args:
+        chunks (list): Chunk texts, best first.
+        min_overlap (int): Characters two chunks must share to be merged.
+        max_similarity (float): Similarity above which a chunk is dropped.
+    Returns:
+        list: The remaining chunk texts, best first.
+    """
+    kept = []
+    shingles = []
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if not chunk or any(chunk in other for other in kept):
+            continue
+        merged = False
+        for i, other in enumerate(kept):
+            after = _overlap(other, chunk, min_overlap)
+            before = _overlap(chunk, other, min_overlap) if not after else 0
+            if after or before:
+                kept[i] = other + chunk[after:] if after else chunk[:-before] + other
+                shingles[i] = _shingles(kept[i])
+                merged = True
+                break
+        if merged:
+            continue
+        words = _shingles(chunk)
+        if any(len(words & s) / len(words | s) > max_similarity for s in shingles):
+            continue
+        kept.append(chunk)
+        shingles.append(words)
+    return kept
+
+
+def _first_sentence(text: str, tokens: int) -> str:
+    text = " ".join(text.split())
+    return truncate_tokens(_SENTENCE_END.split(text, maxsplit=1)[0], tokens)
+
+
+class RollingSummary:
+    """
+    Extractive summary of the turns that no longer fit in the prompt.
+
+    Each turn is reduced to its first sentence as it leaves the packed
+    history, so the summary is extended rather than rebuilt, and the oldest
+    lines are dropped once it exceeds ``max_tokens``.
+    Args:
+        max_tokens (int): Upper bound of the summary size.
+        tokens_per_turn (int): Upper bound of the line kept per turn.
+    """
+
+    def __init__(self, max_tokens: int = 256, tokens_per_turn: int = 40):
+        self.max_tokens = max_tokens
+        self.tokens_per_turn = tokens_per_turn
+        self.lines = []
+        self.covered = 0
+
+    def update(self, messages: list):
+        """
+        Summarize ``messages`` beyond those already covered. If they carry
+        a ``seq``, the list may start mid-conversation.
+        """
+        first = getattr(messages[0], "seq", None) if messages else None
+        offset = first or 0
+        for message in messages[max(0, self.covered - offset) :]:
+            speaker = "User" if message.role == "user" else "Assistant"
+            sentence = _first_sentence(message.content, self.tokens_per_turn)
+            self.lines.append(f"{speaker}: {sentence}")
+        self.covered = max(self.covered, offset + len(messages))
+        while self.lines and estimate_tokens(self.text) > self.max_tokens:
+            self.lines.pop(0)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+class ContextPacker:
+    """
+    Assemble the context of a prompt within a model's token budget.
+
+    Retrieved chunks are deduplicated and added best first, the last one
+    trimmed to fit; the remaining budget goes to the most recent turns of
+    the conversation, newest first, and turns that do not fit are folded
+    into a rolling summary. Without conversation history the context is the
+    chunks joined as ``RAG._search_context`` joins them. Without chunks there
+    is no context, since any context makes the chatbot answer from it
+    alone: the conversation is put before the question instead.
+    Args:
+        context_tokens (dict): Context window per model name, overriding
+            ``DEFAULT_CONTEXT_TOKENS``.
+        answer_tokens (int): Tokens left free for the answer.
+        prompt_tokens (int): Tokens taken by the prompt template.
+        history_share (float): Part of the budget kept for the conversation
+            when there is one.
+        min_chunk_tokens (int): Smallest piece of a chunk worth including.
+    """
+
+    def __init__(
+        self,
+        context_tokens: dict = None,
+        answer_tokens: int = 512,
+        prompt_tokens: int = 128,
+        history_share: float = 0.25,
+        min_chunk_tokens: int = 64,
+    ):
+        self.context_tokens = context_tokens or {}
+        self.answer_tokens = answer_tokens
+        self.prompt_tokens = prompt_tokens
+        self.history_share = history_share
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def budget(self, bot, question: str) -> int:
+        """Tokens available for the context of ``question`` with ``bot``."""
+        window = self.context_tokens.get(getattr(bot, "name", None))
+        if window is None:
+            backend = backend_key(bot).split(":")[0]
+            window = DEFAULT_CONTEXT_TOKENS.get(backend, 2048)
+        reserved = self.answer_tokens + self.prompt_tokens + estimate_tokens(question)
+        return max(0, window - reserved)
+
+    def pack_chunks(self, chunks: list, budget: int) -> list:
+        packed = []
+        for chunk in deduplicate_chunks(chunks):
+            tokens = estimate_tokens(chunk)
+            if tokens > budget:
+                if budget >= self.min_chunk_tokens:
+                    packed.append(truncate_tokens(chunk, budget))
+                break
+            packed.append(chunk)
+            budget -= tokens
+        return packed
+
+    def pack_history(self, messages: list, budget: int, summary=None) -> str:
+        turns = []
+        cut = len(messages)
+        for message in reversed(messages):
+            speaker = "User" if message.role == "user" else "Assistant"
+            line = f"{speaker}: {' '.join(message.content.split())}"
+            tokens = estimate_tokens(line) + 1
+            if tokens > budget:
+                break
+            turns.insert(0, line)
+            budget -= tokens
+            cut -= 1
+        if summary is not None and cut:
+            summary.update(messages[:cut])
+            if summary.lines and estimate_tokens(summary.text) <= budget:
+                turns.insert(0, f"Summary of earlier turns:\n{summary.text}")
+        return "\n".join(turns)
+
+    def pack(self, bot, question: str, chunks: list, messages=(), summary=None):
+        """
+        Build the context for a question.
+        Args:
+            bot (BaseChatbot): The chatbot that will answer, for its budget.
+            question (str): The user's question.
+            chunks (list): Retrieved chunk texts, best first.
+            messages (list): Earlier messages of the conversation, oldest
+                first, without the question itself.
+            summary (RollingSummary): Summary of the turns that do not fit.
+        Returns:
+            tuple: The context, None without chunks, and the question to
+                ask with it.
+        """
+        budget = self.budget(bot, question)
+        chunk_budget = budget
+        if messages:
+            chunk_budget = int(budget * (1 - self.history_share))
+        packed = self.pack_chunks(chunks, chunk_budget)
+        documents = "\n\n".join(packed)
+        if not messages:
+            return documents or None, question
+
+        # Section headers and separators
+        remaining = budget - estimate_tokens(documents) - 8
+        history = self.pack_history(list(messages), remaining, summary)
+        if not documents:
+            if history:
+                question = f"Conversation so far:\n{history}\n\nQuestion: {question}"
+            return None, question
+        sections = [f"Documents:\n{documents}"]
+        if history:
+            sections.insert(0, f"Conversation so far:\n{history}")
+        return "\n\n".join(sections), question
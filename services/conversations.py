@@ -0,0 +1,272 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timings TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (conversation, seq)
+) WITHOUT ROWID;
+"""
+
+_FLUSH = object()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks the last commits on power loss, not corruption
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class ConversationStore:
+    """
+    Conversations kept in SQLite, so they survive reconnects and restarts.
+
+    Messages are queued by ``append`` and written by one background thread,
+    which commits everything queued in one transaction every
+    ``flush_interval`` seconds or ``batch_size`` messages, so answering
+    never waits for the disk and sessions do not contend for the write
+    lock. Positions are allocated by the writer as messages are written, so
+    sessions sharing a conversation add to it instead of overwriting each
+    other's messages. The database is in WAL mode: readers see committed messages while
+    the writer works. Conversations idle for longer than ``retention``
+    seconds are moved to gzipped JSON-lines files in ``archive_dir`` by
+    ``archive``, which the writer runs every ``archive_interval`` seconds.
+    Args:
+        path (str): SQLite database file.
+        archive_dir (str): Directory of the archived conversations.
+        retention (float): Idle seconds after which a conversation is archived.
+        batch_size (int): Queued messages that trigger a write.
+        flush_interval (float): Seconds a message may wait to be written.
+        archive_interval (float): Seconds between two ``archive`` runs.
+    """
+
+    def __init__(
+        self,
+        path: str = "./conversations/conversations.db",
+        archive_dir: str = "./conversations/archive",
+        retention: float = 30 * 24 * 3600,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        archive_interval: float = 3600,
+    ):
+        self.path = path
+        self.archive_dir = archive_dir
+        self.retention = retention
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.archive_interval = archive_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._reader = _connect(path)
+        self._reader.executescript(_SCHEMA)
+        self._read_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.archived = 0
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def append(self, conversation: str, role: str, content: str, timings=None):
+        """
+        Queue a message for writing, after the last one of its conversation.
+        Args:
+            conversation (str): Id of the conversation.
+        """
+        self._queue.put(
+            (
+                conversation,
+                role,
+                content,
+                json.dumps(timings) if timings else None,
+                time.time(),
+            )
+        )
+
+    def flush(self, timeout: float = 10):
+        """Wait until the messages queued so far are written."""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    def _write_loop(self):
+        connection = _connect(self.path)
+        next_archive = time.monotonic()
+        while True:
+            batch, waiting = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                if item[0] is _FLUSH:
+                    waiting.append(item[1])
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(connection, batch)
+                except sqlite3.Error as e:
+                    logger.warning("%d chat messages not saved: %s", len(batch), e)
+            for done in waiting:
+                done.set()
+            if time.monotonic() >= next_archive:
+                next_archive = time.monotonic() + self.archive_interval
+                try:
+                    self.archive(connection)
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning("Conversations not archived: %s", e)
+
+    def _write(self, connection: sqlite3.Connection, batch: list):
+        spans = {}
+        for conversation, *_, created in batch:
+            first, last = spans.get(conversation, (created, created))
+            spans[conversation] = (min(first, created), max(last, created))
+        with connection:
+            # Holds the write lock from the first read of MAX(seq), so other
+            # processes writing the same conversation wait for the commit
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT INTO messages "
+                "SELECT ?1, COALESCE(MAX(seq) + 1, 0), ?2, ?3, ?4, ?5 "
+                "FROM messages WHERE conversation = ?1",
+                batch,
+            )
+            connection.executemany(
+                "INSERT INTO conversations VALUES "
+                "(?1, ?2, ?3, (SELECT COUNT(*) FROM messages WHERE conversation = ?1)) "
+                "ON CONFLICT (id) DO UPDATE SET updated = excluded.updated, "
+                "messages = excluded.messages",
+                [(cid, *span) for cid, span in spans.items()],
+            )
+        self.written += len(batch)
+        self.batches += 1
+
+    def _read(self, sql: str, parameters=()) -> list:
+        with self._read_lock:
+            return self._reader.execute(sql, parameters).fetchall()
+
+    def count(self, conversation: str) -> int:
+        """Number of messages written for a conversation."""
+        rows = self._read(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation = ?",
+            (conversation,),
+        )
+        return rows[0][0]
+
+    def page(self, conversation: str, before: int, limit: int) -> list:
+        """
+        Messages of a conversation just before position ``before``, oldest
+        first.
+        Returns:
+            list: ``(seq, role, content, timings)`` tuples.
+        """
+        rows = self._read(
+            "SELECT seq, role, content, timings FROM messages "
+            "WHERE conversation = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (conversation, before, limit),
+        )
+        return [
+            (seq, role, content, json.loads(timings) if timings else None)
+            for seq, role, content, timings in reversed(rows)
+        ]
+
+    def archive(self, connection: sqlite3.Connection = None) -> int:
+        """
+        Move the conversations idle for longer than ``retention`` to this
+        month's archive file and delete them from the database.
+        Returns:
+            int: Number of conversations archived.
+        """
+        connection = connection or self._reader
+        cutoff = time.time() - self.retention
+        with self._read_lock:
+            idle = [
+                row[0]
+                for row in connection.execute(
+                    "SELECT id FROM conversations WHERE updated < ?", (cutoff,)
+                )
+            ]
+        if not idle:
+            return 0
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = time.strftime("conversations-%Y-%m.jsonl.gz")
+        with gzip.open(os.path.join(self.archive_dir, name), "at") as f:
+            for conversation in idle:
+                with self._read_lock:
+                    created, updated = connection.execute(
+                        "SELECT created, updated FROM conversations WHERE id = ?",
+                        (conversation,),
+                    ).fetchone()
+                    messages = connection.execute(
+                        "SELECT role, content, timings, created FROM messages "
+                        "WHERE conversation = ? ORDER BY seq",
+                        (conversation,),
+                    ).fetchall()
+                record = {
+                    "id": conversation,
+                    "created": created,
+                    "updated": updated,
+                    "messages": [
+                        {
+                            "role": role,
+                            "content": content,
+                            "timings": json.loads(timings) if timings else None,
+                            "created": when,
+                        }
+                        for role, content, timings, when in messages
+                    ],
+                }
+                f.write(json.dumps(record) + "\n")
+        with self._read_lock, connection:
+            # Skips conversations that were resumed in the meantime
+            connection.executemany(
+                "DELETE FROM messages WHERE conversation IN "
+                "(SELECT id FROM conversations WHERE id = ? AND updated < ?)",
+                [(conversation, cutoff) for conversation in idle],
+            )
+            connection.executemany(
+                "DELETE FROM conversations WHERE id = ? AND updated < ?",
+                [(conversation, cutoff) for conversation in idle],
+            )
+        self.archived += len(idle)
+        return len(idle)
+
+    def stats(self) -> dict:
+        rows = self._read(
+            "SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM conversations"
+        )
+        return {
+            "conversations": rows[0][0],
+            "messages": rows[0][1],
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "archived": self.archived,
+        }
@@ -0,0 +1,180 @@
+import hashlib
+import html
+
+CHAT_CSS = (
+    "<style>"
+    ".chat-row{display:flex;margin-bottom:1rem}"
+    ".chat-left{justify-content:flex-start}"
+    ".chat-right{justify-content:flex-end}"
+    ".chat-bubble{max-width:70%;padding:0.5rem;border-radius:0.5rem}"
+    ".bot-bubble{background-color:#0e1117ff}"
+    ".user-bubble{background-color:#1a1c24ff;text-align:right}"
+    ".avatar{width:32px;height:32px;border-radius:50%;background-color:#ccc;"
+    "display:inline-block;margin:0 0.5rem}"
+    "</style>"
+)
+
+_USER_ROW = (
+    '<div class="chat-row chat-right">'
+    '<div class="chat-bubble user-bubble">{}</div>'
+    '<div class="avatar"></div>'
+    "</div>"
+)
+_BOT_ROW = (
+    '<div class="chat-row chat-left">'
+    '<div class="avatar"></div>'
+    '<div class="chat-bubble bot-bubble">{}</div>'
+    "</div>"
+)
+
+
+def render_message(role: str, content: str) -> str:
+    """
+    Render a chat bubble as a single line of HTML.
+
+    The content is escaped, so text from the user or the model cannot inject
+    markup, and line breaks are kept as ``<br>``; blank lines would otherwise
+    end Markdown's HTML block.
+    """
+    body = html.escape(content or "").replace("\n", "<br>")
+    template = _USER_ROW if role == "user" else _BOT_ROW
+    return template.format(body)
+
+
+class Message:
+    __slots__ = ("role", "content", "timings", "seq", "_html")
+
+    def __init__(self, role: str, content: str, timings: dict = None, seq=None):
+        self.role = role
+        self.content = content
+        self.timings = timings
+        self.seq = seq  # Position in the conversation
+        self._html = None
+
+    @property
+    def html(self) -> str:
+        # Messages never change once added, so they are rendered only once
+        if self._html is None:
+            self._html = render_message(self.role, self.content)
+        return self._html
+
+
+class ChatHistory:
+    """
+    The messages of a conversation, shown through a window of recent ones.
+
+    Only the last ``visible`` messages are rendered on each rerun, so the cost
+    of a rerun does not grow with the conversation; older messages are paged
+    in ``page_size`` at a time on demand.
+
+    With a ``ConversationStore``, messages are saved as they are added and
+    only the last ``max_cached`` stay in memory; older ones are read back
+    from the store, a page at a time, when the window reaches them, and a
+    conversation already in the store is resumed where it stopped.
+    Args:
+        page_size (int): Messages shown at first and added per page.
+        store (ConversationStore): Where messages are saved, or None to keep
+            them all in memory.
+        conversation (str): Id of the conversation in the store.
+        max_cached (int): Recent messages kept in memory with a store.
+    """
+
+    def __init__(
+        self,
+        page_size: int = 20,
+        store=None,
+        conversation: str = None,
+        max_cached: int = 200,
+    ):
+        self.page_size = page_size
+        self.visible = page_size
+        self.store = store
+        self.conversation = conversation
+        self.max_cached = max_cached
+        self.messages = []  # The most recent messages, oldest first
+        self._older = []  # Pages read back from the store, oldest first
+        self._total = 0
+        self._window_key = None
+        self._window_html = ""
+        if store is not None:
+            # Messages of this conversation may still be queued
+            store.flush()
+            self._total = store.count(conversation)
+            self.messages = self._load(self._total, max_cached)
+
+    def _load(self, before: int, limit: int) -> list:
+        return [
+            Message(role, content, timings, seq)
+            for seq, role, content, timings in self.store.page(
+                self.conversation, before, limit
+            )
+        ]
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def append(self, role: str, content: str, timings: dict = None) -> Message:
+        message = Message(role, content, timings, self._total)
+        self.messages.append(message)
+        self._total += 1
+        if self.store is not None:
+            self.store.append(self.conversation, role, content, timings)
+            excess = len(self.messages) - self.max_cached
+            if excess > 0:
+                if self._older:
+                    # Still in the window: keeps the cached messages contiguous
+                    self._older.extend(self.messages[:excess])
+                del self.messages[:excess]
+        return message
+
+    def recent(self, n: int) -> list:
+        if n <= 0:
+            return []
+        cached = self._older + self.messages if self._older else self.messages
+        missing = min(n, self._total) - len(cached)
+        if missing > 0:
+            # Older pages are read only when the window reaches them
+            self.store.flush()
+            first = cached[0].seq if cached else self._total
+            self._older = self._load(first, missing) + self._older
+            cached = self._older + self.messages
+        # Only what the window still needs stays in memory
+        extra = len(self._older) - max(0, n - len(self.messages))
+        if extra > 0:
+            del self._older[:extra]
+        return cached[-n:]
+
+    @property
+    def hidden(self) -> int:
+        """Number of older messages outside of the window."""
+        return max(0, self._total - self.visible)
+
+    def show_older(self):
+        self.visible += self.page_size
+
+    def reset_window(self):
+        self.visible = self.page_size
+        self._older = []
+
+    def window_html(self) -> str:
+        """
+        HTML of the messages in the window, rebuilt only when it changed.
+        """
+        key = (self._total, self.visible)
+        if key != self._window_key:
+            self._window_html = "".join(
+                message.html for message in self.recent(self.visible)
+            )
+            self._window_key = key
+        return self._window_html
+
+
+def conversation_digest(messages) -> str:
+    """Fingerprint of a conversation, for caches whose answers depend on it."""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.role}\0{message.content}\0".encode())
+    return digest.hexdigest()
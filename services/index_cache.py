@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+
+class FileLock:
+    """
+    Cross-process lock backed by an exclusively created lock file.
+
+    Works on every platform the app runs on (no ``fcntl``/``msvcrt``). A lock
+    file older than ``stale`` seconds is assumed to belong to a crashed
+    process and is broken.
+    Args:
+        path (str): Path of the lock file.
+        timeout (float): Seconds to wait for the lock before raising.
+        stale (float): Age in seconds after which a lock file is broken.
+    """
+
+    def __init__(self, path: str, timeout: float = 3600, stale: float = 3600):
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale:
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not acquire the lock '{self.path}'.")
+                time.sleep(0.05)
+            else:
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 of a file without loading it whole into memory.
+    Args:
+        path (str): Path to the file.
+    Returns:
+        str: Hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexCache:
+    """
+    Content-addressed, size-bounded disk cache for serialized indexes.
+
+    Entries are opaque byte strings stored as ``<key>.idx`` under ``root``.
+    Writes go to a temporary file and are renamed into place, so readers in
+    other processes only ever see complete entries. Reading an entry bumps
+    its modification time, which is what the LRU eviction sorts on.
+    Args:
+        root (str): Directory holding the cache entries.
+        max_bytes (int): Total size above which least recently used entries
+            are evicted.
+    """
+
+    suffix = ".idx"
+
+    def __init__(self, root: str = "./cache/indexes", max_bytes: int = 2 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(digest: str, config: dict) -> str:
+        """
+        Build the cache key for a file content digest and a preprocessing config.
+        """
+        payload = json.dumps({"digest": digest, "config": config}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + self.suffix)
+
+    def get(self, key: str):
+        """
+        Return the bytes stored under ``key``, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        tmp_path = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        self.evict(keep=key)
+
+    def get_or_build(self, key: str, build):
+        """
+        Return the entry for ``key``, calling ``build()`` to create it on a miss.
+
+        Only one process builds a given key at a time; the others wait for the
+        lock and then read the finished entry.
+        Args:
+            key (str): Cache key, see ``IndexCache.key``.
+            build (callable): Function returning the bytes to store.
+        Returns:
+            bytes: The cached or freshly built entry.
+        """
+        data = self.get(key)
+        if data is not None:
+            return data
+        with FileLock(os.path.join(self.root, key + ".lock")):
+            data = self.get(key)
+            if data is None:
+                data = build()
+                self.put(key, data)
+        return data
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((name[: -len(self.suffix)], stat.st_mtime, stat.st_size))
+        return entries
+
+    def evict(self, keep: str = None):
+        """
+        Remove least recently used entries until the cache fits in ``max_bytes``.
+        """
+        with FileLock(os.path.join(self.root, ".evict.lock"), timeout=60, stale=60):
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            for key, _, size in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    # Still open by a reader on Windows; try again next time.
+                    continue
+                total -= size
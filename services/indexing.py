@@ -0,0 +1,692 @@
+import contextlib
+import copy
+import itertools
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from glob import glob
+
+import numpy as np
+
+from services.ann import IVFPQIndex
+from services.index_cache import IndexCache, file_digest
+from services.lexical import BM25Index, reciprocal_rank_fusion, rerank
+from services.memory import get_memory_budget
+from services.pool import Lease, get_pool
+from services.vector_store import (
+    VectorStoreCache,
+    get_vector_stores,
+    write_vector_store,
+)
+
+# chatbot_rag, LangChain, FAISS and PyMuPDF are imported by the functions
+# that need them: importing them takes seconds and delays the first page
+
+logger = logging.getLogger(__name__)
+
+_digests = {}
+_versions = itertools.count()
+
+INGEST_STAGES = ("write", "parse", "chunk", "embed", "index")
+
+# Preprocessing arguments that change how fast, not what, is indexed
+EXECUTION_SETTINGS = ("workers", "pages_per_task", "min_parallel_pages")
+
+
+def cached_file_digest(path: str) -> str:
+    """
+    Same as ``file_digest`` but skips re-reading files whose size and
+    modification time did not change.
+    """
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(signature)
+    if digest is None:
+        if len(_digests) > 4096:
+            _digests.clear()
+        digest = _digests[signature] = file_digest(path)
+    return digest
+
+
+def remember_digest(path: str, digest: str):
+    """
+    Record the digest of a file computed while writing it, so
+    ``cached_file_digest`` does not read it again.
+    """
+    stat = os.stat(path)
+    if len(_digests) > 4096:
+        _digests.clear()
+    _digests[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+def document_set_key(
+    path: str, rag_action: str, preprocessing_kwargs: dict, ann: dict = None
+):
+    """
+    Identify the index of a directory: its PDFs' contents plus the configuration.
+    Args:
+        path (str): Directory holding the PDFs.
+        rag_action (str): Name of the preprocessing class.
+        preprocessing_kwargs (dict): Extra arguments given to the preprocessing.
+        ann (dict): Parameters of the approximate index, None for exact search.
+    Returns:
+        tuple: Hashable key, equal for identical document sets.
+    """
+    digests = sorted(
+        cached_file_digest(file) for file in glob(os.path.join(path, "*.pdf"))
+    )
+    # How the work is spread does not change the index
+    config = {
+        name: value
+        for name, value in preprocessing_kwargs.items()
+        if name not in EXECUTION_SETTINGS
+    }
+    config = json.dumps(config, sort_keys=True)
+    return (
+        "index",
+        rag_action,
+        config,
+        tuple(digests),
+        json.dumps(ann, sort_keys=True),
+    )
+
+
+def preprocessing_config(rag, preprocessing_kwargs: dict) -> dict:
+    """
+    Describe everything that changes the chunks and vectors built for a file.
+    Args:
+        rag (RAG): The RAG whose preprocessing and embedding model are used.
+        preprocessing_kwargs (dict): Extra arguments given to the preprocessing.
+    Returns:
+        dict: JSON-serializable configuration, part of the cache key.
+    """
+    # Subclasses that only change how the work is done share the entries
+    # of the chatbot_rag class they extend
+    rag_action = next(
+        cls.__name__
+        for cls in type(rag.preprocessing).__mro__
+        if cls.__module__.startswith("chatbot_rag")
+    )
+    return {
+        "rag_action": rag_action,
+        "extract_images": bool(preprocessing_kwargs.get("extract_images", False)),
+        "extract_tables": bool(preprocessing_kwargs.get("extract_tables", False)),
+        "chunks_size": rag.preprocessing.chunks_size,
+        "chunk_overlap": rag.preprocessing.chunk_overlap,
+        "embedding_model": rag.get_embedding_model_name,
+    }
+
+
+def _no_progress(stage: str, fraction: float):
+    pass
+
+
+def build_file_index(
+    rag,
+    path: str,
+    digest: str,
+    preprocessing_kwargs: dict,
+    progress=None,
+    batch_size: int = 64,
+):
+    """
+    Preprocess and embed a single PDF.
+    Args:
+        rag (RAG): Provides the preprocessing class and the embedding model.
+        path (str): Path to the PDF file.
+        digest (str): Content hash of the file, stored in the chunk metadata.
+        preprocessing_kwargs (dict): Extra arguments given to the preprocessing.
+        progress (callable): Called as ``progress(stage, fraction)`` for the
+            "parse", "chunk" and "embed" stages.
+        batch_size (int): Chunks embedded per call to the embedding model.
+    Returns:
+        FAISS: Vector store holding only this file's chunks; empty when no
+            text was found in the file.
+    """
+    import faiss
+    from chatbot_rag.preprocessing import BasePreprocessing
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    progress = progress or _no_progress
+    preprocessing = type(rag.preprocessing)(path=path, **preprocessing_kwargs)
+    progress("parse", 0.0)
+    if type(preprocessing)._preprocess is BasePreprocessing._preprocess:
+        # Extraction and chunking are separate steps, report them separately
+        if hasattr(preprocessing, "progress"):
+            preprocessing.progress = lambda fraction: progress("parse", fraction)
+        text = preprocessing._extract_text_from_pdf()
+        progress("chunk", 0.0)
+        documents = preprocessing._fragmentar_texto(
+            text,
+            chunks_size=preprocessing.chunks_size,
+            chunk_overlap=preprocessing.chunk_overlap,
+        )
+    else:
+        documents = preprocessing()
+
+    texts = [document.page_content for document in documents]
+    metadatas = [dict(document.metadata, digest=digest) for document in documents]
+    if not texts:
+        # A scanned PDF without OCR has no text; cached empty, not parsed again
+        logger.warning("No text found in %s, nothing indexed.", os.path.basename(path))
+        progress("embed", 1.0)
+        dimension = len(rag.model.embed_query("dimension"))
+        return FAISS(rag.model, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        progress("embed", start / len(texts))
+        vectors.extend(rag.model.embed_documents(texts[start : start + batch_size]))
+    progress("embed", 1.0)
+    return FAISS.from_embeddings(
+        list(zip(texts, vectors)), rag.model, metadatas=metadatas
+    )
+
+
+def load_file_index(
+    rag,
+    cache: IndexCache,
+    path: str,
+    digest: str,
+    preprocessing_kwargs: dict,
+    progress=None,
+):
+    """
+    Load a single PDF's vector store from the cache, building it on a miss.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    key = cache.key(digest, preprocessing_config(rag, preprocessing_kwargs))
+    data = cache.get_or_build(
+        key,
+        lambda: build_file_index(
+            rag, path, digest, preprocessing_kwargs, progress
+        ).serialize_to_bytes(),
+    )
+    return FAISS.deserialize_from_bytes(
+        data, rag.model, allow_dangerous_deserialization=True
+    )
+
+
+def _vectors(db) -> np.ndarray:
+    """The vectors of a FAISS store, in the order of its docstore ids."""
+    return db.index.reconstruct_n(0, db.index.ntotal)
+
+
+class IncrementalIndex:
+    """
+    Live vector store over the PDFs of ``rag.path``, updated file by file.
+
+    ``sync`` compares the directory with what is already indexed: new or
+    changed files are loaded from the cache (or embedded) and merged into
+    ``rag.db``, and the vectors of deleted files are removed by id. Files
+    that did not change are never touched, so the cost of a sync depends on
+    the files that changed, not on the size of the corpus.
+
+    The chunk texts are also kept in a ``BM25Index`` for ``hybrid_search``.
+    With ``ann``, the vectors are also kept in an ``IVFPQIndex`` updated
+    alongside ``rag.db``, and ``search_ids`` goes through it.
+
+    Once built, ``compact`` can move the vectors and chunk texts to a
+    quantized ``MappedVectorStore`` shared through the page cache; the
+    in-memory vector store is dropped until a fork needs it back, and the
+    ``IVFPQIndex`` re-scores from the store's mapped vectors.
+
+    Under a ``MemoryBudget`` the index may be unloaded to a file on disk
+    while idle; readers wrap their use of it in ``in_use``, which loads it
+    back first and keeps it in memory meanwhile.
+    Args:
+        rag (RAG): RAG whose ``db`` is kept up to date.
+        cache (IndexCache): Cache holding the per-file indexes.
+        preprocessing_kwargs (dict): Extra arguments given to the preprocessing.
+        ann (dict): Arguments of the ``IVFPQIndex``, None for exact search.
+    """
+
+    def __init__(
+        self,
+        rag,
+        cache: IndexCache,
+        preprocessing_kwargs: dict = None,
+        ann: dict = None,
+    ):
+        self.rag = rag
+        self.cache = cache
+        self.preprocessing_kwargs = preprocessing_kwargs or {}
+        self.files = {}  # path -> (stat signature, digest)
+        self.ids = {}  # digest -> docstore ids of its chunks
+        self.ann_config = ann or None
+        self.ann = IVFPQIndex(**ann) if ann else None
+        self.lexical = BM25Index()
+        self.text_bytes = {}  # digest -> size of its chunk texts
+        self.rag.db = None
+        self.store = None  # MappedVectorStore once compacted
+        # Changes on every update; scopes memoized search results
+        self.version = next(_versions)
+        self.budget = None
+        self.spill = None  # file holding the index while unloaded
+        self.last_used = time.monotonic()
+        self._users = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(path: str):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def add(self, path: str, digest: str = None, progress=None):
+        """
+        Index a file and merge its chunks into the live vector store.
+        """
+        self._thaw()
+        if path in self.files:
+            self.remove(path)
+        signature = self._signature(path)
+        digest = digest or cached_file_digest(path)
+        # The same content under another name is indexed only once.
+        if digest not in self.ids:
+            file_db = load_file_index(
+                self.rag,
+                self.cache,
+                path,
+                digest,
+                self.preprocessing_kwargs,
+                progress,
+            )
+            self.ids[digest] = list(file_db.index_to_docstore_id.values())
+            if self.ann is not None:
+                self.ann.add(self.ids[digest], _vectors(file_db))
+            texts = [
+                file_db.docstore.search(_id).page_content for _id in self.ids[digest]
+            ]
+            self.lexical.add(self.ids[digest], texts)
+            self.text_bytes[digest] = sum(len(text) for text in texts)
+            if self.rag.db is None:
+                self.rag.db = file_db
+            else:
+                self.rag.db.merge_from(file_db)
+            self.version = next(_versions)
+        self.files[path] = (signature, digest)
+
+    def remove(self, path: str):
+        """
+        Drop a file's chunks from the live vector store.
+        """
+        self._thaw()
+        _, digest = self.files.pop(path)
+        if any(other == digest for _, other in self.files.values()):
+            return
+        ids = self.ids.pop(digest)
+        self.text_bytes.pop(digest, None)
+        if ids:
+            self.rag.db.delete(ids)
+            if self.ann is not None:
+                self.ann.remove(ids)
+            self.lexical.remove(ids)
+            self.version = next(_versions)
+
+    def fork(self):
+        """
+        Copy the index so it can be updated without touching the original.
+
+        Indexes shared between sessions are read-only; a session that adds
+        or removes documents forks the shared index and updates its copy.
+        The embedding model and the preprocessing are shared, not copied.
+        """
+        from langchain_community.vectorstores import FAISS
+
+        with self.in_use():
+            clone = copy.copy(self)
+            clone.rag = copy.copy(self.rag)
+            clone.store = None
+            if self.store is not None:
+                clone.rag.db = self._faiss_from_store()
+            elif self.rag.db is not None:
+                clone.rag.db = FAISS.deserialize_from_bytes(
+                    self.rag.db.serialize_to_bytes(),
+                    self.rag.model,
+                    allow_dangerous_deserialization=True,
+                )
+            clone.ann = copy.deepcopy(self.ann)
+            if clone.ann is not None and self.store is not None:
+                clone.ann.attach(self.store.ids(), self.store.vectors())
+            clone.lexical = copy.deepcopy(self.lexical)
+        clone.files = dict(self.files)
+        clone.ids = {digest: list(ids) for digest, ids in self.ids.items()}
+        clone.text_bytes = dict(self.text_bytes)
+        clone.budget = None
+        clone.spill = None
+        clone._users = 0
+        clone._lock = threading.Lock()
+        return clone
+
+    @property
+    def loaded(self) -> bool:
+        return self.spill is None
+
+    @property
+    def empty(self) -> bool:
+        return self.rag.db is None and self.store is None
+
+    def texts(self, ids: list) -> list:
+        """Texts of the chunks with these docstore ids."""
+        if self.store is not None:
+            return self.store.texts(ids)
+        return [self.rag.db.docstore.search(_id).page_content for _id in ids]
+
+    def _all_vectors(self):
+        # Docstore ids and vectors, in the same order
+        if self.store is not None:
+            return self.store.ids(), self.store.vectors()
+        db = self.rag.db
+        ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+        return ids, _vectors(db)
+
+    def _faiss_from_store(self):
+        from langchain_community.vectorstores import FAISS
+
+        store = self.store
+        chunks = [store.chunk(row) for row in range(len(store))]
+        return FAISS.from_embeddings(
+            [(chunk["text"], vector) for chunk, vector in zip(chunks, store.vectors())],
+            self.rag.model,
+            metadatas=[chunk["metadata"] for chunk in chunks],
+            ids=store.ids(),
+        )
+
+    def _attach_ann(self):
+        if self.ann is not None and self.store is not None:
+            self.ann.attach(self.store.ids(), self.store.mapped_vectors())
+
+    def _thaw(self):
+        # Updates go to an in-memory vector store
+        if self.store is not None:
+            self.rag.db = self._faiss_from_store()
+            if self.ann is not None:
+                self.ann.attach(self.store.ids(), self.store.vectors())
+            self.store.close()
+            self.store = None
+
+    def compact(self, stores=None):
+        """
+        Move the vectors and chunk texts to a memory-mapped store and drop
+        the in-memory vector store.
+
+        The store is named after the indexed content, so every process
+        holding the same documents maps the same files.
+        Args:
+            stores (VectorStoreCache): Where the stores live; by default the
+                process-wide one. Nothing happens if its ``dtype`` is None.
+        """
+        stores = stores or get_vector_stores()
+        with self.in_use():
+            db = self.rag.db
+            if stores.dtype is None or db is None or not db.index.ntotal:
+                return
+            ids, vectors = self._all_vectors()
+            # The ids too: the lexical index refers to the chunks by id
+            content = (preprocessing_config(self.rag, self.preprocessing_kwargs), ids)
+
+            def write(directory, dtype):
+                documents = [db.docstore.search(_id) for _id in ids]
+                write_vector_store(
+                    directory,
+                    ids,
+                    vectors,
+                    [document.page_content for document in documents],
+                    [document.metadata for document in documents],
+                    dtype,
+                )
+
+            self.store = stores.open(content, write)
+            self.rag.db = None
+            self._attach_ann()
+        # A new store may take the others past their size cap
+        stores.prune(keep=os.path.basename(self.store.directory))
+
+    @contextlib.contextmanager
+    def in_use(self):
+        """
+        Make sure the index is in memory, and keep it there, while searching it.
+        """
+        with self._lock:
+            if self.spill is not None:
+                self._reload()
+            self._users += 1
+            self.last_used = time.monotonic()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._users -= 1
+            if self.budget is not None:
+                self.budget.enforce(keep=self)
+
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the loaded index."""
+        db = self.rag.db
+        if self.empty or self.spill is not None:
+            return 0
+        # The pages of a mapped store are shared and reclaimable
+        size = self.lexical.memory_bytes()
+        if db is not None:
+            size += db.index.ntotal * db.index.d * 4 + sum(self.text_bytes.values())
+        if self.ann is not None:
+            size += self.ann.memory_bytes()
+        return size
+
+    def unload(self, directory: str) -> bool:
+        """
+        Write the index to a file in ``directory`` and drop it from memory.
+        Returns:
+            bool: False if it is in use, already unloaded or empty.
+        """
+        with self._lock:
+            if self._users or self.spill is not None or self.empty:
+                return False
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{uuid.uuid4().hex}.spill")
+            with open(path + ".tmp", "wb") as f:
+                db = self.rag.db
+                data = db.serialize_to_bytes() if db is not None else None
+                pickle.dump((data, self.lexical, self.ann), f)
+            os.replace(path + ".tmp", path)
+            self.spill = path
+            self.rag.db = None
+            self.lexical = self.ann = None
+            return True
+
+    def _reload(self):
+        from langchain_community.vectorstores import FAISS
+
+        with open(self.spill, "rb") as f:
+            data, self.lexical, self.ann = pickle.load(f)
+        if data is not None:
+            self.rag.db = FAISS.deserialize_from_bytes(
+                data, self.rag.model, allow_dangerous_deserialization=True
+            )
+        os.remove(self.spill)
+        self.spill = None
+        self._attach_ann()
+        if self.budget is not None:
+            self.budget.reloads += 1
+
+    def close(self):
+        # Called by the pool on eviction
+        if self.store is not None:
+            self.store.close()
+        if self.spill is not None:
+            try:
+                os.remove(self.spill)
+            except FileNotFoundError:
+                pass
+
+    def configure_ann(self, ann: dict = None):
+        """
+        Switch to exact search (None) or to an approximate index with these
+        parameters, built from the vectors already indexed.
+        """
+        ann = ann or None
+        if ann == self.ann_config:
+            return
+        if ann and self.ann_config:
+            keys = set(ann) | set(self.ann_config)
+            changed = {k for k in keys if ann.get(k) != self.ann_config.get(k)}
+            # Search-time parameters do not need a new index
+            if changed <= {"nprobe", "rerank"}:
+                for key in changed:
+                    setattr(self.ann, key, ann[key])
+                self.ann_config = ann
+                self.version = next(_versions)
+                return
+        self.ann_config = ann
+        self.ann = IVFPQIndex(**ann) if ann else None
+        if self.ann is not None and not self.empty:
+            self.ann.add(*self._all_vectors())
+            self._attach_ann()
+        self.version = next(_versions)
+
+    def search_ids(self, vector, k: int = 4) -> list:
+        """
+        Docstore ids of the ``k`` chunks nearest to an embedded query.
+        """
+        db = self.rag.db
+        if self.empty:
+            return []
+        if self.ann is not None:
+            return self.ann.search(vector, k)
+        if self.store is not None:
+            return self.store.search(vector, k)
+        _, positions = db.index.search(np.asarray([vector], dtype=np.float32), k)
+        return [db.index_to_docstore_id[p] for p in positions[0] if p != -1]
+
+    def hybrid_search_ids(
+        self, query: str, vector, k: int = 4, candidates: int = 20, reorder=False
+    ) -> list:
+        """
+        Docstore ids of the ``k`` best chunks by vector and BM25 search,
+        fused by reciprocal rank.
+        Args:
+            query (str): The question, for the lexical search.
+            vector: Its embedding, for the vector search.
+            k (int): Number of chunks to return.
+            candidates (int): Chunks taken from each search before fusion.
+            reorder (bool): Rerank the fused candidates by query coverage.
+        """
+        if self.empty:
+            return []
+        candidates = max(candidates, k)
+        fused = reciprocal_rank_fusion(
+            [
+                self.search_ids(vector, candidates),
+                self.lexical.search(query, candidates),
+            ]
+        )
+        if reorder:
+            fused = fused[:candidates]
+            fused = rerank(query, fused, self.texts(fused))
+        return fused[:k]
+
+    def sync(self, progress=None):
+        """
+        Bring the index in line with the PDFs currently under ``rag.path``.
+        Args:
+            progress (callable): Called as ``progress(stage, fraction, detail)``
+                for the "parse", "chunk", "embed" and "index" stages.
+        Returns:
+            tuple: Lists of the added and removed file paths.
+        """
+        current = set(glob(os.path.join(self.rag.path, "*.pdf")))
+        removed = [path for path in self.files if path not in current]
+
+        changed = []
+        for path in sorted(current):
+            known = self.files.get(path)
+            if known is not None and known[0] == self._signature(path):
+                continue
+            digest = cached_file_digest(path)
+            if known is not None and known[1] == digest:
+                self.files[path] = (self._signature(path), digest)
+                continue
+            changed.append((path, digest))
+
+        for done, (path, digest) in enumerate(changed):
+            name = os.path.basename(path)
+            self.add(
+                path,
+                digest,
+                progress and (lambda stage, fraction: progress(stage, fraction, name)),
+            )
+            if progress:
+                progress("index", (done + 1) / len(changed), name)
+        # After the additions, so content that only moved (e.g. to another
+        # workspace) is not dropped and loaded again
+        for path in removed:
+            self.remove(path)
+        return [path for path, _ in changed], removed
+
+
+def create_rag(path: str, rag_action: str, preprocessing_kwargs: dict):
+    """
+    Build the RAG for a preprocessing configuration chosen in the UI.
+    """
+    from services.rag import RAG
+
+    if rag_action == "PyMuPDFPreprocessing":
+        from services.parallel_preprocessing import ParallelPyMuPDFPreprocessing
+
+        return RAG(
+            path=path,
+            preprocessing=ParallelPyMuPDFPreprocessing,
+            **preprocessing_kwargs,
+        )
+    return RAG(path=path)
+
+
+def load_shared_index(
+    path: str,
+    rag_action: str,
+    preprocessing_kwargs: dict,
+    cache: IndexCache,
+    previous: Lease = None,
+    progress=None,
+    ann: dict = None,
+    stores: VectorStoreCache = None,
+) -> Lease:
+    """
+    Get the index of a directory from the process-wide pool.
+
+    Sessions with the same documents and configuration share one read-only
+    index. Otherwise the index is derived from ``previous`` when it has the
+    same configuration: it is forked and only the changed files are synced.
+    Args:
+        path (str): Directory holding the PDFs.
+        rag_action (str): Name of the preprocessing chosen in the UI.
+        preprocessing_kwargs (dict): Extra arguments given to the preprocessing.
+        cache (IndexCache): Cache holding the per-file indexes.
+        previous (Lease): The session's current index, left untouched.
+        progress (callable): Forwarded to ``IncrementalIndex.sync``.
+        ann (dict): Parameters of the approximate index, None for exact search.
+        stores (VectorStoreCache): Forwarded to ``IncrementalIndex.compact``.
+    Returns:
+        Lease: Lease whose ``value`` is the ``IncrementalIndex``.
+    """
+    key = document_set_key(path, rag_action, preprocessing_kwargs, ann)
+
+    def build():
+        if previous is not None and previous.key[:3] == key[:3]:
+            index = previous.value.fork()
+            index.rag.path = path
+            index.configure_ann(ann)
+        else:
+            rag = create_rag(path, rag_action, preprocessing_kwargs)
+            index = IncrementalIndex(rag, cache, preprocessing_kwargs, ann)
+        index.sync(progress)
+        index.compact(stores)
+        get_memory_budget().register(index)
+        return index
+
+    return get_pool().lease(key, build)
@@ -0,0 +1,121 @@
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    A unit of background work with per-stage progress and cancellation.
+
+    The job function receives the job as first argument and calls
+    ``report(stage, fraction)`` as it goes; ``report`` raises
+    ``JobCancelled`` once ``cancel`` has been requested, which is how
+    cancellation reaches the work.
+    """
+
+    def __init__(self, job_id: int, stages=()):
+        self.id = job_id
+        self.stages = tuple(stages)
+        self.progress = {stage: 0.0 for stage in self.stages}
+        self.stage = None
+        self.detail = None
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def fraction(self) -> float:
+        if not self.progress:
+            return 1.0 if self.done else 0.0
+        return sum(self.progress.values()) / len(self.progress)
+
+    def report(self, stage: str, fraction: float, detail: str = None):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+        if stage in self.progress:
+            # Stages before the current one are complete
+            for previous in self.stages[: self.stages.index(stage)]:
+                self.progress[previous] = 1.0
+            self.progress[stage] = min(max(fraction, 0.0), 1.0)
+        self.stage = stage
+        if detail is not None:
+            self.detail = detail
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _run(self, fn, args, kwargs):
+        if self._cancelled.is_set():
+            self.status = "cancelled"
+        else:
+            self.status = "running"
+            try:
+                self.result = fn(self, *args, **kwargs)
+                self.status = "done"
+                for stage in self.stages:
+                    self.progress[stage] = 1.0
+            except JobCancelled:
+                self.status = "cancelled"
+            except Exception as e:
+                self.status = "failed"
+                self.error = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+        self.finished = time.time()
+        self._done.set()
+
+
+class JobQueue:
+    """
+    Runs jobs on a small pool of background threads, outside of the Streamlit
+    script run, so they are neither blocked nor interrupted by reruns.
+    Args:
+        workers (int): Number of jobs running at the same time.
+        max_finished (int): Finished jobs kept around for inspection.
+    """
+
+    def __init__(self, workers: int = 2, max_finished: int = 100):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job"
+        )
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, stages=(), **kwargs) -> Job:
+        """
+        Queue ``fn(job, *args, **kwargs)`` and return its job.
+        """
+        job = Job(next(self._ids), stages)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.done]
+            for old in finished[: max(0, len(finished) - self.max_finished)]:
+                del self._jobs[old.id]
+        self._executor.submit(job._run, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: int) -> Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(not job.done for job in self._jobs.values())
@@ -0,0 +1,198 @@
+import math
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Words, numbers and codes such as "E-1042", "x86_64" or "v2.3.1"
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_SEPARATORS = re.compile(r"[-./:_]")
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercased terms of a text. Compound codes are kept whole and also
+    split into their parts, so "E-1042" matches both "E-1042" and "1042".
+    """
+    terms = []
+    for match in _TOKEN.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        parts = _SEPARATORS.split(term)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part)
+    return terms
+
+
+class BM25Index:
+    """
+    Inverted index over chunk texts, ranked with Okapi BM25.
+
+    Postings are kept per term in ``array`` buffers of document numbers and
+    term frequencies (4 and 2 bytes per entry), appended to as chunks are
+    added and copied into NumPy arrays at query time. Removed chunks are only
+    marked dead; once they are more than ``max_dead`` of the index the
+    postings are rewritten without them. Until then document frequencies
+    and lengths still count them, which slightly blurs the scores.
+    Args:
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+        max_dead (float): Fraction of dead chunks that triggers a compaction.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_dead: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.max_dead = max_dead
+        self._terms = {}  # term -> term number
+        self._postings = []  # per term: (array of doc numbers, array of freqs)
+        self._ids = []  # doc number -> chunk id
+        self._numbers = {}  # chunk id -> doc number
+        self._lengths = array("I")
+        self._alive = bytearray()
+        self._total_length = 0
+        self._entries = 0  # postings entries, dead ones included
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the index."""
+        # 6 bytes per posting, plus roughly 100 per dictionary entry and id
+        entries = len(self._terms) + len(self._ids) + len(self._numbers)
+        return 6 * self._entries + 5 * len(self._ids) + 100 * entries
+
+    def add(self, ids: list, texts: list):
+        """
+        Index chunks under their ids; an id already present is replaced.
+        """
+        self.remove([_id for _id in ids if _id in self._numbers])
+        for _id, text in zip(ids, texts):
+            number = len(self._ids)
+            terms = tokenize(text)
+            counts = Counter(terms)
+            for term, count in counts.items():
+                term_number = self._terms.get(term)
+                if term_number is None:
+                    term_number = self._terms[term] = len(self._postings)
+                    self._postings.append((array("I"), array("H")))
+                docs, freqs = self._postings[term_number]
+                docs.append(number)
+                freqs.append(min(count, 0xFFFF))
+            self._entries += len(counts)
+            self._ids.append(_id)
+            self._numbers[_id] = number
+            self._lengths.append(len(terms))
+            self._alive.append(1)
+            self._total_length += len(terms)
+
+    def remove(self, ids: list):
+        """
+        Remove chunks by id; unknown ids are ignored.
+        """
+        for _id in ids:
+            number = self._numbers.pop(_id, None)
+            if number is not None:
+                self._alive[number] = 0
+        dead = len(self._ids) - len(self)
+        if dead and dead > self.max_dead * len(self._ids):
+            self._compact()
+
+    def _compact(self):
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        renumber = np.cumsum(alive) - 1
+        terms, postings = {}, []
+        for term, term_number in self._terms.items():
+            docs, freqs = self._postings[term_number]
+            docs = np.array(docs, dtype=np.uint32)
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            terms[term] = len(postings)
+            postings.append(
+                (
+                    array("I", renumber[docs[keep]].astype(np.uint32).tobytes()),
+                    array("H", np.array(freqs, dtype=np.uint16)[keep].tobytes()),
+                )
+            )
+        lengths = np.array(self._lengths, dtype=np.uint32)[alive]
+        self._terms, self._postings = terms, postings
+        self._ids = [_id for _id, keep in zip(self._ids, alive) if keep]
+        self._numbers = {_id: number for number, _id in enumerate(self._ids)}
+        self._lengths = array("I", lengths.tobytes())
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._total_length = int(lengths.sum())
+        self._entries = sum(len(docs) for docs, _ in postings)
+
+    def search(self, query: str, k: int = 4) -> list:
+        """
+        Ids of the ``k`` chunks with the highest BM25 score, best first.
+        Chunks sharing no term with the query are never returned.
+        """
+        count = len(self._ids)
+        if not len(self) or k <= 0:
+            return []
+        lengths = np.array(self._lengths, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / count))
+        scores = np.zeros(count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_number = self._terms.get(term)
+            if term_number is None:
+                continue
+            docs, freqs = self._postings[term_number]
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            docs = np.array(docs, dtype=np.int64)
+            tf = np.array(freqs, dtype=np.float32)
+            # A term occurs once per document in its postings
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        scores[np.frombuffer(self._alive, dtype=np.uint8) == 0] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            best = np.argpartition(scores[candidates], -k)[-k:]
+            candidates = candidates[best]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self._ids[number] for number in order]
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60, weights: list = None) -> list:
+    """
+    Merge ranked lists of ids: each id scores ``weight / (k + rank)`` in
+    every list it appears in. Only ranks count, so BM25 and vector
+    distances need no common scale.
+    Returns:
+        list: Ids by decreasing fused score.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, _id in enumerate(ranking, start=1):
+            scores[_id] = scores.get(_id, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def rerank(query: str, ids: list, texts: list) -> list:
+    """
+    Reorder fused candidates by how well they cover the query.
+
+    A light second stage instead of a cross-encoder: each candidate scores
+    the share of the query's distinct terms it contains, with codes and
+    numbers (terms with a digit) counting double, plus a bonus if it
+    contains the whole query verbatim. Ties keep the fused order.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return list(ids)
+    weight = {term: 2.0 if any(c.isdigit() for c in term) else 1.0 for term in terms}
+    total = sum(weight.values())
+    phrase = " ".join(query.lower().split())
+
+    def score(item):
+        position, text = item
+        present = terms & set(tokenize(text))
+        coverage = sum(weight[term] for term in present) / total
+        verbatim = phrase in " ".join(text.lower().split())
+        return -(coverage + verbatim), position
+
+    order = sorted(enumerate(texts), key=score)
+    return [ids[position] for position, _ in order]
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+import weakref
+
+
+class MemoryBudget:
+    """
+    Process-wide memory budget of the in-memory indexes.
+
+    Indexes register themselves once built. Whenever the estimated size of
+    the loaded ones exceeds ``max_bytes``, the least recently used are
+    written to ``spill_dir`` and dropped from memory, except those being
+    searched at that moment; an evicted index is read back the next time
+    it is used. Registration holds no reference, so indexes still go away
+    with the last session using them.
+    Args:
+        max_bytes (int): Memory the loaded indexes may use together.
+        spill_dir (str): Directory of the evicted indexes.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str = "./cache/spill"):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._indexes = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.reloads = 0
+        self._remove_orphans()
+
+    def _remove_orphans(self, min_age: float = 24 * 3600):
+        # Left behind by processes that did not shut down cleanly
+        if not os.path.isdir(self.spill_dir):
+            return
+        now = time.time()
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if now - os.path.getmtime(path) > min_age:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def register(self, index):
+        """
+        Put an index under the budget. It must provide ``loaded``,
+        ``last_used``, ``memory_bytes()`` and ``unload(directory)``.
+        """
+        with self._lock:
+            self._indexes.add(index)
+        index.budget = self
+        self.enforce(keep=index)
+
+    def enforce(self, keep=None):
+        """
+        Evict least recently used indexes until the loaded ones fit.
+
+        The victims are chosen under the lock and written out after it is
+        released, so other indexes are not held up by the pickling.
+        Args:
+            keep: Index that is not evicted, typically the one just used.
+        """
+        with self._lock:
+            loaded = [index for index in self._indexes if index.loaded]
+            sizes = [(index, index.memory_bytes()) for index in loaded]
+            total = sum(size for _, size in sizes)
+            victims = []
+            for index, size in sorted(sizes, key=lambda item: item[0].last_used):
+                if total <= self.max_bytes:
+                    break
+                if index is not keep:
+                    victims.append(index)
+                    total -= size
+        # One in use by now refuses; the next call evicts another
+        for index in victims:
+            if index.unload(self.spill_dir):
+                with self._lock:
+                    self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexes = list(self._indexes)
+        loaded = [index for index in indexes if index.loaded]
+        return {
+            "indexes": len(indexes),
+            "loaded": len(loaded),
+            "bytes": sum(index.memory_bytes() for index in loaded),
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+        }
+
+
+_budget = MemoryBudget(int(os.environ.get("INDEX_MEMORY_MB", "1024")) << 20)
+
+
+def get_memory_budget() -> MemoryBudget:
+    """
+    Return the memory budget shared by every session of this server process.
+    """
+    return _budget
@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+def _list_ollama_models(host: str = None, timeout: float = 5) -> list:
+    import ollama
+
+    client = ollama.Client(host=host, timeout=timeout)
+    return [model.model for model in client.list()["models"]]
+
+
+class ModelCatalog:
+    """
+    Cached list of the models an Ollama server offers.
+
+    Pages render from the cached list and never wait on the server once it
+    has been fetched: after ``ttl`` seconds a refresh starts in a background
+    thread and the stale list is served meanwhile. Only the very first
+    lookup of a host blocks. Failures are cached for ``error_ttl`` seconds
+    so a server that is down is not queried on every rerun.
+    Args:
+        ttl (float): Seconds a fetched list is considered fresh.
+        error_ttl (float): Seconds a failed fetch is remembered.
+        fetch (callable): ``fetch(host)`` returning the model names.
+    """
+
+    def __init__(self, ttl: float = 60, error_ttl: float = 10, fetch=None):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.fetch = fetch or _list_ollama_models
+        self._entries = {}  # host -> [models, error, fetched_at]
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _refresh(self, host):
+        try:
+            entry = [self.fetch(host), None, time.monotonic()]
+        except Exception as e:
+            with self._lock:
+                previous = self._entries.get(host)
+            # Keep serving the last good list if there is one
+            models = previous[0] if previous else None
+            entry = [models, e, time.monotonic()]
+        with self._lock:
+            self._entries[host] = entry
+            self._refreshing.discard(host)
+        return entry
+
+    def models(self, host: str = None) -> list:
+        """
+        Return the model names of ``host`` (None for the default server).
+        Raises:
+            ConnectionError: The server could not be reached and no earlier
+                list is available.
+        """
+        with self._lock:
+            entry = self._entries.get(host)
+            stale = entry is not None and (
+                time.monotonic() - entry[2] > (self.error_ttl if entry[1] else self.ttl)
+            )
+            if stale and host not in self._refreshing:
+                self._refreshing.add(host)
+                threading.Thread(
+                    target=self._refresh, args=(host,), daemon=True
+                ).start()
+        if entry is None:
+            entry = self._refresh(host)
+        models, error, _ = entry
+        if models is None:
+            raise ConnectionError(f"Could not list the Ollama models: {error}")
+        return models
+
+    def invalidate(self, host: str = None):
+        with self._lock:
+            self._entries.pop(host, None)
+
+
+_catalog = ModelCatalog()
+
+
+def get_model_catalog() -> ModelCatalog:
+    """
+    Return the model catalog shared by every page of this server process.
+    """
+    return _catalog
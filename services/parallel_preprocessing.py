@@ -0,0 +1,175 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from glob import glob
+
+import pymupdf
+import pytesseract
+from chatbot_rag.preprocessing import BasePreprocessing, PyMuPDFPreprocessing
+from langchain_community.document_loaders.parsers import PyMuPDFParser
+from langchain_core.documents.base import Blob
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Worker processes shared by every parse of the process.
+
+    Spawning a worker imports PyMuPDF and LangChain again, which took longer
+    than parsing a small PDF, so the processes are started once and kept.
+    A parse configured with another number of workers replaces the pool;
+    the old one finishes the tasks it was given and its processes exit.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Spawned workers do not inherit the locks of the server's threads
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def _shutdown_process_pool():
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_pages(path, start, stop, parser_kwargs, tesseract_cmd):
+    """
+    Parse pages ``[start, stop)`` of a PDF in a worker process.
+
+    The range is copied into a standalone PDF and run through the same
+    PyMuPDF parser as the serial path, so text, OCR and tables come out
+    exactly as they would for the whole document.
+    Returns:
+        list: The content of each page, in order.
+    """
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with pymupdf.open(path) as source, pymupdf.open() as part:
+        part.insert_pdf(source, from_page=start, to_page=stop - 1)
+        data = part.tobytes()
+    parser = PyMuPDFParser(**parser_kwargs)
+    blob = Blob.from_data(data, path=path, mime_type="application/pdf")
+    return [document.page_content for document in parser.lazy_parse(blob)]
+
+
+class ParallelPyMuPDFPreprocessing(PyMuPDFPreprocessing):
+    """
+    PyMuPDFPreprocessing that parses page ranges in a pool of worker processes.
+
+    Each PDF is split into ranges of ``pages_per_task`` pages; text, image OCR
+    and table extraction run in parallel and the pages are merged back in
+    order before chunking, giving the same chunks as the serial path. The
+    worker processes are shared by all preprocessings of the process. With a
+    single worker, or fewer than ``min_parallel_pages`` pages, it falls back
+    to the serial path.
+    Args:
+        workers (int): Number of worker processes. Defaults to the CPU count.
+        pages_per_task (int): Pages handed to a worker at a time.
+        min_parallel_pages (int): Fewest pages worth sending to the workers.
+    """
+
+    def __init__(self, path, chunks_size=512, chunk_overlap=100, *args, **kwargs):
+        super().__init__(path, chunks_size, chunk_overlap, *args, **kwargs)
+        self.workers = kwargs.get("workers") or os.cpu_count() or 1
+        self.pages_per_task = kwargs.get("pages_per_task", 8)
+        self.min_parallel_pages = kwargs.get("min_parallel_pages", 16)
+        # Set by the caller to follow parsing, called with the parsed fraction
+        self.progress = None
+        self.parser_kwargs = {
+            "extract_images": self.extract_images,
+            "images_parser": self.images_parser,
+            "images_inner_format": self.images_inner_format,
+            "extract_tables": self.extract_tables_mode,
+            "mode": self.mode,
+        }
+
+    def report(self, fraction: float):
+        if self.progress is not None:
+            self.progress(fraction)
+
+    def _files(self) -> list:
+        if os.path.isfile(self.path):
+            return [self.path]
+        return sorted(glob(os.path.join(self.path, "*.pdf")))
+
+    def _extract_text_from_pdf(self) -> str:
+        """
+        Extract the text of the PDF files with PyMuPDF, in parallel.
+        Returns:
+            str: The content of every page, in order, one per line block.
+        """
+        tasks = []
+        total_pages = 0
+        for path in self._files():
+            with pymupdf.open(path) as document:
+                page_count = document.page_count
+            total_pages += page_count
+            for start in range(0, page_count, self.pages_per_task):
+                tasks.append(
+                    (path, start, min(start + self.pages_per_task, page_count))
+                )
+
+        if min(self.workers, len(tasks)) <= 1 or total_pages < self.min_parallel_pages:
+            pages = []
+            for document in self.primary_loader.lazy_load():
+                pages.append(document.page_content)
+                self.report(len(pages) / max(1, total_pages))
+            return "".join(page + "\n" for page in pages)
+
+        tesseract_cmd = (
+            os.path.abspath(self.tesseract_path) if self.extract_images else None
+        )
+        pool = _get_process_pool(self.workers)
+        futures = []
+        try:
+            for path, start, stop in tasks:
+                futures.append(
+                    pool.submit(
+                        _parse_pages,
+                        path,
+                        start,
+                        stop,
+                        self.parser_kwargs,
+                        tesseract_cmd,
+                    )
+                )
+            pages = []
+            for done, future in enumerate(futures, start=1):
+                pages.extend(future.result())
+                self.report(done / len(futures))
+        except BrokenProcessPool:
+            # A worker died; the next parse starts new ones
+            _discard_process_pool(pool)
+            raise
+        finally:
+            # The pool is shared: only drop this parse's pending tasks
+            for future in futures:
+                future.cancel()
+
+        return "".join(page + "\n" for page in pages)
+
+    # Extract then chunk, like BasePreprocessing, instead of the fused
+    # PyMuPDFPreprocessing._preprocess
+    _preprocess = BasePreprocessing._preprocess
@@ -0,0 +1,128 @@
+import threading
+import time
+import weakref
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.ready = False
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class Lease:
+    """
+    A reference to a pooled object, released explicitly or when garbage collected.
+
+    Streamlit has no hook for the end of a session, so sessions keep their
+    leases in ``st.session_state``; when the session is dropped the lease is
+    collected and the reference is given back to the pool.
+    """
+
+    def __init__(self, pool, key, value):
+        self.key = key
+        self.value = value
+        self._finalizer = weakref.finalize(self, pool.release, key)
+
+    def release(self):
+        self._finalizer()
+
+
+class ResourcePool:
+    """
+    Process-wide pool of shared objects with reference counting.
+
+    Objects are built once per key by the given factory and handed out to
+    every caller asking for the same key. An object nobody references any
+    more stays cached for ``idle_timeout`` seconds and is then evicted.
+    Builds of different keys run concurrently; callers asking for a key that
+    is being built wait for it.
+    Args:
+        idle_timeout (float): Seconds an unreferenced object is kept.
+    """
+
+    def __init__(self, idle_timeout: float = 600):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def acquire(self, key, factory):
+        """
+        Return the object stored under ``key``, building it with ``factory()``
+        if needed, and take a reference to it.
+        """
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            entry.refs += 1
+
+        with entry.lock:
+            if not entry.ready:
+                try:
+                    entry.value = factory()
+                except Exception:
+                    with self._lock:
+                        entry.refs -= 1
+                        if entry.refs == 0 and self._entries.get(key) is entry:
+                            del self._entries[key]
+                    raise
+                entry.ready = True
+        entry.last_used = time.monotonic()
+        return entry.value
+
+    def lease(self, key, factory) -> Lease:
+        """
+        Like ``acquire`` but wraps the object in a ``Lease``.
+        """
+        return Lease(self, key, self.acquire(key, factory))
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                entry.last_used = time.monotonic()
+            self._evict_idle()
+
+    def peek(self, key):
+        """
+        Return the object stored under ``key`` without taking a reference.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry.value if entry is not None and entry.ready else None
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.refs == 0 and now - entry.last_used > self.idle_timeout:
+                del self._entries[key]
+                close = getattr(entry.value, "close", None)
+                if callable(close):
+                    close()
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle()
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {"key": key, "refs": entry.refs, "idle": now - entry.last_used}
+                for key, entry in self._entries.items()
+            ]
+
+
+_pool = ResourcePool()
+
+
+def get_pool() -> ResourcePool:
+    """
+    Return the pool shared by every session of this server process.
+    """
+    return _pool
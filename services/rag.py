@@ -0,0 +1,43 @@
+from chatbot_rag.RAG import RAG as _RAG
+
+from services.batching import BatchingEmbeddings
+from services.pool import Lease, get_pool
+
+
+def lease_embeddings(model_name: str, load=None) -> Lease:
+    """
+    Get an embedding model from the process-wide pool.
+    Args:
+        model_name (str): Name of the sentence-transformers model.
+        load (callable): ``load(model_name)`` building it; chatbot_rag's
+            loader by default.
+    Returns:
+        Lease: Lease whose ``value`` is the (batching) embedding model.
+    Raises:
+        RuntimeError: The model could not be loaded.
+    """
+    # The base loader does not use its instance
+    load = load or (lambda name: _RAG._get_embedding_model(None, name))
+
+    def build():
+        model = load(model_name)
+        if model is None:
+            # chatbot_rag prints the error and returns None
+            raise RuntimeError(f"Could not load the embedding model '{model_name}'.")
+        return BatchingEmbeddings(model)
+
+    return get_pool().lease(("embeddings", model_name), build)
+
+
+class RAG(_RAG):
+    """
+    RAG that shares its embedding model with every other RAG of the process.
+
+    The model is taken from the process-wide pool, keyed by its name, instead
+    of being loaded again for each session, and concurrent queries from all
+    sessions are embedded in batches.
+    """
+
+    def _get_embedding_model(self, model_name: str):
+        self._model_lease = lease_embeddings(model_name, super()._get_embedding_model)
+        return self._model_lease.value
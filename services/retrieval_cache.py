@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RetrievalCache:
+    """
+    Memoizes query embeddings and ranked chunk ids in front of the vector store.
+
+    Query embeddings are keyed by embedding model and query text, so they are
+    shared by every index built with the same model. Search results are
+    keyed by the index version: any ingestion gives the index a new version,
+    which makes its older results unreachable, and they age out of the LRU.
+    Hits are credited with the average cost of a miss to estimate the time
+    saved.
+    Args:
+        max_embeddings (int): Maximum number of memoized query embeddings.
+        max_results (int): Maximum number of memoized search results.
+    """
+
+    def __init__(self, max_embeddings: int = 4096, max_results: int = 4096):
+        self.max_embeddings = max_embeddings
+        self.max_results = max_results
+        self._embeddings = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            name: {"hits": 0, "misses": 0, "miss_seconds": 0.0, "saved_seconds": 0.0}
+            for name in ("embedding", "search")
+        }
+
+    def _get(self, store, kind, key):
+        with self._lock:
+            value = store.get(key)
+            counter = self._counters[kind]
+            if value is None:
+                counter["misses"] += 1
+                return None
+            store.move_to_end(key)
+            counter["hits"] += 1
+            counter["saved_seconds"] += counter["miss_seconds"] / counter["misses"]
+            return value
+
+    def _put(self, store, kind, key, value, elapsed, limit):
+        with self._lock:
+            self._counters[kind]["miss_seconds"] += elapsed
+            store[key] = value
+            store.move_to_end(key)
+            while len(store) > limit:
+                store.popitem(last=False)
+
+    def embed(self, rag, text: str):
+        """
+        Return the embedding of a query, computing it only once per model.
+        """
+        key = (rag.get_embedding_model_name, text)
+        vector = self._get(self._embeddings, "embedding", key)
+        if vector is None:
+            start = time.perf_counter()
+            vector = rag.model.embed_query(text)
+            self._put(
+                self._embeddings,
+                "embedding",
+                key,
+                vector,
+                time.perf_counter() - start,
+                self.max_embeddings,
+            )
+        return vector
+
+    def search(self, index, query: str, k: int = 3, **options) -> str:
+        """
+        Drop-in replacement for ``RAG._search_context`` with memoization.
+        Args:
+            index (IncrementalIndex): Index to search; its ``version`` scopes
+                the memoized results.
+            query (str): The user's question.
+            k (int): Number of chunks to retrieve.
+        Returns:
+            str: The retrieved chunks joined as in ``RAG._search_context``.
+        """
+        return "\n\n".join(self.search_chunks(index, query, k, **options))
+
+    def search_chunks(
+        self, index, query: str, k: int = 3, hybrid: bool = True, rerank=False
+    ) -> list:
+        """
+        Like ``search``, but return the chunks separately, best first.
+        Args:
+            hybrid (bool): Fuse BM25 and vector search instead of using
+                the vectors alone.
+            rerank (bool): Rerank the fused candidates by query coverage.
+        """
+        # Loads the index back if it was evicted from memory
+        with index.in_use():
+            if index.empty:
+                return []
+            key = (index.version, query, k, hybrid, hybrid and rerank)
+            ids = self._get(self._results, "search", key)
+            if ids is not None:
+                return index.texts(ids)
+
+            vector = self.embed(index.rag, query)
+            start = time.perf_counter()
+            if hybrid:
+                ids = index.hybrid_search_ids(query, vector, k, reorder=rerank)
+            else:
+                ids = index.search_ids(vector, k)
+            self._put(
+                self._results,
+                "search",
+                key,
+                ids,
+                time.perf_counter() - start,
+                self.max_results,
+            )
+            return index.texts(ids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {}
+            for kind, counter in self._counters.items():
+                lookups = counter["hits"] + counter["misses"]
+                stats[kind] = {
+                    "hits": counter["hits"],
+                    "misses": counter["misses"],
+                    "hit_ratio": counter["hits"] / lookups if lookups else 0.0,
+                    "saved_seconds": counter["saved_seconds"],
+                }
+            return stats
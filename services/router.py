@@ -0,0 +1,309 @@
+import hashlib
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class BackendHealth:
+    """
+    Rolling latency and error statistics of one backend.
+
+    Latency is the time to the first token, which is what the user waits
+    for and what hedging acts on. A backend whose recent error rate is above
+    ``max_error_rate`` is unhealthy until ``cooldown`` seconds have passed
+    since its last error, after which it is tried again.
+    Args:
+        window (int): Requests the statistics are computed over.
+        max_error_rate (float): Error rate above which the backend is avoided.
+        min_requests (int): Requests needed before the error rate counts.
+        cooldown (float): Seconds an unhealthy backend is left alone.
+    """
+
+    def __init__(
+        self,
+        window: int = 50,
+        max_error_rate: float = 0.5,
+        min_requests: int = 4,
+        cooldown: float = 30,
+    ):
+        self.max_error_rate = max_error_rate
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.last_error = None
+        self.wins = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def success(self, first_token: float):
+        with self._lock:
+            self.latencies.append(first_token)
+            self.outcomes.append(True)
+
+    def slower_than(self, elapsed: float):
+        # A cancelled loser's latency is unknown but at least ``elapsed``;
+        # without it a backend that always loses would never be measured
+        with self._lock:
+            self.latencies.append(elapsed)
+
+    def failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.last_error = time.monotonic()
+
+    def percentile(self, q: float):
+        with self._lock:
+            if not self.latencies:
+                return None
+            return float(np.percentile(self.latencies, q))
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if len(self.outcomes) < self.min_requests:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def healthy(self) -> bool:
+        if self.error_rate() <= self.max_error_rate:
+            return True
+        return time.monotonic() - self.last_error > self.cooldown
+
+    def stats(self) -> dict:
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "error_rate": self.error_rate(),
+            "healthy": self.healthy(),
+            "wins": self.wins,
+            "hedges": self.hedges,
+        }
+
+
+class _Attempt:
+    """A backend request whose tokens are pushed to the router's queue."""
+
+    def __init__(self, number, bot, context, question, events, release=None):
+        self.number = number
+        self.bot = bot
+        self.release = release
+        self.started = time.perf_counter()
+        self.cancelled = threading.Event()
+        threading.Thread(
+            target=self._run, args=(context, question, events), daemon=True
+        ).start()
+
+    def _run(self, context, question, events):
+        tokens = None
+        try:
+            tokens = self.bot.stream(context=context, question=question)
+            for token in tokens:
+                if self.cancelled.is_set():
+                    break
+                if token:
+                    events.put(("token", self, token))
+            else:
+                events.put(("done", self, None))
+        except Exception as e:
+            events.put(("error", self, e))
+        finally:
+            close = getattr(tokens, "close", None)
+            if self.cancelled.is_set() and close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+            if self.release is not None:
+                self.release()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class RouterChatbot:
+    """
+    Chatbot spreading requests over several backends by measured latency.
+
+    Each request goes to the healthy backend with the lowest median time to
+    first token; backends without measurements yet are tried first. With
+    hedging, if the first token has not arrived after the backend's p95
+    (at least ``min_hedge_delay``), the request is also sent to the next
+    backend, the first one to produce a token wins and the other request is
+    cancelled. A backend failing before its first token is replaced by the
+    next one. It streams like the other chatbots, so the caches treat it as
+    one; the scheduler passes ``slots`` so that every backend request,
+    hedges included, counts against the limit of its server.
+    Args:
+        backends (list): Chatbots with a ``stream`` method.
+        hedge (bool): Fire a second request when the first is slow.
+        hedge_delay (float): Hedge delay before a backend has measurements.
+        min_hedge_delay (float): Lower bound of the hedge delay.
+        health (dict): Arguments of each backend's ``BackendHealth``.
+    """
+
+    def __init__(
+        self,
+        backends: list,
+        hedge: bool = True,
+        hedge_delay: float = 5.0,
+        min_hedge_delay: float = 0.5,
+        health: dict = None,
+    ):
+        if not backends:
+            raise ValueError("The router needs at least one backend.")
+        self.backends = list(backends)
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.health = [BackendHealth(**(health or {})) for _ in self.backends]
+        self.name = "router(" + ",".join(bot.name for bot in self.backends) + ")"
+        self.leases = []
+
+    def ranking(self) -> list:
+        """Backend numbers, the one to try first first."""
+
+        def score(number):
+            health = self.health[number]
+            median = health.percentile(50)
+            return (not health.healthy(), median is not None, median or 0.0)
+
+        return sorted(range(len(self.backends)), key=score)
+
+    def _hedge_after(self, number: int) -> float:
+        p95 = self.health[number].percentile(95)
+        if p95 is None:
+            return self.hedge_delay
+        return max(p95, self.min_hedge_delay)
+
+    def stream(self, context: str, question: str, slots=None):
+        """
+        Stream the answer from whichever backend answers first.
+        Args:
+            slots (callable): ``slots(bot, wait)`` takes a slot on the
+                backend's server and returns the function giving it back,
+                or None if ``wait`` is False and the server is full.
+        """
+        events = queue.Queue()
+        pending = self.ranking()
+        attempts = []
+
+        def start(wait=True):
+            number = pending[0]
+            release = None
+            if slots is not None:
+                release = slots(self.backends[number], wait)
+                if release is None:
+                    return None
+            pending.pop(0)
+            attempt = _Attempt(
+                number, self.backends[number], context, question, events, release
+            )
+            attempts.append(attempt)
+            return attempt
+
+        winner = None
+        hedge_at = None
+        start()
+        if self.hedge and pending:
+            hedge_at = time.monotonic() + self._hedge_after(attempts[0].number)
+        try:
+            while True:
+                timeout = None
+                if winner is None and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                try:
+                    kind, attempt, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_at = None
+                    slow = attempts[-1].number
+                    # A hedge on a full server would only queue behind others
+                    if start(wait=False) is not None:
+                        self.health[slow].hedges += 1
+                    continue
+
+                health = self.health[attempt.number]
+                if winner is None:
+                    if kind == "error":
+                        health.failure()
+                        running = [a for a in attempts if a is not attempt]
+                        attempts.remove(attempt)
+                        if running:
+                            continue
+                        if not pending:
+                            raise value
+                        hedge_at = None
+                        if self.hedge and len(pending) > 1:
+                            delay = self._hedge_after(start().number)
+                            hedge_at = time.monotonic() + delay
+                        else:
+                            start()
+                        continue
+                    winner = attempt
+                    health.wins += 1
+                    health.success(time.perf_counter() - attempt.started)
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel()
+                            elapsed = time.perf_counter() - other.started
+                            self.health[other.number].slower_than(elapsed)
+                if attempt is not winner:
+                    continue
+                if kind == "token":
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    health.failure()
+                    raise value
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def __call__(self, context: str, question: str) -> str:
+        return self._posprocessing_answer("".join(self.stream(context, question)))
+
+    def _posprocessing_answer(self, answer: str) -> str:
+        return self.backends[0]._posprocessing_answer(answer)
+
+    def backend_stats(self) -> list:
+        """Latency, error and hedging statistics of each backend, in order."""
+        return [
+            dict(backend=bot.name, **health.stats())
+            for bot, health in zip(self.backends, self.health)
+        ]
+
+    def close(self):
+        # Called by the pool on eviction
+        for lease in self.leases:
+            lease.release()
+        self.leases = []
+
+
+def load_router(backends: list, hedge: bool = True):
+    """
+    Get a router over several chatbots from the process-wide pool.
+    Args:
+        backends (list): Dicts of ``load_chatbot`` arguments (host,
+            model_name, token, provider), in order of preference.
+        hedge (bool): Hedge slow requests on a second backend.
+    Returns:
+        Lease: Lease whose ``value`` is the ``RouterChatbot``.
+    """
+    from services.chat import load_chatbot
+    from services.pool import get_pool
+
+    def build():
+        leases = [load_chatbot(**backend) for backend in backends]
+        router = RouterChatbot([lease.value for lease in leases], hedge=hedge)
+        router.leases = leases
+        return router
+
+    members = []
+    for backend in backends:
+        token = hashlib.sha256((backend.get("token") or "").encode()).hexdigest()
+        members.append(tuple(sorted(dict(backend, token=token).items())))
+    key = ("router", tuple(members), hedge)
+    return get_pool().lease(key, build)
@@ -0,0 +1,222 @@
+import random
+import threading
+import time
+
+from services.streams import TokenStream
+
+
+class Overloaded(Exception):
+    """Raised when a backend's queue is full and the request is turned away."""
+
+
+def backend_key(bot) -> str:
+    """
+    Name the server a chatbot talks to; concurrency is limited per server.
+    A router is named after its preferred backend.
+    """
+    backends = getattr(bot, "backends", None)
+    if backends:
+        return backend_key(backends[0])
+    server = getattr(bot, "provider", None) or getattr(bot, "host", None)
+    name = type(bot).__name__.replace("Chatbot", "").lower()
+    return f"{name}:{server}" if server else name
+
+
+def _blocking_answer(bot, context, question):
+    # Chatbots without streaming answer in one piece; this cannot be aborted
+    yield bot(context=context, question=question)
+
+
+class _Backend:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.condition = threading.Condition()
+
+
+class BotScheduler:
+    """
+    Admission control, concurrency limits, timeouts and retries for bot calls.
+
+    Each backend runs at most ``limits[backend]`` generations at a time;
+    further requests wait in a queue of at most ``max_queue`` and are
+    rejected with ``Overloaded`` beyond it. Generations go through the
+    chatbot's streaming API so a timed-out request is actually closed
+    rather than left running, and its slot is only freed once the backend
+    call has ended. Timeouts are retried after a jittered exponential
+    backoff, unless the backend already has a queue or the timed-out call
+    is still running, e.g. stuck loading the model: a retry would then
+    generate the same answer a second time next to it.
+
+    A ``RouterChatbot`` takes a slot on the server of each backend it calls,
+    hedges included; a hedge is skipped rather than queued when that
+    server is full.
+    Args:
+        limits (dict): Concurrent generations per backend key, or per kind
+            of backend ("ollama") for all its servers.
+        default_limit (int): Limit for backends not in ``limits``.
+        max_queue (int): Requests allowed to wait per backend.
+        timeout (float): Seconds allowed for a whole answer, queueing included.
+        first_token_timeout (float): Seconds to wait for each token.
+        retries (int): Extra attempts after a timeout.
+        backoff (float): Base delay in seconds of the retry backoff.
+        max_backoff (float): Upper bound of the retry backoff.
+    """
+
+    def __init__(
+        self,
+        limits: dict = None,
+        default_limit: int = 4,
+        max_queue: int = 16,
+        timeout: float = 120,
+        first_token_timeout: float = 60,
+        retries: int = 1,
+        backoff: float = 1.0,
+        max_backoff: float = 8.0,
+    ):
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def _backend(self, bot) -> _Backend:
+        key = backend_key(bot)
+        with self._lock:
+            backend = self._backends.get(key)
+            if backend is None:
+                limit = self.limits.get(key.split(":")[0], self.default_limit)
+                limit = self.limits.get(key, limit)
+                backend = self._backends[key] = _Backend(limit)
+            return backend
+
+    def _admit(self, backend: _Backend, deadline: float):
+        with backend.condition:
+            if backend.in_flight >= backend.limit and backend.queued >= self.max_queue:
+                backend.rejected += 1
+                raise Overloaded("The model is busy, please try again in a moment.")
+            backend.queued += 1
+            try:
+                while backend.in_flight >= backend.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for the model.")
+                    backend.condition.wait(remaining)
+            finally:
+                backend.queued -= 1
+            backend.in_flight += 1
+
+    def _release(self, backend: _Backend):
+        with backend.condition:
+            backend.in_flight -= 1
+            backend.completed += 1
+            backend.condition.notify()
+
+    def _slot(self, bot, deadline: float, wait: bool = True):
+        # Slots of the backends a router calls
+        backend = self._backend(bot)
+        if wait:
+            self._admit(backend, deadline)
+        else:
+            with backend.condition:
+                if backend.in_flight >= backend.limit:
+                    return None
+                backend.in_flight += 1
+        return lambda: self._release(backend)
+
+    def _backends_of(self, bot) -> list:
+        return [self._backend(b) for b in getattr(bot, "backends", None) or [bot]]
+
+    def open_stream(self, bot, context, question, timeout: float = None) -> TokenStream:
+        """
+        Wait for a slot on the bot's backend and start streaming the answer.
+
+        The slot is released when the stream ends, fails or is cancelled.
+        A router takes its slots as it calls its backends, so for routers
+        these errors are raised while reading the stream.
+        Raises:
+            Overloaded: The backend's queue is full.
+            TimeoutError: No slot became free in time.
+        """
+        timeout = timeout or self.timeout
+        start = time.monotonic()
+        on_close = None
+        if hasattr(bot, "backends"):
+            slots = lambda backend, wait: self._slot(backend, start + timeout, wait)
+            tokens = bot.stream(context=context, question=question, slots=slots)
+        else:
+            backend = self._backend(bot)
+            self._admit(backend, start + timeout)
+            on_close = lambda: self._release(backend)
+            if hasattr(bot, "stream"):
+                tokens = bot.stream(context=context, question=question)
+            else:
+                tokens = _blocking_answer(bot, context, question)
+        return TokenStream(
+            tokens,
+            timeout=self.first_token_timeout,
+            max_time=timeout - (time.monotonic() - start),
+            on_close=on_close,
+        )
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter keeps retries from many sessions from synchronizing
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def generate(self, bot, context, question, timeout: float = None) -> str:
+        """
+        Generate a full answer, retrying timeouts with jittered backoff.
+        Raises:
+            Overloaded: The backend's queue is full.
+            TimeoutError: Every attempt timed out.
+        """
+        backends = self._backends_of(bot)
+        for attempt in range(self.retries + 1):
+            stream = None
+            try:
+                stream = self.open_stream(bot, context, question, timeout)
+                for _ in stream:
+                    pass
+                return bot._posprocessing_answer(stream.text)
+            except TimeoutError:
+                started = time.monotonic()
+                delay = self._delay(attempt)
+                # The cancelled call keeps its slot until the backend lets go
+                running = stream is not None and not stream.closed.wait(delay)
+                # Retrying into a queue only adds to the overload
+                queued = any(backend.queued for backend in backends)
+                retry = attempt < self.retries and not queued and not running
+                for backend in backends:
+                    with backend.condition:
+                        backend.timeouts += 1
+                        backend.retries += retry
+                if not retry:
+                    raise
+                time.sleep(max(0.0, delay - (time.monotonic() - started)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            backends = dict(self._backends)
+        stats = {}
+        for key, backend in backends.items():
+            with backend.condition:
+                stats[key] = {
+                    "limit": backend.limit,
+                    "queued": backend.queued,
+                    "in_flight": backend.in_flight,
+                    "completed": backend.completed,
+                    "rejected": backend.rejected,
+                    "timeouts": backend.timeouts,
+                    "retries": backend.retries,
+                }
+        return stats
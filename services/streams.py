@@ -0,0 +1,107 @@
+import queue
+import re
+import threading
+import time
+
+_DONE = object()
+
+
+class TokenStream:
+    """
+    Consume a token iterator from a background thread.
+
+    The backend iterator is drained by a daemon thread so the caller can
+    wait for each token with a timeout and render partial answers as they
+    arrive. Time to first token and total generation time are measured
+    separately.
+    Args:
+        tokens (iterator): Iterator of answer pieces, e.g. ``bot.stream(...)``.
+        timeout (float): Seconds to wait for the next token before giving up.
+        max_time (float): Seconds allowed for the whole answer, or None.
+        on_close (callable): Called once the backend iterator is finished or
+            closed, or when the stream is cancelled before it started.
+
+    Cancelling only takes effect between tokens: a backend still loading
+    the model or reading the prompt runs on until it yields. ``closed`` is
+    set once the backend call has really ended.
+    """
+
+    def __init__(self, tokens, timeout: float = 120, max_time=None, on_close=None):
+        self.tokens = tokens
+        self.timeout = timeout
+        self.max_time = max_time
+        self.on_close = on_close
+        self.text = ""
+        self.first_token_time = None
+        self.total_time = None
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self.closed = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+
+    def _produce(self):
+        try:
+            for token in self.tokens:
+                if self._cancelled.is_set():
+                    break
+                if token:
+                    self._queue.put(token)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            close = getattr(self.tokens, "close", None)
+            if self._cancelled.is_set() and close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+            self._close()
+            self._queue.put(_DONE)
+
+    def _close(self):
+        on_close, self.on_close = self.on_close, None
+        if on_close is not None:
+            on_close()
+        self.closed.set()
+
+    def __iter__(self):
+        start = time.perf_counter()
+        self._thread.start()
+        while True:
+            timeout = self.timeout
+            if self.max_time is not None:
+                timeout = min(timeout, start + self.max_time - time.perf_counter())
+            try:
+                item = self._queue.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                self.cancel()
+                raise TimeoutError("The model did not answer in time.")
+            if item is _DONE:
+                self.total_time = time.perf_counter() - start
+                return
+            if isinstance(item, Exception):
+                self.cancel()
+                raise item
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter() - start
+            self.text += item
+            yield item
+
+    def cancel(self):
+        self._cancelled.set()
+        if not self._thread.is_alive() and self._thread.ident is None:
+            self._close()
+
+
+def visible_answer(text: str) -> str:
+    """
+    Return the part of a partial answer that should be shown to the user.
+
+    Reasoning models open their answer with a ``<think>`` block; it is hidden
+    while it is still being generated and stripped once it is closed.
+    """
+    stripped = text.lstrip()
+    if stripped.startswith("<think>"):
+        match = re.search(r"</think>\s*(.*)", stripped, flags=re.DOTALL)
+        return match.group(1) if match else ""
+    return text
@@ -0,0 +1,449 @@
+import bisect
+import contextlib
+import contextvars
+import hashlib
+import itertools
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers a cache hit up to a slow generation on a CPU
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+
+def short_digest(value) -> str:
+    """Short, stable tag for a value that is too long or private to show."""
+    return hashlib.sha256(repr(value).encode()).hexdigest()[:12]
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Current values, set with ``set`` or read from ``collect()`` on each
+    render; ``collect`` returns ``(labels, value)`` pairs.
+    """
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            values = dict(self._values)
+        if self.collect is not None:
+            for labels, value in self.collect():
+                key = tuple(labels.get(name, "") for name in self.labelnames)
+                values[key] = float(value)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _labels(names, key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _labels(names, key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {counts[-2]}")
+                labels = _labels(self.labelnames, key)
+                lines.append(f"{self.name}_count{labels} {counts[-2]}")
+                lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+        return lines
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and histograms rendered in the Prometheus
+    text format.
+
+    Labels stay low-cardinality (trace, stage, status); per-request tags
+    such as the session belong on the traces.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames=(), collect=None) -> Gauge:
+        return self._register(Gauge, name, help, labelnames, collect)
+
+    def histogram(
+        self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def export_stats(metrics: Metrics, scheduler=None, retrieval=None, answers=None):
+    """
+    Expose the load of the scheduler and the effect of the caches as gauges
+    read from their ``stats()`` on each render. A metric already registered
+    under the same name is kept, so a registry shared by several services
+    reports the first one's components.
+    Args:
+        metrics (Metrics): Registry the gauges go to.
+        scheduler (BotScheduler): Queued and in-flight requests per backend.
+        retrieval (RetrievalCache): Hit ratio and saved seconds per kind.
+        answers (AnswerCache): Hit ratio of the answer cache.
+    """
+
+    def load(field):
+        if scheduler is None:
+            return []
+        stats = scheduler.stats()
+        return [({"backend": key}, load[field]) for key, load in stats.items()]
+
+    def caches(field):
+        values = []
+        if retrieval is not None:
+            for kind, stats in retrieval.stats().items():
+                values.append(({"cache": "retrieval", "kind": kind}, stats[field]))
+        if answers is not None and field == "hit_ratio":
+            values.append(
+                ({"cache": "answer", "kind": "answer"}, answers.stats()[field])
+            )
+        return values
+
+    metrics.gauge(
+        "chatbot_scheduler_queued",
+        "Requests waiting for a slot, per backend.",
+        ("backend",),
+        lambda: load("queued"),
+    )
+    metrics.gauge(
+        "chatbot_scheduler_in_flight",
+        "Requests holding a slot, per backend.",
+        ("backend",),
+        lambda: load("in_flight"),
+    )
+    metrics.gauge(
+        "chatbot_cache_hit_ratio",
+        "Share of cache lookups that hit.",
+        ("cache", "kind"),
+        lambda: caches("hit_ratio"),
+    )
+    metrics.gauge(
+        "chatbot_cache_saved_seconds",
+        "Estimated seconds the cache hits saved since the start.",
+        ("cache", "kind"),
+        lambda: caches("saved_seconds"),
+    )
+
+
+class Span:
+    def __init__(self, name: str, tags: dict, offset: float):
+        self.name = name
+        self.tags = tags
+        self.offset = offset
+        self.duration = None
+        self.status = "ok"
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "offset": self.offset,
+            "duration": self.duration,
+            "status": self.status,
+            "tags": self.tags,
+        }
+
+
+class Trace:
+    """A request, and the spans of the stages it went through."""
+
+    def __init__(self, trace_id: int, name: str, tags: dict):
+        self.id = trace_id
+        self.name = name
+        self.tags = tags
+        self.spans = []
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def stage_durations(self) -> dict:
+        """Total time per stage name; a stage can run several times."""
+        durations = {}
+        for span in self.spans:
+            if span.duration is not None:
+                durations[span.name] = durations.get(span.name, 0.0) + span.duration
+        return durations
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "tags": self.tags,
+            "started": self.started,
+            "duration": self.duration,
+            "status": self.status,
+            "spans": [span.as_dict() for span in self.spans],
+        }
+
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Tracer:
+    """
+    Records traces of requests and the latency of their stages.
+
+    ``trace`` opens a request in the current thread and ``span`` times a
+    stage inside it; both feed the ``chatbot_stage_seconds`` histogram and
+    the ``chatbot_requests_total`` counter. Finished traces are kept in a
+    ring buffer for the diagnostics panel. Stages that only report
+    progress, like ingestion, are turned into spans by ``stage_recorder``.
+    Args:
+        metrics (Metrics): Registry the measurements go to.
+        max_traces (int): Finished traces kept in memory.
+    """
+
+    def __init__(self, metrics: Metrics = None, max_traces: int = 200):
+        self.metrics = metrics or Metrics()
+        self.stage_seconds = self.metrics.histogram(
+            "chatbot_stage_seconds",
+            "Time spent in each stage of a request.",
+            ("trace", "stage", "status"),
+        )
+        self.request_seconds = self.metrics.histogram(
+            "chatbot_request_seconds",
+            "Time spent in a whole request.",
+            ("trace", "status"),
+        )
+        self.requests = self.metrics.counter(
+            "chatbot_requests_total", "Requests handled.", ("trace", "status")
+        )
+        self._ids = itertools.count(1)
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def trace(self, name: str, record: bool = True, **tags):
+        """
+        Open a trace for a request; spans in the same thread attach to it.
+        Args:
+            name (str): Kind of request, e.g. "handle_input".
+            record (bool): Keep the trace for the diagnostics panel; metrics
+                are recorded either way.
+            **tags: Session, model, document set...
+        """
+        trace = Trace(next(self._ids), name, tags)
+        token = _current.set(trace)
+        try:
+            yield trace
+        except Exception:
+            if trace.status == "ok":
+                trace.status = "error"
+            raise
+        finally:
+            _current.reset(token)
+            trace.duration = trace.elapsed()
+            self.request_seconds.observe(
+                trace.duration, trace=name, status=trace.status
+            )
+            self.requests.inc(trace=name, status=trace.status)
+            if record:
+                with self._lock:
+                    self._traces.append(trace)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **tags):
+        """
+        Time a stage of the current trace. Outside of a trace, only the
+        metrics are recorded.
+        """
+        trace = _current.get()
+        span = Span(name, tags, trace.elapsed() if trace else 0.0)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception:
+            if span.status == "ok":
+                span.status = "error"
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self._finish(trace, span)
+
+    def _finish(self, trace, span: Span):
+        self.stage_seconds.observe(
+            span.duration,
+            trace=trace.name if trace else "",
+            stage=span.name,
+            status=span.status,
+        )
+        if trace is not None:
+            trace.spans.append(span)
+
+    def stage_recorder(self, trace: Trace, report=None):
+        """
+        Wrap a ``report(stage, fraction, detail)`` progress callback so each
+        run of consecutive reports of one stage becomes a span of ``trace``.
+        Returns:
+            callable: The wrapped callback; call its ``close()`` at the end.
+        """
+        state = {"span": None, "start": None}
+
+        def close(status="ok"):
+            span = state["span"]
+            if span is not None:
+                span.duration = time.perf_counter() - state["start"]
+                span.status = status
+                self._finish(trace, span)
+                state["span"] = None
+
+        def record(stage, fraction, detail=None):
+            span = state["span"]
+            if span is None or span.name != stage or span.tags.get("file") != detail:
+                close()
+                tags = {"file": detail} if detail else {}
+                state["span"] = Span(stage, tags, trace.elapsed())
+                state["start"] = time.perf_counter()
+            if report is not None:
+                report(stage, fraction, detail)
+
+        record.close = close
+        return record
+
+    def recent(self, n: int = 20, **tags) -> list:
+        """The last ``n`` finished traces whose tags match ``tags``, newest first."""
+        with self._lock:
+            traces = list(self._traces)
+        matching = [
+            trace
+            for trace in reversed(traces)
+            if all(trace.tags.get(key) == value for key, value in tags.items())
+        ]
+        return matching[:n]
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(metrics: Metrics, host: str = "127.0.0.1", port: int = 9464):
+    """
+    Serve ``/metrics`` for Prometheus from a daemon thread.
+    Returns:
+        ThreadingHTTPServer: The running server.
+    Raises:
+        OSError: The port is not available.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
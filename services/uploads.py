@@ -0,0 +1,101 @@
+import hashlib
+import os
+import time
+import uuid
+
+
+class BlobStore:
+    """
+    Content-addressed store for uploaded files.
+
+    Uploads are streamed in chunks to a temporary file while their SHA-256 is
+    computed, then renamed to ``<digest><suffix>``, so a file is never held
+    in memory a second time and readers never see a partial blob. Identical
+    content is stored once whatever its name; names are given to blobs with
+    ``link``, as hard links when the filesystem allows it.
+    Args:
+        root (str): Directory holding the blobs.
+        chunk_size (int): Bytes copied at a time.
+    """
+
+    def __init__(self, root: str = "./cache/blobs", chunk_size: int = 1 << 20):
+        self.root = root
+        self.chunk_size = chunk_size
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest: str, suffix: str = ".pdf") -> str:
+        return os.path.join(self.root, f"{digest}{suffix}")
+
+    def put(self, source, suffix: str = ".pdf", progress=None) -> str:
+        """
+        Store the content of a binary file object.
+        Args:
+            source: Readable binary file object, read from its current position.
+            suffix (str): Extension of the stored blob.
+            progress (callable): Called with the number of bytes copied so far.
+        Returns:
+            str: Hex SHA-256 of the content, the blob's address.
+        """
+        digest = hashlib.sha256()
+        tmp = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        copied = 0
+        try:
+            with open(tmp, "wb") as f:
+                for block in iter(lambda: source.read(self.chunk_size), b""):
+                    digest.update(block)
+                    f.write(block)
+                    copied += len(block)
+                    if progress:
+                        progress(copied)
+            target = self.path(digest.hexdigest(), suffix)
+            if os.path.exists(target):
+                os.remove(tmp)
+            else:
+                os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return digest.hexdigest()
+
+    def link(self, digest: str, destination: str, suffix: str = ".pdf") -> bool:
+        """
+        Make ``destination`` hold the blob's content, replacing it atomically.
+        Returns:
+            bool: False if ``destination`` already was that blob.
+        """
+        blob = self.path(digest, suffix)
+        if os.path.exists(destination) and os.path.samefile(blob, destination):
+            return False
+        directory = os.path.dirname(os.path.abspath(destination))
+        tmp = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            # No hard links across devices or on some filesystems
+            with open(blob, "rb") as src, open(tmp, "wb") as dst:
+                for block in iter(lambda: src.read(self.chunk_size), b""):
+                    dst.write(block)
+        os.replace(tmp, destination)
+        return True
+
+    def prune(self, min_age: float = 3600):
+        """
+        Delete blobs no name links to any more.
+
+        Only blobs whose only link is their own and that are older than
+        ``min_age`` are removed, so uploads in progress are left alone. On
+        filesystems without hard links every blob counts as unreferenced.
+        """
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink <= 1 and now - stat.st_mtime > min_age:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+from services.index_cache import FileLock
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    # Symmetric per-row scale: the largest component maps to 127
+    scales = np.abs(vectors).max(1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def write_vector_store(
+    directory: str,
+    ids: list,
+    vectors: np.ndarray,
+    texts: list,
+    metadatas: list = None,
+    dtype: str = "int8",
+):
+    """
+    Write vectors and their chunks in the format read by ``MappedVectorStore``.
+
+    The directory is written under a temporary name and renamed at the end,
+    so readers never see it half written.
+    Args:
+        directory (str): Directory to create.
+        ids (list): Docstore ids of the chunks, one per vector.
+        vectors (np.ndarray): ``(n, d)`` full-precision vectors.
+        texts (list): Chunk texts.
+        metadatas (list): Chunk metadata dicts.
+        dtype (str): "int8" or "float16", the precision searched first.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown vector store dtype '{dtype}'.")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    metadatas = metadatas or [{} for _ in ids]
+    tmp = f"{directory}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp)
+    try:
+        codes, scales = _quantize(vectors, dtype)
+        np.save(os.path.join(tmp, "codes.npy"), codes)
+        np.save(os.path.join(tmp, "scales.npy"), scales)
+        np.save(os.path.join(tmp, "norms.npy"), (vectors * vectors).sum(1))
+        np.save(os.path.join(tmp, "vectors.npy"), vectors)
+
+        encoded = np.array([str(_id).encode() for _id in ids])
+        order = np.argsort(encoded, kind="stable")
+        np.save(os.path.join(tmp, "ids.npy"), encoded)
+        np.save(os.path.join(tmp, "id_order.npy"), order)
+        np.save(os.path.join(tmp, "sorted_ids.npy"), encoded[order])
+
+        offsets = [0]
+        with open(os.path.join(tmp, "chunks.jsonl"), "wb") as f:
+            for text, metadata in zip(texts, metadatas):
+                line = json.dumps({"text": text, "metadata": metadata}).encode()
+                f.write(line + b"\n")
+                offsets.append(offsets[-1] + len(line) + 1)
+        np.save(os.path.join(tmp, "offsets.npy"), np.array(offsets, dtype=np.uint64))
+
+        meta = {
+            "count": len(vectors),
+            "dimensions": vectors.shape[1],
+            "dtype": dtype,
+            "metric": "l2",
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, directory)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class MappedVectorStore:
+    """
+    Read-only vector store over files mapped into memory.
+
+    Vectors are kept as int8 (with a scale per row) or float16 codes in one
+    contiguous array, next to their float32 originals and a JSON-lines file
+    of the chunk texts and metadata. Everything is opened with ``mmap``, so
+    the pages come from the OS page cache: processes and sessions searching
+    the same documents share one copy, and pages not searched lately can be
+    dropped by the OS instead of counting against the heap.
+
+    A search scans the codes in blocks with NumPy and keeps the ``rescore``
+    best candidates, which are then ranked by their exact L2 distance to
+    the query, so results match the full-precision search.
+    Args:
+        directory (str): Directory written by ``write_vector_store``.
+        rescore (int): Candidates re-ranked with the float32 vectors.
+        block (int): Rows scanned per NumPy operation.
+    """
+
+    def __init__(self, directory: str, rescore: int = 64, block: int = 4096):
+        self.directory = directory
+        self.rescore = rescore
+        self.block = block
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        # Empty files cannot be mapped
+        mode = "r" if self.meta["count"] else None
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode=mode)
+        self._codes = load("codes.npy")
+        self._scales = load("scales.npy")
+        self._norms = load("norms.npy")
+        self._vectors = load("vectors.npy")
+        self._ids = load("ids.npy")
+        self._id_order = load("id_order.npy")
+        self._sorted_ids = load("sorted_ids.npy")
+        self._offsets = load("offsets.npy")
+        self._file = open(os.path.join(directory, "chunks.jsonl"), "rb")
+        self._chunks = b""
+        if self.meta["count"]:
+            self._chunks = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    @property
+    def dimensions(self) -> int:
+        return self.meta["dimensions"]
+
+    def _approximate(self, query: np.ndarray, keep: int):
+        # Squared L2 distance up to the query's norm, from the codes
+        rows, distances = [], []
+        for start in range(0, len(self), self.block):
+            stop = min(start + self.block, len(self))
+            dots = self._codes[start:stop].astype(np.float32) @ query
+            block = self._norms[start:stop] - 2 * dots * self._scales[start:stop]
+            if len(block) > keep:
+                best = np.argpartition(block, keep - 1)[:keep]
+            else:
+                best = np.arange(len(block))
+            rows.append(best + start)
+            distances.append(block[best])
+        rows = np.concatenate(rows)
+        distances = np.concatenate(distances)
+        if len(rows) > keep:
+            best = np.argpartition(distances, keep - 1)[:keep]
+            rows, distances = rows[best], distances[best]
+        return rows, distances
+
+    def search_rows(self, vector, k: int = 4) -> np.ndarray:
+        """
+        Rows of the ``k`` vectors nearest to ``vector`` (L2), best first.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        rows, distances = self._approximate(query, max(k, self.rescore))
+        if self.rescore:
+            # In file order, so the rows are read front to back
+            rows = np.sort(rows)
+            distances = ((self._vectors[rows] - query) ** 2).sum(1)
+        order = np.argsort(distances)[:k]
+        return rows[order]
+
+    def search(self, vector, k: int = 4) -> list:
+        """
+        Ids of the ``k`` chunks nearest to ``vector``, best first.
+        """
+        return self.ids(self.search_rows(vector, k))
+
+    def ids(self, rows=None) -> list:
+        ids = self._ids if rows is None else self._ids[rows]
+        return [_id.decode() for _id in ids]
+
+    def rows(self, ids: list) -> np.ndarray:
+        """
+        Rows of the chunks with these ids.
+        Raises:
+            KeyError: An id is not in the store.
+        """
+        if not len(ids):
+            return np.empty(0, dtype=np.int64)
+        keys = np.array([str(_id).encode() for _id in ids])
+        found = np.searchsorted(self._sorted_ids, keys)
+        found = np.minimum(found, len(self) - 1)
+        missing = self._sorted_ids[found] != keys
+        if missing.any():
+            raise KeyError(ids[int(np.flatnonzero(missing)[0])])
+        return np.asarray(self._id_order[found])
+
+    def chunk(self, row: int) -> dict:
+        """The ``text`` and ``metadata`` of a row."""
+        start, stop = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._chunks[start:stop])
+
+    def texts(self, ids: list) -> list:
+        return [self.chunk(row)["text"] for row in self.rows(ids)]
+
+    def vectors(self, rows=None) -> np.ndarray:
+        """Full-precision vectors, as a copy."""
+        if rows is None:
+            return np.array(self._vectors)
+        return np.asarray(self._vectors[rows])
+
+    def mapped_vectors(self) -> np.ndarray:
+        """Full-precision vectors as the read-only mapped array, not a copy."""
+        return self._vectors
+
+    def mapped_bytes(self) -> int:
+        """Size of the mapped files; resident only as far as they are used."""
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory)
+        )
+
+    def close(self):
+        if self.meta["count"]:
+            self._chunks.close()
+        self._file.close()
+
+
+class VectorStoreCache:
+    """
+    Directory of ``MappedVectorStore``s shared by every process on the host.
+
+    Stores are named after their content, e.g. the document set and its
+    configuration, so processes indexing the same documents open the same
+    files and share their pages. Writing a store is guarded by a file lock,
+    and ``prune`` deletes the stores nobody opened for ``max_idle`` seconds,
+    then the least recently opened ones until they fit in ``max_bytes``;
+    processes still mapping them keep their pages until they close them.
+    Args:
+        root (str): Directory holding the stores.
+        dtype (str): "int8", "float16", or None to keep vectors in the heap.
+        rescore (int): Candidates re-ranked at full precision per search.
+        max_idle (float): Seconds after which an unused store is deleted.
+        max_bytes (int): Total size of the stores kept by ``prune``.
+    """
+
+    def __init__(
+        self,
+        root: str = "./cache/vectors",
+        dtype: str = "int8",
+        rescore: int = 64,
+        max_idle: float = 7 * 24 * 3600,
+        max_bytes: int = 8 << 30,
+    ):
+        if dtype is not None and dtype not in DTYPES:
+            raise ValueError(f"Unknown vector store dtype '{dtype}'.")
+        self.root = root
+        self.dtype = dtype
+        self.rescore = rescore
+        self.max_idle = max_idle
+        self.max_bytes = max_bytes
+
+    def name(self, key) -> str:
+        return hashlib.sha256(repr((key, self.dtype)).encode()).hexdigest()[:32]
+
+    def open(self, key, write) -> MappedVectorStore:
+        """
+        Open the store of ``key``, calling ``write(directory, dtype)`` to
+        create it if no process did yet.
+        """
+        directory = os.path.join(self.root, self.name(key))
+        if not os.path.exists(directory):
+            os.makedirs(self.root, exist_ok=True)
+            with FileLock(directory + ".lock"):
+                if not os.path.exists(directory):
+                    write(directory, self.dtype)
+        os.utime(directory)
+        return MappedVectorStore(directory, rescore=self.rescore)
+
+    def _stores(self):
+        stores = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            # Skips the locks and the stores still being written
+            if name.endswith((".lock", ".tmp")) or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                stores.append((name, os.path.getmtime(path), size))
+            except FileNotFoundError:
+                continue
+        return stores
+
+    def size(self) -> int:
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(size for _, _, size in self._stores())
+
+    def prune(self, keep: str = None):
+        """
+        Delete the stores idle for longer than ``max_idle``, then the least
+        recently opened ones until the rest fit in ``max_bytes``.
+        Args:
+            keep (str): Name of a store never deleted, e.g. the one just opened.
+        """
+        if not os.path.isdir(self.root):
+            return
+        with FileLock(os.path.join(self.root, ".prune.lock"), timeout=60, stale=60):
+            stores = sorted(self._stores(), key=lambda store: store[1])
+            total = sum(size for _, _, size in stores)
+            now = time.time()
+            for name, opened, size in stores:
+                if now - opened <= self.max_idle and total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                total -= size
+
+
+_dtype = os.environ.get("VECTOR_STORE_DTYPE", "int8").lower()
+_stores = VectorStoreCache(dtype=None if _dtype in ("", "none", "off") else _dtype)
+
+
+def get_vector_stores() -> VectorStoreCache:
+    """
+    Return the vector stores of this process; ``VECTOR_STORE_DTYPE`` picks
+    their precision ("int8", "float16" or "off").
+    """
+    return _stores
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+from services.scheduler import backend_key
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def _is_timeout(error: Exception) -> bool:
+    # The HTTP clients' timeouts (httpx.ReadTimeout, ...) are not TimeoutErrors
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+class _Model:
+    def __init__(self, name: str, load, repeat: bool):
+        self.name = name
+        self.load = load
+        self.repeat = repeat
+        self.lease = None
+        self.state = "loading"
+        self.error = None
+        self.seconds = None
+        self.touched = time.monotonic()
+        self.pinged = None
+        self.busy = False
+
+    def close(self):
+        if self.lease is not None:
+            self.lease.release()
+            self.lease = None
+
+
+class ModelWarmer:
+    """
+    Loads the chosen models before the first question and keeps them loaded.
+
+    Ollama loads a model on its first request and unloads it after a few
+    idle minutes, so the first question after saving the configuration, or
+    after a pause, waited for the whole load, often past the answer timeout.
+    ``warm`` loads the models of a chatbot in background threads with a
+    request that generates nothing, and leases the embedding model from the
+    process-wide pool and embeds a short text with it. While sessions keep
+    calling ``warm``, the models of backends that unload idle models
+    (``needs_keep_alive``, i.e. Ollama) are sent such a request again every
+    ``interval`` seconds, with ``keep_alive`` so the server keeps them in
+    memory; other backends are only woken once, as their requests are
+    billed. Models no session asked for in ``idle`` seconds are let go: the
+    server unloads them on its own schedule and the embedding model is
+    released to the pool.
+    Models are named after their server and name, so chatbots of several
+    sessions using the same model share one entry.
+    Args:
+        keep_alive (str): How long Ollama keeps a model after each request.
+        interval (float): Seconds between two keep-alive requests.
+        idle (float): Seconds without a session after which a model is let go.
+        load_timeout (float): Seconds a first load may take before it fails.
+        embedding_model (str): Embedding model the RAG of a session uses.
+    """
+
+    def __init__(
+        self,
+        keep_alive: str = "10m",
+        interval: float = 240,
+        idle: float = 900,
+        load_timeout: float = 600,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+    ):
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.idle = idle
+        self.load_timeout = load_timeout
+        self.embedding_model = embedding_model
+        self._models = {}  # (server, model name) -> _Model
+        self._lock = threading.Lock()
+        self._keeper = None
+
+    def _targets(self, bot) -> list:
+        targets = []
+        for backend in getattr(bot, "backends", [bot]):
+            warm_up = getattr(backend, "warm_up", None)
+            if warm_up is not None:
+                key = (backend_key(backend), backend.name)
+                repeat = getattr(backend, "needs_keep_alive", False)
+                load = lambda model, w=warm_up: w(keep_alive=self.keep_alive)
+                targets.append((key, backend.name, load, repeat))
+        key = ("embeddings", self.embedding_model)
+        targets.append((key, self.embedding_model, self._embed, False))
+        return targets
+
+    def _embed(self, model: _Model):
+        if model.lease is None:
+            # Importing the RAG stack is slow; only done in the loading thread
+            from services.rag import lease_embeddings
+
+            model.lease = lease_embeddings(model.name)
+        model.lease.value.embed_documents(["warm-up"])
+
+    def warm(self, bot):
+        """
+        Start loading the models of ``bot`` and the embedding model, and
+        mark them as in use, which keeps them loaded.
+        Args:
+            bot: Chatbot or router of a session.
+        """
+        now = time.monotonic()
+        started = []
+        with self._lock:
+            for key, name, load, repeat in self._targets(bot):
+                model = self._models.get(key)
+                if model is None:
+                    model = self._models[key] = _Model(name, load, repeat)
+                    started.append(model)
+                model.touched = now
+            if self._keeper is None:
+                self._keeper = threading.Thread(target=self._keep, daemon=True)
+                self._keeper.start()
+        for model in started:
+            self._start(model)
+
+    def _start(self, model: _Model):
+        with self._lock:
+            if model.busy:
+                return
+            model.busy = True
+        threading.Thread(target=self._load, args=(model,), daemon=True).start()
+
+    def _load(self, model: _Model):
+        start = time.monotonic()
+        while True:
+            try:
+                model.load(model)
+            except Exception as e:
+                # The server goes on loading after the client gave up
+                if _is_timeout(e) and time.monotonic() - start < self.load_timeout:
+                    continue
+                model.error, model.state = e, "failed"
+            else:
+                if model.state != "ready":
+                    model.seconds = time.monotonic() - start
+                model.error, model.state = None, "ready"
+            break
+        model.pinged = time.monotonic()
+        model.busy = False
+
+    def _keep(self):
+        while True:
+            time.sleep(min(self.interval, self.idle) / 4)
+            now = time.monotonic()
+            with self._lock:
+                dropped = [
+                    self._models.pop(key)
+                    for key, model in list(self._models.items())
+                    if now - model.touched > self.idle and not model.busy
+                ]
+                due = [
+                    model
+                    for model in self._models.values()
+                    if model.repeat
+                    and model.pinged is not None
+                    and now - model.pinged >= self.interval
+                ]
+            for model in dropped:
+                model.close()
+            for model in due:
+                self._start(model)
+
+    def status(self, bot) -> list:
+        """
+        Readiness of the models ``warm`` loads for ``bot``; does not mark
+        them as in use.
+        Returns:
+            list: ``{"model", "state", "seconds", "error"}`` dicts, where
+                ``state`` is "loading", "ready" or "failed" and ``seconds``
+                is how long the first load took.
+        """
+        with self._lock:
+            models = [self._models.get(key) for key, *_ in self._targets(bot)]
+        return [
+            {
+                "model": model.name,
+                "state": model.state,
+                "seconds": model.seconds,
+                "error": str(model.error) if model.error else None,
+            }
+            for model in models
+            if model is not None
+        ]
+
+
+_warmer = ModelWarmer(keep_alive=os.environ.get("MODEL_KEEP_ALIVE", "10m"))
+
+
+def get_model_warmer() -> ModelWarmer:
+    """
+    Return the model warmer of this process; ``MODEL_KEEP_ALIVE`` sets how
+    long Ollama keeps the models after each request (default "10m").
+    """
+    return _warmer
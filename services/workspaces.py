@@ -0,0 +1,80 @@
+import os
+import re
+import shutil
+import time
+
+_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Workspace:
+    """
+    A session's own directory: its uploaded documents live in ``data``.
+
+    Nothing outside the workspace is written or deleted on the session's
+    behalf, so sessions cannot clobber each other's documents.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = os.path.join(path, "data")
+        os.makedirs(self.data, exist_ok=True)
+
+    def touch(self):
+        """Mark the workspace as in use, so ``prune`` keeps it."""
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            os.makedirs(self.data, exist_ok=True)
+
+    def clear(self):
+        """Delete the workspace's documents."""
+        shutil.rmtree(self.data, ignore_errors=True)
+        os.makedirs(self.data, exist_ok=True)
+
+
+class WorkspaceStore:
+    """
+    Directory of per-session workspaces.
+
+    A workspace is named after the session, or after a name several
+    sessions share. Streamlit does not report the end of a session, so
+    workspaces nobody touched for ``max_idle`` seconds are deleted by
+    ``prune``.
+    Args:
+        root (str): Directory holding the workspaces.
+        max_idle (float): Seconds after which an untouched workspace is deleted.
+    """
+
+    def __init__(self, root: str = "./workspaces", max_idle: float = 24 * 3600):
+        self.root = root
+        self.max_idle = max_idle
+        os.makedirs(self.root, exist_ok=True)
+
+    def open(self, name: str) -> Workspace:
+        """
+        Return the workspace called ``name``, creating it if needed.
+        Raises:
+            ValueError: The name is not a plain identifier.
+        """
+        if not _NAME.match(name or ""):
+            raise ValueError(f"Invalid workspace name '{name}'.")
+        workspace = Workspace(os.path.join(self.root, name))
+        workspace.touch()
+        return workspace
+
+    def prune(self):
+        """Delete the workspaces idle for longer than ``max_idle``."""
+        now = time.time()
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            # Removed under the running server: nothing left to prune
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                idle = now - os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if idle > self.max_idle and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
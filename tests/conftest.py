@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import DEFAULT_EMBEDDING_MODEL, HashingEmbeddings
+
+
+@pytest.fixture
+def embeddings():
+    """Seed the pool with stub embeddings, which RAG takes its model from."""
+    from services.batching import BatchingEmbeddings
+    from services.pool import get_pool
+
+    lease = get_pool().lease(
+        ("embeddings", DEFAULT_EMBEDDING_MODEL),
+        lambda: BatchingEmbeddings(HashingEmbeddings()),
+    )
+    yield lease.value
+    lease.release()
+
+
+@pytest.fixture
+def stub():
+    """A stub Ollama server answering quickly."""
+    from benchmarks.stub_ollama import StubOllama
+
+    server = StubOllama(prefill_delay=0.01, token_delay=0.001).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def documents(tmp_path):
+    """A directory of three synthetic PDFs."""
+    from benchmarks.synthetic import make_pdfs
+
+    path = tmp_path / "documents"
+    make_pdfs(str(path), files=3, pages=2, words_per_page=120)
+    return path
+
+
+@pytest.fixture
+def make_index(embeddings, tmp_path):
+    """Build an ``IncrementalIndex`` over a directory, with its own cache."""
+    pytest.importorskip("chatbot_rag")
+    from services.index_cache import IndexCache
+    from services.indexing import IncrementalIndex, create_rag
+
+    def make(path, ann=None):
+        rag = create_rag(str(path), "default", {})
+        cache = IndexCache(root=str(tmp_path / "cache"))
+        return IncrementalIndex(rag, cache, ann=ann)
+
+    return make
@@ -0,0 +1,52 @@
+import time
+
+from benchmarks.synthetic import HashingEmbeddings
+from services.answer_cache import AnswerCache, normalize_question
+from services.history import Message, conversation_digest
+
+
+def test_answers_are_scoped_by_model_and_documents():
+    cache = AnswerCache()
+    cache.put("model", "documents", "What is RAG?", "An answer.")
+    assert cache.get("model", "documents", "  what is rag ") == "An answer."
+    assert cache.get("other model", "documents", "What is RAG?") is None
+    assert cache.get("model", "other documents", "What is RAG?") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_questions_are_normalized():
+    assert normalize_question("¿Qué es  RAG?") == normalize_question("qué es rag")
+
+
+def test_similar_questions_only_match_when_enabled():
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return HashingEmbeddings().embed_query(text)
+
+    exact = AnswerCache()
+    exact.put("model", None, "how do I reset the router", "Hold the button.", embed)
+    assert exact.get("model", None, "how do I reset the router now", embed) is None
+    assert calls == []
+
+    similar = AnswerCache(similarity_threshold=0.8)
+    similar.put("model", None, "how do I reset the router", "Hold the button.", embed)
+    answer = similar.get("model", None, "how do I reset the router now", embed)
+    assert answer == "Hold the button."
+    assert similar.stats()["semantic_hits"] == 1
+
+
+def test_expired_answers_are_dropped():
+    cache = AnswerCache(ttl=0.01)
+    cache.put("model", None, "question", "answer")
+    time.sleep(0.02)
+    assert cache.get("model", None, "question") is None
+
+
+def test_conversation_digest_changes_with_the_conversation():
+    first = [Message("user", "hello"), Message("assistant", "hi")]
+    assert conversation_digest(first) == conversation_digest(list(first))
+    assert conversation_digest(first) != conversation_digest(first[:1])
+    swapped = [Message("assistant", "hello"), Message("user", "hi")]
+    assert conversation_digest(first) != conversation_digest(swapped)
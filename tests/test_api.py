@@ -0,0 +1,125 @@
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("chatbot_rag")
+pytest.importorskip("ollama")
+
+from benchmarks.stub_ollama import StubOllama
+from benchmarks.synthetic import make_pdfs
+from services.api import ChatService, serve_api
+from services.api_client import APIClient, APIError
+from services.index_cache import IndexCache
+from services.scheduler import BotScheduler
+from services.uploads import BlobStore
+from services.vector_store import VectorStoreCache
+from services.workspaces import WorkspaceStore
+
+
+def start_api(stub, root):
+    service = ChatService(
+        {"host": "Ollama", "model_name": "stub:latest", "server": stub.url},
+        workspaces=WorkspaceStore(root=str(root / "workspaces")),
+        blob_store=BlobStore(root=str(root / "blobs")),
+        index_cache=IndexCache(root=str(root / "indexes")),
+        vector_stores=VectorStoreCache(root=str(root / "vectors")),
+        scheduler=BotScheduler(limits={"ollama": 2}, retries=0),
+    )
+    server = serve_api(service, port=0)
+    port = server.sockets[0].getsockname()[1]
+    return service, port
+
+
+@pytest.fixture
+def api(embeddings, stub, tmp_path):
+    service, port = start_api(stub, tmp_path)
+    client = APIClient(f"http://127.0.0.1:{port}", timeout=30)
+    yield client
+    client.close()
+    service.shutdown()
+
+
+def ingest(client, workspace, directory):
+    for path in sorted(directory.iterdir()):
+        with open(path, "rb") as f:
+            client.upload(workspace, path.name, f, path.stat().st_size)
+    job = client.ingest(workspace)
+    deadline = time.monotonic() + 60
+    while client.job(job)["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return client.job(job)
+
+
+def test_ingest_query_and_answer(api, tmp_path):
+    assert api.health()["status"] == "ok"
+    make_pdfs(str(tmp_path / "pdfs"), files=2, pages=2)
+    assert ingest(api, "docs", tmp_path / "pdfs")["status"] == "done"
+    assert len(api.documents("docs")["documents"]) == 2
+
+    chunks = api.query("docs", "what is in the documents?", k=3)
+    assert 0 < len(chunks) <= 3
+
+    answer = api.answer("docs", "what is in the documents?")
+    assert answer["answer"]
+    events = list(api.answer_stream("docs", "and the second one?"))
+    assert events[-1].get("done")
+    assert any("token" in event for event in events[:-1])
+
+
+def test_invalid_requests_are_refused(api):
+    for options in ({"model": "other:latest"}, {"model": {"host": "x"}}):
+        with pytest.raises(APIError) as error:
+            api.answer("docs", "question", **options)
+        assert error.value.status == 400
+    with pytest.raises(APIError) as error:
+        api.answer("docs", "question", history=[{"text": "no role"}])
+    assert error.value.status == 400
+    with pytest.raises(APIError) as error:
+        api.query("docs", "")
+    assert error.value.status == 400
+
+
+def test_malformed_content_length_is_refused(api):
+    with socket.create_connection((api.host, api.port), timeout=10) as sock:
+        sock.sendall(
+            b"POST /v1/workspaces/docs/query HTTP/1.1\r\n"
+            b"Host: localhost\r\nContent-Length: abc\r\n\r\n"
+        )
+        assert sock.recv(1024).startswith(b"HTTP/1.1 400")
+
+
+def test_failed_answer_is_an_error(embeddings, tmp_path):
+    stub = StubOllama(prefill_delay=0.01, error_rate=1.0).start()
+    service, port = start_api(stub, tmp_path)
+    client = APIClient(f"http://127.0.0.1:{port}", timeout=30)
+    try:
+        with pytest.raises(APIError) as error:
+            client.answer("docs", "question")
+        assert error.value.status == 500
+    finally:
+        client.close()
+        service.shutdown()
+        stub.shutdown()
+
+
+def test_ingest_takes_paths_and_models_from_the_server(api):
+    hostile = (
+        {"tesseract_path": "/tmp/evil/tesseract"},
+        {"name_model": "attacker/model"},
+        {"extract_images": True},
+        {"extract_tables": "yes"},
+        {"workers": 10_000},
+        {"chunks_size": True},
+        {"chunks_size": 256, "chunk_overlap": 256},
+    )
+    for preprocessing in hostile:
+        with pytest.raises(APIError) as error:
+            api.ingest(
+                "docs", rag_action="PyMuPDFPreprocessing", preprocessing=preprocessing
+            )
+        assert error.value.status == 400
+    with pytest.raises(APIError) as error:
+        api.ingest("docs", rag_action="os.system")
+    assert error.value.status == 400
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+pytest.importorskip("chatbot_rag")
+testing = pytest.importorskip("streamlit.testing.v1")
+
+from benchmarks.synthetic import StubChatbot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = ["app.py", "app_with_config.py"]
+
+
+@pytest.fixture
+def run_app(tmp_path, monkeypatch):
+    """Run an app page in a scratch directory, without the metrics server."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("METRICS_PORT", "0")
+
+    def run(name):
+        app = testing.AppTest.from_file(os.path.join(ROOT, name), default_timeout=60)
+        app.run()
+        assert not app.exception
+        return app
+
+    return run
+
+
+@pytest.mark.parametrize("name", APPS)
+def test_question_without_a_model_asks_for_one(run_app, name):
+    app = run_app(name)
+    app.chat_input[0].set_value("hello").run()
+    assert not app.exception
+    assert [error.value for error in app.error] == [
+        "Please configure a chatbot model first in the Configuration page"
+    ]
+
+
+class RecordingChatbot(StubChatbot):
+    def __init__(self, name):
+        super().__init__(name, prefill_delay=0, token_delay=0, tokens=4)
+        self.prompts = []
+
+    def stream(self, context, question):
+        self.prompts.append((context, question))
+        return super().stream(context, question)
+
+
+@pytest.mark.parametrize("name", APPS)
+def test_without_documents_the_conversation_is_not_a_context(run_app, embeddings, name):
+    app = run_app(name)
+    # Named after the app: answers are cached per model across the tests
+    bot = app.session_state["bot"] = RecordingChatbot(name)
+    app.chat_input[0].set_value("What is the capital of France?").run()
+    app.chat_input[0].set_value("And of Spain?").run()
+    assert not app.exception
+    context, question = bot.prompts[-1]
+    assert context is None
+    assert "User: What is the capital of France?" in question
+    assert question.endswith("And of Spain?")
+
+
+class Rerun(BaseException):
+    """Stands for Streamlit's rerun and stop exceptions."""
+
+
+def test_interrupted_stream_releases_the_backend(monkeypatch):
+    from services import app_state
+
+    streams = []
+    scheduler = app_state.get_scheduler()
+    open_stream = scheduler.open_stream
+    monkeypatch.setattr(
+        scheduler,
+        "open_stream",
+        lambda *args: streams.append(open_stream(*args)) or streams[-1],
+    )
+
+    def visible_answer(text):
+        raise Rerun()
+
+    monkeypatch.setattr(app_state, "visible_answer", visible_answer)
+    bot = StubChatbot("interrupted", prefill_delay=0, token_delay=0.01, tokens=100)
+    with pytest.raises(Rerun):
+        app_state.stream_bot_answer(bot, None, "question")
+    assert streams[0].closed.wait(1)
+    assert scheduler.stats()["stub"]["in_flight"] == 0
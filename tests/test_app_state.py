@@ -0,0 +1,56 @@
+import io
+import os
+
+import pytest
+
+pytest.importorskip("chatbot_rag")
+pytest.importorskip("faiss")
+pytest.importorskip("streamlit")
+
+from services import app_state
+from services.index_cache import IndexCache
+from services.indexing import INGEST_STAGES
+from services.jobs import JobQueue
+from services.telemetry import Tracer
+from services.uploads import BlobStore
+from services.workspaces import WorkspaceStore
+
+
+def uploads(directory):
+    files = []
+    for path in sorted(directory.iterdir()):
+        upload = io.BytesIO(path.read_bytes())
+        upload.name = path.name
+        files.append(upload)
+    return files
+
+
+def test_ingest_job_writes_the_uploads_and_indexes_them(
+    embeddings, documents, tmp_path
+):
+    workspace = WorkspaceStore(root=str(tmp_path / "workspaces")).open("session")
+    # Removed from the uploader since the last ingestion
+    with open(os.path.join(workspace.data, "stale.pdf"), "wb") as f:
+        f.write(b"old")
+    store = BlobStore(root=str(tmp_path / "blobs"))
+    job = JobQueue(workers=1).submit(
+        app_state.ingest,
+        workspace,
+        store,
+        uploads(documents),
+        "default",
+        {},
+        None,
+        None,
+        IndexCache(root=str(tmp_path / "cache")),
+        Tracer(),
+        {},
+        stages=INGEST_STAGES,
+    )
+    assert job.wait(60)
+    assert job.status == "done", job.error
+    try:
+        assert sorted(os.listdir(workspace.data)) == sorted(os.listdir(documents))
+        assert job.result.value.rag.path == workspace.data
+    finally:
+        job.result.release()
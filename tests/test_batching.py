@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import HashingEmbeddings
+from services.batching import BatchingEmbeddings, SingleFlight
+
+
+def slow_tokens(calls, tokens=("a ", "b ", "c ")):
+    calls.append(1)
+    for token in tokens:
+        time.sleep(0.02)
+        yield token
+
+
+def test_identical_generations_are_coalesced():
+    flights = SingleFlight()
+    calls = []
+    with ThreadPoolExecutor(4) as executor:
+        answers = list(
+            executor.map(
+                lambda _: "".join(flights.stream("key", lambda: slow_tokens(calls))),
+                range(4),
+            )
+        )
+    assert len(calls) == 1
+    assert answers == ["a b c "] * 4
+    assert flights.stats()["joined"] == 3
+
+
+def test_different_generations_are_not_coalesced():
+    flights = SingleFlight()
+    calls = []
+    "".join(flights.stream("one", lambda: slow_tokens(calls)))
+    "".join(flights.stream("two", lambda: slow_tokens(calls)))
+    assert len(calls) == 2
+
+
+def test_finished_generation_expires_after_the_window():
+    flights = SingleFlight(window=0.05)
+    calls = []
+    "".join(flights.stream("key", lambda: slow_tokens(calls)))
+    "".join(flights.stream("key", lambda: slow_tokens(calls)))
+    assert len(calls) == 1
+    time.sleep(0.1)
+    "".join(flights.stream("key", lambda: slow_tokens(calls)))
+    assert len(calls) == 2
+
+
+def test_concurrent_queries_are_embedded_in_batches():
+    model = HashingEmbeddings()
+    embeddings = BatchingEmbeddings(model, window=0.05)
+    texts = [f"question number {i}" for i in range(16)]
+    barrier = threading.Barrier(len(texts))
+
+    def embed(text):
+        barrier.wait()
+        return embeddings.embed_query(text)
+
+    with ThreadPoolExecutor(len(texts)) as executor:
+        vectors = list(executor.map(embed, texts))
+    assert vectors == model.embed_documents(texts)
+    assert embeddings.queries == len(texts)
+    assert embeddings.batches < len(texts)
@@ -0,0 +1,42 @@
+from benchmarks.synthetic import StubChatbot
+from services.context import ContextPacker, RollingSummary, estimate_tokens
+from services.history import Message
+
+CONVERSATION = [
+    Message("user", "What is the capital of France?"),
+    Message("assistant", "Paris."),
+]
+
+
+def test_without_documents_the_conversation_goes_with_the_question():
+    packer = ContextPacker()
+    context, question = packer.pack(StubChatbot(), "And of Spain?", [], CONVERSATION)
+    # A context would make the chatbot answer from it alone
+    assert context is None
+    assert "User: What is the capital of France?" in question
+    assert question.endswith("Question: And of Spain?")
+    assert packer.pack(StubChatbot(), "Hello", []) == (None, "Hello")
+
+
+def test_documents_and_conversation_share_the_context():
+    packer = ContextPacker()
+    context, question = packer.pack(
+        StubChatbot(), "And of Spain?", ["Madrid is the capital."], CONVERSATION
+    )
+    assert question == "And of Spain?"
+    assert context.startswith("Conversation so far:\nUser: What is the capital")
+    assert context.endswith("Documents:\nMadrid is the capital.")
+
+
+def test_chunks_and_history_fit_the_budget():
+    packer = ContextPacker(context_tokens={"stub": 1024}, answer_tokens=256)
+    chunks = [
+        f"Chunk {i}: " + " ".join(f"w{i}x{j}" for j in range(150)) for i in range(8)
+    ]
+    messages = [Message("user", f"Turn {i} " + "word " * 40) for i in range(20)]
+    summary = RollingSummary()
+    context, _ = packer.pack(StubChatbot(), "question", chunks, messages, summary)
+    assert estimate_tokens(context) <= packer.budget(StubChatbot(), "question")
+    assert "Chunk 0" in context and "Turn 19" in context
+    # The oldest turns did not fit and were summarized
+    assert summary.lines
@@ -0,0 +1,71 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from services.conversations import ConversationStore
+from services.history import ChatHistory
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ConversationStore(
+        path=str(tmp_path / "conversations.db"),
+        archive_dir=str(tmp_path / "archive"),
+        flush_interval=0.01,
+    )
+
+
+def test_conversation_is_resumed(store):
+    history = ChatHistory(store=store, conversation="c1")
+    for i in range(30):
+        history.append("user" if i % 2 == 0 else "assistant", f"message {i}")
+    resumed = ChatHistory(store=store, conversation="c1", max_cached=10)
+    assert len(resumed) == 30
+    assert [m.content for m in resumed.recent(25)] == [
+        f"message {i}" for i in range(5, 30)
+    ]
+
+
+def test_sessions_sharing_a_conversation_keep_every_message(store):
+    first = ChatHistory(store=store, conversation="shared")
+    second = ChatHistory(store=store, conversation="shared")
+    # Both sessions count from zero: positions are the store's
+    first.append("user", "from the first session")
+    second.append("user", "from the second session")
+    store.flush()
+    assert store.count("shared") == 2
+    contents = [content for _, _, content, _ in store.page("shared", 2, 10)]
+    assert contents == ["from the first session", "from the second session"]
+    assert store.stats()["messages"] == 2
+
+
+def test_message_counts_add_up_across_batches(store):
+    history = ChatHistory(store=store, conversation="c1")
+    for i in range(3):
+        history.append("user", f"question {i}")
+        store.flush()
+    assert store.stats()["batches"] == 3
+    assert store.stats()["messages"] == 3
+
+
+def test_idle_conversations_are_archived(store, tmp_path):
+    ChatHistory(store=store, conversation="old").append("user", "hello")
+    store.flush()
+    store.retention = -1
+    assert store.archive() == 1
+    assert store.count("old") == 0
+    [name] = os.listdir(tmp_path / "archive")
+    with gzip.open(tmp_path / "archive" / name, "rt") as f:
+        record = json.loads(f.readline())
+    assert record["id"] == "old"
+    assert [m["content"] for m in record["messages"]] == ["hello"]
+
+
+def test_failed_write_is_logged(store, caplog):
+    with store._reader:
+        store._reader.execute("DROP TABLE messages")
+    store.append("c1", "user", "lost")
+    store.flush()
+    assert "1 chat messages not saved" in caplog.text
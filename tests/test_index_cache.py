@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+
+from services.index_cache import IndexCache, file_digest
+
+
+def test_key_follows_content_and_config():
+    key = IndexCache.key("digest", {"chunks_size": 512, "chunk_overlap": 100})
+    same = IndexCache.key("digest", {"chunk_overlap": 100, "chunks_size": 512})
+    assert key == same
+    assert key != IndexCache.key("digest", {"chunks_size": 256, "chunk_overlap": 100})
+    assert key != IndexCache.key("other", {"chunks_size": 512, "chunk_overlap": 100})
+
+
+def test_file_digest_reads_the_content(tmp_path):
+    first, second = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    first.write_bytes(b"same bytes")
+    second.write_bytes(b"same bytes")
+    assert file_digest(str(first)) == file_digest(str(second))
+    second.write_bytes(b"other bytes")
+    assert file_digest(str(first)) != file_digest(str(second))
+
+
+def test_each_key_is_built_once(tmp_path):
+    cache = IndexCache(root=str(tmp_path))
+    key = cache.key("digest", {})
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)
+        return b"data"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_build(key, build)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [b"data"] * 4
+    assert len(builds) == 1
+    # Another instance on the same directory reads the entry from disk
+    assert IndexCache(root=str(tmp_path)).get(key) == b"data"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = IndexCache(root=str(tmp_path), max_bytes=250)
+    for i, key in enumerate(("old", "used", "new")):
+        cache.put(key, b"x" * 100)
+        os.utime(cache._path(key), (i, i))
+    cache.get("used")
+    cache.evict()
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    assert cache.size() <= 250
@@ -0,0 +1,115 @@
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("chatbot_rag")
+pytest.importorskip("faiss")
+pymupdf = pytest.importorskip("pymupdf")
+
+from benchmarks.synthetic import HashingEmbeddings, make_pdfs
+from services.index_cache import IndexCache
+from services.indexing import document_set_key, load_shared_index
+from services.vector_store import VectorStoreCache
+
+
+def search(index, text, k=4):
+    vector = HashingEmbeddings().embed_query(text)
+    with index.in_use():
+        ids = index.search_ids(vector, k)
+        return ids, index.texts(ids)
+
+
+def test_sync_adds_and_removes_files(make_index, documents):
+    index = make_index(documents)
+    added, removed = index.sync()
+    assert len(added) == 3 and removed == []
+    assert index.sync() == ([], [])
+
+    victim = sorted(documents.iterdir())[0]
+    digest = index.files[str(victim)][1]
+    victim_ids = set(index.ids[digest])
+    ids, _ = search(index, "anything at all", k=100)
+    assert victim_ids & set(ids)
+    victim.unlink()
+    added, removed = index.sync()
+    assert added == [] and removed == [str(victim)]
+    assert digest not in index.ids
+    ids, _ = search(index, "anything at all", k=100)
+    assert ids and not victim_ids & set(ids)
+
+
+def test_changed_file_is_indexed_again(make_index, documents):
+    index = make_index(documents)
+    index.sync()
+    version = index.version
+    make_pdfs(str(documents), files=1, pages=1, seed=9)
+    added, removed = index.sync()
+    assert len(added) == 1 and removed == []
+    assert index.version != version
+
+
+def test_compaction_keeps_the_search_results(make_index, documents, tmp_path):
+    index = make_index(documents, ann={"nlist": 4, "m": 8})
+    index.sync()
+    _, before = search(index, "the first question")
+    index.compact(VectorStoreCache(root=str(tmp_path / "vectors")))
+    assert index.store is not None and index.rag.db is None
+    _, after = search(index, "the first question")
+    assert after == before
+
+    # Updates go back to an in-memory store
+    make_pdfs(str(documents), files=4, pages=1, seed=7)
+    added, _ = index.sync()
+    assert added and index.store is None
+    assert search(index, "the first question")[0]
+
+
+def test_compaction_keeps_the_stores_within_their_size(make_index, documents, tmp_path):
+    stores = VectorStoreCache(root=str(tmp_path / "vectors"), max_bytes=0)
+    index = make_index(documents)
+    index.sync()
+    index.compact(stores)
+    first = index.store.directory
+    make_pdfs(str(documents), files=4, pages=1, seed=7)
+    index.sync()
+    index.compact(stores)
+    # The store in use is kept, the previous one is deleted
+    assert os.path.exists(index.store.directory)
+    assert not os.path.exists(first)
+
+
+def test_pdf_without_text_is_indexed_empty(make_index, documents, caplog):
+    blank = pymupdf.open()
+    blank.new_page()
+    blank.save(str(documents / "blank.pdf"))
+    index = make_index(documents)
+    added, _ = index.sync()
+    assert str(documents / "blank.pdf") in added
+    assert search(index, "anything")[0]
+    assert "No text found in blank.pdf" in caplog.text
+
+
+def test_document_set_key_follows_the_contents(documents, tmp_path):
+    key = document_set_key(str(documents), "default", {})
+    copy = tmp_path / "copy"
+    shutil.copytree(documents, copy)
+    # Same contents elsewhere share the index
+    assert document_set_key(str(copy), "default", {}) == key
+    assert document_set_key(str(copy), "default", {"extract_images": True}) != key
+    assert document_set_key(str(copy), "default", {}, ann={"nlist": 4}) != key
+    make_pdfs(str(copy), files=1, pages=1, seed=3)
+    assert document_set_key(str(copy), "default", {}) != key
+
+
+def test_sessions_share_an_index(embeddings, documents, tmp_path):
+    cache = IndexCache(root=str(tmp_path / "cache"))
+    stores = VectorStoreCache(root=str(tmp_path / "vectors"))
+    first = load_shared_index(str(documents), "default", {}, cache, stores=stores)
+    second = load_shared_index(str(documents), "default", {}, cache, stores=stores)
+    try:
+        assert second.value is first.value
+        assert os.listdir(tmp_path / "vectors")
+    finally:
+        first.release()
+        second.release()
@@ -0,0 +1,43 @@
+from services.memory import MemoryBudget
+
+
+class FakeIndex:
+    def __init__(self, budget, last_used, size=100):
+        self.budget = budget
+        self.last_used = last_used
+        self.size = size
+        self.loaded = True
+        self.lock_held = None
+
+    def memory_bytes(self):
+        return self.size if self.loaded else 0
+
+    def unload(self, directory):
+        self.lock_held = self.budget._lock.locked()
+        self.loaded = False
+        return True
+
+
+def test_least_recently_used_indexes_are_evicted(tmp_path):
+    budget = MemoryBudget(250, spill_dir=str(tmp_path))
+    indexes = [FakeIndex(budget, last_used) for last_used in (3, 1, 2)]
+    for index in indexes:
+        budget.register(index)
+    assert [index.loaded for index in indexes] == [True, False, True]
+    assert budget.stats()["evictions"] == 1
+
+
+def test_the_index_in_use_is_kept(tmp_path):
+    budget = MemoryBudget(50, spill_dir=str(tmp_path))
+    old, new = FakeIndex(budget, 1), FakeIndex(budget, 2)
+    budget.register(new)
+    budget.register(old)
+    assert old.loaded and not new.loaded
+
+
+def test_indexes_are_unloaded_outside_the_lock(tmp_path):
+    budget = MemoryBudget(50, spill_dir=str(tmp_path))
+    first, second = FakeIndex(budget, 1), FakeIndex(budget, 2)
+    budget.register(first)
+    budget.register(second)
+    assert first.lock_held is False
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("chatbot_rag")
+pytest.importorskip("pymupdf")
+
+from benchmarks.synthetic import make_pdfs
+from services import parallel_preprocessing
+from services.indexing import document_set_key
+from services.parallel_preprocessing import ParallelPyMuPDFPreprocessing
+
+
+def extract(path, **kwargs):
+    preprocessing = ParallelPyMuPDFPreprocessing(
+        str(path), extract_images=False, extract_tables=False, **kwargs
+    )
+    return preprocessing._extract_text_from_pdf()
+
+
+def test_parallel_parse_matches_serial_and_reuses_workers(tmp_path):
+    make_pdfs(str(tmp_path / "large"), files=1, pages=20, words_per_page=60)
+    make_pdfs(str(tmp_path / "medium"), files=1, pages=17, words_per_page=60)
+    serial = extract(tmp_path / "large", workers=1)
+    assert extract(tmp_path / "large", workers=2, pages_per_task=4) == serial
+    pool = parallel_preprocessing._pool
+    # Another number of tasks goes to the same processes
+    extract(tmp_path / "medium", workers=2, pages_per_task=8)
+    assert parallel_preprocessing._pool is pool
+
+
+def test_small_documents_are_parsed_serially(tmp_path, monkeypatch):
+    make_pdfs(str(tmp_path), files=1, pages=3, words_per_page=60)
+    monkeypatch.setattr(parallel_preprocessing, "_get_process_pool", None)
+    assert extract(tmp_path, workers=4, pages_per_task=1)
+
+
+def test_worker_settings_do_not_change_the_document_set(tmp_path):
+    make_pdfs(str(tmp_path), files=1, pages=1)
+    key = document_set_key(str(tmp_path), "PyMuPDFPreprocessing", {})
+    settings = {"workers": 8, "pages_per_task": 2, "min_parallel_pages": 4}
+    assert document_set_key(str(tmp_path), "PyMuPDFPreprocessing", settings) == key
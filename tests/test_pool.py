@@ -0,0 +1,70 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from services.pool import ResourcePool
+
+
+class Resource:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_one_object_per_key():
+    pool = ResourcePool()
+    builds = []
+
+    def factory():
+        builds.append(1)
+        time.sleep(0.05)
+        return Resource()
+
+    leases = []
+    threads = [
+        threading.Thread(target=lambda: leases.append(pool.lease("key", factory)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert len({id(lease.value) for lease in leases}) == 1
+    assert pool.stats()[0]["refs"] == 4
+    assert pool.lease("other", Resource).value is not leases[0].value
+
+
+def test_idle_objects_are_evicted_and_closed():
+    pool = ResourcePool(idle_timeout=0)
+    lease = pool.lease("key", Resource)
+    resource = lease.value
+    pool.evict_idle()
+    assert pool.peek("key") is resource
+    lease.release()
+    pool.evict_idle()
+    assert pool.peek("key") is None
+    assert resource.closed
+
+
+def test_collected_lease_is_released():
+    pool = ResourcePool()
+    pool.lease("key", Resource)
+    gc.collect()
+    assert pool.stats()[0]["refs"] == 0
+
+
+def test_failed_build_is_not_cached():
+    pool = ResourcePool()
+
+    def fail():
+        raise RuntimeError("no model")
+
+    with pytest.raises(RuntimeError):
+        pool.lease("key", fail)
+    assert pool.stats() == []
+    assert pool.lease("key", Resource).value is not None
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("chatbot_rag")
+pytest.importorskip("faiss")
+
+from benchmarks.synthetic import make_pdfs
+from services.retrieval_cache import RetrievalCache
+
+
+def test_search_results_are_cached_per_index_version(make_index, documents):
+    index = make_index(documents)
+    index.sync()
+    cache = RetrievalCache()
+    first = cache.search_chunks(index, "the first question")
+    assert first
+    assert cache.search_chunks(index, "the first question") == first
+    assert cache.stats()["search"]["hits"] == 1
+
+    make_pdfs(str(documents), files=4, pages=1, seed=7)
+    index.sync()
+    cache.search_chunks(index, "the first question")
+    assert cache.stats()["search"]["misses"] == 2
+    # The query embedding does not depend on the documents
+    assert cache.stats()["embedding"]["hits"] == 1
+
+
+def test_options_are_part_of_the_key(make_index, documents):
+    index = make_index(documents)
+    index.sync()
+    cache = RetrievalCache()
+    cache.search_chunks(index, "question", k=3)
+    cache.search_chunks(index, "question", k=4)
+    cache.search_chunks(index, "question", k=3, hybrid=False)
+    assert cache.stats()["search"]["misses"] == 3
+
+
+def test_results_are_bounded(make_index, documents):
+    index = make_index(documents)
+    index.sync()
+    cache = RetrievalCache(max_results=2)
+    for i in range(5):
+        cache.search_chunks(index, f"question {i}")
+    assert len(cache._results) == 2
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from benchmarks.synthetic import StubChatbot
+from services.scheduler import BotScheduler, Overloaded, backend_key
+
+
+class CountingChatbot(StubChatbot):
+    """StubChatbot recording its calls and how many ran at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def stream(self, context, question):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            yield from super().stream(context, question)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def test_generate_returns_the_whole_answer():
+    bot = StubChatbot(prefill_delay=0, token_delay=0, tokens=4)
+    scheduler = BotScheduler()
+    answer = scheduler.generate(bot, "context", "question")
+    assert answer == bot("context", "question")
+    stats = scheduler.stats()[backend_key(bot)]
+    assert stats["completed"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_concurrency_is_limited_per_backend():
+    bot = CountingChatbot(prefill_delay=0.02, tokens=4)
+    scheduler = BotScheduler(limits={backend_key(bot): 2})
+    threads = [
+        threading.Thread(target=scheduler.generate, args=(bot, "", f"q{i}"))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert bot.calls == 6
+    assert bot.peak == 2
+
+
+def test_full_queue_is_rejected():
+    bot = StubChatbot(prefill_delay=0.3, tokens=1)
+    scheduler = BotScheduler(default_limit=1, max_queue=0)
+    stream = scheduler.open_stream(bot, "", "first")
+    with pytest.raises(Overloaded):
+        scheduler.open_stream(bot, "", "second")
+    stream.cancel()
+    assert scheduler.stats()[backend_key(bot)]["rejected"] == 1
+
+
+def test_timeout_in_prefill_is_not_retried():
+    # The generation still holds its slot; a retry would run next to it
+    bot = CountingChatbot(prefill_delay=0.5, tokens=1)
+    scheduler = BotScheduler(first_token_timeout=0.05, retries=1, backoff=0.01)
+    with pytest.raises(TimeoutError):
+        scheduler.generate(bot, "", "question")
+    assert bot.calls == 1
+    stats = scheduler.stats()[backend_key(bot)]
+    assert stats["timeouts"] == 1
+    assert stats["retries"] == 0
+
+
+def test_timeout_between_tokens_is_retried():
+    bot = CountingChatbot(prefill_delay=0, token_delay=0.2, tokens=3)
+    scheduler = BotScheduler(first_token_timeout=0.05, retries=1)
+    # Long enough for the cancelled call to stop at its next token
+    scheduler._delay = lambda attempt: 0.5
+    with pytest.raises(TimeoutError):
+        scheduler.generate(bot, "", "question")
+    assert bot.calls == 2
+
+
+def test_limits_apply_to_every_server_of_a_kind():
+    class OllamaChatbot:
+        def __init__(self, host):
+            self.host = host
+
+    scheduler = BotScheduler(limits={"ollama": 3}, default_limit=1)
+    for host in ("http://a:11434", "http://b:11434"):
+        bot = OllamaChatbot(host)
+        assert backend_key(bot) == f"ollama:{host}"
+        assert scheduler._backend(bot).limit == 3
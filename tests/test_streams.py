@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from services.streams import TokenStream, visible_answer
+
+
+def tokens(delays, closed=None):
+    try:
+        for i, delay in enumerate(delays):
+            time.sleep(delay)
+            yield f"t{i} "
+    finally:
+        if closed is not None:
+            closed.set()
+
+
+def test_tokens_arrive_in_order_and_are_timed():
+    stream = TokenStream(tokens([0.05, 0.01, 0.01]))
+    assert list(stream) == ["t0 ", "t1 ", "t2 "]
+    assert stream.text == "t0 t1 t2 "
+    assert 0.04 <= stream.first_token_time <= stream.total_time
+
+
+def test_slow_first_token_times_out():
+    stream = TokenStream(tokens([0.5]), timeout=0.05)
+    with pytest.raises(TimeoutError):
+        list(stream)
+
+
+def test_whole_answer_is_bounded_by_max_time():
+    # Every token is in time, the answer as a whole is not
+    stream = TokenStream(tokens([0.04] * 10), timeout=1, max_time=0.15)
+    received = []
+    with pytest.raises(TimeoutError):
+        for token in stream:
+            received.append(token)
+    assert 0 < len(received) < 10
+
+
+def test_cancel_closes_the_backend_between_tokens():
+    closed = threading.Event()
+    released = []
+    stream = TokenStream(
+        tokens([0.01] * 100, closed), on_close=lambda: released.append(1)
+    )
+    for _ in stream:
+        stream.cancel()
+        break
+    assert stream.closed.wait(1)
+    assert closed.is_set()
+    assert released == [1]
+
+
+def test_cancel_before_start_still_releases():
+    released = []
+    stream = TokenStream(tokens([0.01]), on_close=lambda: released.append(1))
+    stream.cancel()
+    assert released == [1] and stream.closed.is_set()
+
+
+def test_backend_error_is_raised_and_releases():
+    def failing():
+        yield "partial "
+        raise ConnectionError("backend went away")
+
+    released = []
+    stream = TokenStream(failing(), on_close=lambda: released.append(1))
+    with pytest.raises(ConnectionError):
+        list(stream)
+    assert stream.closed.wait(1)
+    assert released == [1]
+
+
+def test_think_block_is_hidden():
+    assert visible_answer("<think>still reasoning") == ""
+    assert visible_answer("  <think>done</think>\n\nThe answer.") == "The answer."
+    assert visible_answer("A plain answer.") == "A plain answer."
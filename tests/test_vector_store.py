@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from services.vector_store import (
+    MappedVectorStore,
+    VectorStoreCache,
+    write_vector_store,
+)
+
+
+def write(directory, dtype, count=50):
+    vectors = np.random.default_rng(0).normal(size=(count, 16))
+    ids = [f"id{i}" for i in range(count)]
+    write_vector_store(
+        directory, ids, vectors, [f"chunk {i}" for i in ids], dtype=dtype
+    )
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_search_matches_the_exact_search(tmp_path, dtype):
+    write(str(tmp_path / "store"), dtype)
+    store = MappedVectorStore(str(tmp_path / "store"))
+    query = store.vectors([7])[0] + 0.01
+    exact = np.argsort(((store.vectors() - query) ** 2).sum(1))[:5]
+    assert list(store.search_rows(query, k=5)) == list(exact)
+    assert store.search(query, k=1) == ["id7"]
+    assert store.texts(["id7", "id3"]) == ["chunk id7", "chunk id3"]
+    store.close()
+
+
+def open_stores(stores, count):
+    names = []
+    for i in range(count):
+        store = stores.open(("documents", i), write)
+        names.append(os.path.basename(store.directory))
+        os.utime(store.directory, (i, i))
+        store.close()
+    return names
+
+
+def test_prune_deletes_the_idle_stores(tmp_path):
+    stores = VectorStoreCache(root=str(tmp_path), max_idle=3600)
+    old, recent = open_stores(stores, 2)
+    os.utime(os.path.join(str(tmp_path), recent))
+    stores.prune()
+    assert not os.path.exists(os.path.join(str(tmp_path), old))
+    assert os.path.exists(os.path.join(str(tmp_path), recent))
+
+
+def test_prune_keeps_the_stores_within_their_size(tmp_path):
+    stores = VectorStoreCache(root=str(tmp_path))
+    names = open_stores(stores, 4)
+    # Room for two stores; the oldest is kept anyway
+    stores.max_bytes = stores.size() // 2
+    stores.max_idle = float("inf")
+    stores.prune(keep=names[0])
+    left = sorted(name for name in names if os.path.exists(tmp_path / name))
+    assert left == sorted([names[0], names[3]])
+    assert stores.size() <= stores.max_bytes